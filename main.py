@@ -56,6 +56,10 @@ def get_args():
     parser.add_argument('--keepfiles', '-k', action='store_true',
             default=False,
             help='Keep temporary generated bison and lex files.')
+    parser.add_argument('--pratt', '-p', action='store_true',
+            default=False,
+            help='Use the pure-Python parser engine instead of the generated' \
+                 ' bison parser.')
     parser.add_argument('--batch', '-b', action='store_true', default=False,
             help='Disable interactive mode and execute expressions in batch' \
                  ' mode.')
@@ -85,7 +89,8 @@ def main():
 
     p = Parser(verbose=args.verbose,
                keepfiles=args.keepfiles,
-               interactive=interactive)
+               interactive=interactive,
+               pratt=args.pratt)
 
     node = p.run(debug=args.debug)
 
@@ -53,7 +53,7 @@ class Step(RequestHandler):
             last_line = get_last_line(self)
 
             if last_line:
-                parser = ParserWrapper(Parser)
+                parser = ParserWrapper(Parser, memoize=True)
                 response = parser.run([last_line])
 
                 if response:
@@ -76,7 +76,8 @@ class Answer(RequestHandler):
             last_line = get_last_line(self)
 
             if last_line:
-                parser = ParserWrapper(Parser)
+                parser = ParserWrapper(Parser, incremental=True, memoize=True,
+                                       persistent=True)
                 response = parser.run([last_line])
 
                 if response:
@@ -104,7 +105,7 @@ class Hint(RequestHandler):
             if last_line:
                 parser = ParserWrapper(Parser)
                 response = parser.run([last_line])
-                response = parser.parser.give_hint()
+                response = parser.parser.give_hint(lazy=True)
 
                 if response:
                     self.write({'hint': str(response)})
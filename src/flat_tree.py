@@ -0,0 +1,194 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Flat representation of expression trees for very large expressions. The nodes
+of a tree are numbered in preorder and stored in parallel arrays, which can be
+traversed without recursion. For example, the expression `2x + -3` is stored
+as:
+
+    index     0          1          2          3          4
+    types     OPERATOR   OPERATOR   INTEGER    IDENTIFIER INTEGER
+    ops       OP_ADD     OP_MUL     0          0          0
+    values    None       None       2          'x'        3
+    negated   0          0          0          0          1
+    parents   -1         0          1          1          0
+    sizes     5          3          1          1          1
+
+The children of node i are children[offsets[i]:offsets[i + 1]].
+"""
+from array import array
+
+from node import ExpressionNode, ExpressionLeaf, TYPE_OPERATOR
+
+
+class FlatTree(object):
+    """
+    Struct-of-arrays representation of an expression tree, see the module
+    documentation. The expression nodes that the tree was created from are
+    kept in the sources list, so that the strategy can use the tree as an
+    iterative index of an ExpressionNode tree.
+    """
+
+    def __init__(self):
+        self.types = array('b')
+        self.ops = array('b')
+        self.values = []
+        self.negated = array('i')
+        self.parents = array('i')
+        self.positions = array('i')
+        self.sizes = array('i')
+        self.offsets = array('i')
+        self.children = array('i')
+        self.sources = []
+
+    def __len__(self):
+        return len(self.types)
+
+    def __repr__(self):
+        return '<FlatTree size=%d>' % len(self)
+
+    @classmethod
+    def from_node(cls, root):
+        """
+        Create a flat tree from an expression node.
+        """
+        tree = cls()
+        stack = [(root, -1)]
+
+        while stack:
+            node, parent = stack.pop()
+            i = len(tree.sources)
+
+            tree.sources.append(node)
+            tree.negated.append(node.negated)
+            tree.parents.append(parent)
+            tree.types.append(node.type)
+
+            if node.is_leaf:
+                tree.ops.append(0)
+                tree.values.append(node.value)
+            else:
+                tree.ops.append(node.op)
+                tree.values.append(None)
+                stack.extend([(child, i) for child in reversed(node.nodes)])
+
+        n = len(tree.sources)
+
+        # The subtree of node i consists of the nodes i to i + sizes[i], so the
+        # sizes can be accumulated in reverse preorder
+        tree.sizes = array('i', [1] * n)
+
+        for i in xrange(n - 1, 0, -1):
+            tree.sizes[tree.parents[i]] += tree.sizes[i]
+
+        # Preorder visits the children of a node from left to right, so the
+        # child lists are filled in the correct order
+        counts = [0] * n
+
+        for parent in tree.parents[1:]:
+            counts[parent] += 1
+
+        offsets = [0]
+
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+
+        tree.offsets = array('i', offsets)
+        tree.children = array('i', [0] * offsets[-1])
+        tree.positions = array('i', [0] * n)
+        filled = [0] * n
+
+        for i in xrange(1, n):
+            parent = tree.parents[i]
+            tree.children[offsets[parent] + filled[parent]] = i
+            tree.positions[i] = filled[parent]
+            filled[parent] += 1
+
+        return tree
+
+    def to_node(self, i=0):
+        """
+        Create an expression node of the subtree of node i. The nodes are
+        created in reverse preorder, so that the children of a node are
+        created before the node itself.
+        """
+        nodes = [None] * self.sizes[i]
+
+        for j in xrange(i + self.sizes[i] - 1, i - 1, -1):
+            if self.is_leaf(j):
+                node = ExpressionLeaf(self.values[j])
+            else:
+                node = ExpressionNode(self.ops[j], *[nodes[c - i]
+                                      for c in self.child_indices(j)])
+
+            node.negated = self.negated[j]
+            nodes[j - i] = node
+
+        return nodes[0]
+
+    def is_leaf(self, i):
+        return self.types[i] != TYPE_OPERATOR
+
+    def child_indices(self, i):
+        return self.children[self.offsets[i]:self.offsets[i + 1]]
+
+    def preorder(self, i=0):
+        """
+        Iterate over the indices of the subtree of node i in preorder.
+        """
+        return xrange(i, i + self.sizes[i])
+
+    def postorder(self, i=0):
+        """
+        Iterate over the indices of the subtree of node i in postorder, in
+        which the children of a node are visited from left to right before
+        the node itself.
+        """
+        stack = [(i, False)]
+
+        while stack:
+            j, visited = stack.pop()
+
+            if visited or self.is_leaf(j):
+                yield j
+            else:
+                stack.append((j, True))
+                stack.extend([(c, False)
+                              for c in reversed(self.child_indices(j))])
+
+    def path(self, i):
+        """
+        Find the sequence of child indices that leads from the root to node i
+        (see Possibility.path).
+        """
+        path = []
+
+        while i > 0:
+            path.append(self.positions[i])
+            i = self.parents[i]
+
+        return tuple(reversed(path))
+
+    def depth(self, i):
+        """
+        Find the number of ancestors of node i.
+        """
+        depth = 0
+
+        while i > 0:
+            depth += 1
+            i = self.parents[i]
+
+        return depth
@@ -0,0 +1,129 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Input buffer for the read methods of the parsers. The input is streamed line by
+line from a queue of sources, which are iterables of lines: lists, files (see
+file_lines) or standard input (see prompt_lines). Only the line that is being
+read is kept in memory, so the memory usage does not grow with the number of
+lines that a parser has read.
+"""
+import collections
+
+
+def file_lines(f):
+    """
+    Generate the lines of a file object, until the end of the file.
+    """
+    return iter(f.readline, '')
+
+
+def prompt_lines(prompt=''):
+    """
+    Generate the lines that are read from standard input using raw_input, until
+    the end of the input.
+    """
+    while True:
+        try:
+            yield raw_input(prompt)
+        except EOFError:
+            return
+
+
+class InputBuffer(object):
+    """
+    Cursor over the current line of a queue of line sources. Lines that do not
+    end with a newline are terminated by one. A read of a complete line returns
+    the line itself, and partial reads of a byte string line are sliced from a
+    memoryview of the line, so the line is never copied as a whole. Unicode
+    lines do not support the buffer interface, so they are sliced directly.
+    The line is released as soon as it has been read completely.
+    """
+
+    def __init__(self, *sources):
+        self.sources = collections.deque()
+        self.line = None
+        self.view = None
+        self.offset = 0
+
+        for source in sources:
+            self.append(source)
+
+    def append(self, source):
+        """
+        Add an iterable of lines to the end of the input. The lines are not
+        read from the source until they are needed.
+        """
+        self.sources.append(iter(source))
+
+    def clear(self):
+        self.sources.clear()
+        self.line = self.view = None
+        self.offset = 0
+
+    def next_line(self):
+        """
+        Move the cursor to the start of the next line of the sources. Returns
+        False if all sources are exhausted.
+        """
+        while self.sources:
+            line = next(self.sources[0], None)
+
+            if line is not None:
+                self.line = line if line.endswith('\n') else line + '\n'
+                self.view = None
+                self.offset = 0
+
+                return True
+
+            self.sources.popleft()
+
+        self.line = self.view = None
+
+        return False
+
+    def read(self, nbytes=None):
+        """
+        Read at most nbytes bytes (or the rest of the current line, if nbytes
+        is None) of the current line. Returns an empty string if all sources
+        are exhausted.
+        """
+        if self.line is None and not self.next_line():
+            return ''
+
+        end = len(self.line) if nbytes is None else self.offset + nbytes
+
+        if end >= len(self.line):
+            data = self.slice(self.offset, None) if self.offset else self.line
+
+            self.line = self.view = None
+
+            return data
+
+        data = self.slice(self.offset, end)
+        self.offset = end
+
+        return data
+
+    def slice(self, start, end):
+        """
+        Copy a part of the current line.
+        """
+        if isinstance(self.line, unicode):
+            return self.line[start:end]
+
+        if self.view is None:
+            self.view = memoryview(self.line)
+
+        return self.view[start:end].tobytes()
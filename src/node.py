@@ -17,11 +17,13 @@ import os.path
 import sys
 import copy
 import re
+import threading
+import weakref
+from collections import namedtuple
 
 sys.path.insert(0, os.path.realpath('external'))
 
 from graph_drawing.graph import generate_graph
-from graph_drawing.line import generate_line, preprocess_node
 from graph_drawing.node import Node, Leaf
 
 
@@ -45,7 +47,10 @@ OP_SUBSCRIPT = 8
 OP_AND = 9
 OP_OR = 10
 
-# Binary operators that are considered n-ary
+# Binary operators that are considered n-ary. A node of such an operator has
+# all operands of a sequence as children, e.g. a + b + c is a single addition
+# node with three children. An operand with the same operator is only nested
+# if it is grouped at the right side, as in a + (b + c), or negated.
 NARY_OPERATORS = [OP_ADD, OP_SUB, OP_MUL, OP_AND, OP_OR]
 
 # N-ary (functions)
@@ -90,6 +95,12 @@ SPECIAL_TOKENS = [PI, INFINITY]
 # Default base to use in parsing 'log(...)'
 DEFAULT_LOGARITHM_BASE = 10
 
+# Features of child nodes, see child_features(). The lower bits are used for
+# the operators of child nodes
+FEATURE_NUMERIC = 1 << 32
+FEATURE_IDENTIFIER = 1 << 33
+FEATURE_NEGATED = 1 << 34
+
 
 TYPE_MAP = {
         int: TYPE_INTEGER,
@@ -161,19 +172,337 @@ TOKEN_MAP = {
         }
 
 
+def clear_caches(node):
+    """
+    Clear the cached values of a single node, e.g. of a node or a copy of a
+    node that is modified. This is done automatically when the children or
+    the negation of a node are replaced (see cache_clearing_slot()), but not
+    when the list of children is modified in-place. Nodes do not refer to
+    their parent node, so the caches of the ancestors of a modified node are
+    cleared by the caller that knows them, see invalidate_path().
+    """
+    node.hash_cache = node.key_cache = node.attribute_cache = None
+
+    if not node.is_leaf:
+        node.line_cache = None
+
+
+def invalidate_subtree(node):
+    """
+    Clear the caches of all nodes in an expression, e.g. after an unknown part
+    of it has been modified in-place. Interned nodes are immutable, so their
+    caches and those of their subtrees are kept.
+    """
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+
+        if not isinstance(node, ExpressionBase) or node.interned:
+            continue
+
+        clear_caches(node)
+
+        if not node.is_leaf:
+            stack.extend(node.nodes)
+
+
+def invalidate_path(root, path):
+    """
+    Clear the caches of the nodes on a path (a sequence of child indices) from
+    the root node of an expression, i.e. of the ancestors of the node at the
+    end of the path and of that node itself.
+    """
+    node = root
+
+    for i in path:
+        clear_caches(node)
+        node = node[i]
+
+    clear_caches(node)
+
+
+# Synthesized attributes of a node, see ExpressionBase.attributes()
+NodeAttributes = namedtuple('NodeAttributes',
+                            'variables numeric size depth operators')
+
+# Operators of nodes that evaluate to a numeric value if all of their children
+# do, see ExpressionBase.attributes()
+NUMERIC_OPERATORS = [OP_ADD, OP_MUL, OP_DIV, OP_POW, OP_SQRT]
+
+
 def to_expression(obj):
     if isinstance(obj, ExpressionBase):
-        return obj.clone()
+        # Interned nodes are immutable, so they can be shared
+        return obj if obj.interned else obj.clone()
 
     return ExpressionLeaf(obj)
 
 
+def child_expression(child):
+    """
+    Expression of a child of a node, which is a leaf for raw values (e.g. the 2
+    in ExpressionNode(OP_SIN, 2)).
+    """
+    return child if isinstance(child, ExpressionBase) else ExpressionLeaf(child)
+
+
 def bounds_str(f, a, b):
-    left = str(ExpressionNode(OP_SUBSCRIPT, f, a, no_spacing=True))
-    return left + str(ExpressionNode(OP_POW, Leaf(1), b, no_spacing=True))[1:]
+    """
+    Print the bounds of an integral, e.g. int_a^b or [F(x)]_(a - b)^(a + b).
+    """
+    a, b = [str(n) if n.is_leaf else '(%s)' % n for n in (a, b)]
+
+    return '%s_%s^%s' % (f, a, b)
+
+
+def outdated_postorder(node, cache):
+    """
+    Iterate in postorder over the nodes of an expression whose cached value in
+    the specified cache attribute (see ExpressionNode.__slots__) is outdated.
+    The subtrees of nodes with an up-to-date cache are skipped. The traversal
+    is iterative, so that the caches of large expressions can be computed
+    without exceeding the recursion limit.
+    """
+    stack = [(node, False)]
+
+    while stack:
+        node, visited = stack.pop()
+
+        if visited:
+            yield node
+            continue
+
+        # Raw values (e.g. the 2 in ExpressionNode(OP_SIN, 2)) have no cache
+        if not isinstance(node, ExpressionBase):
+            continue
+
+        # Leaves have no line cache, see ExpressionNode.__str__()
+        if getattr(node, cache, None) is not None:
+            continue
+
+        stack.append((node, True))
+
+        if not node.is_leaf:
+            stack.extend([(child, False) for child in reversed(node.nodes)])
+
+
+# Precedences of the operators in a printed line, see generate_line(). Leaves,
+# functions and brackets are atoms, which are never put in parentheses
+LINE_PRECEDENCES = {
+        OP_COMMA: 0,
+        OP_EQ: 1,
+        OP_OR: 2,
+        OP_AND: 3,
+        OP_ADD: 4,
+        OP_SUB: 4,
+        OP_MUL: 6,
+        OP_DIV: 7,
+        OP_POW: 8,
+        OP_SUBSCRIPT: 9,
+        }
+UNARY_PRECEDENCE = 5
+ATOM_PRECEDENCE = 10
+
+# Operators that enclose their child in a pair of brackets, e.g. |x|
+BRACKET_OPERATORS = [OP_ABS, OP_PARENS, OP_BRACKETS, OP_CBRACKETS]
+
+
+def line_precedence(node):
+    """
+    Precedence of a node in a printed line. A negated node of an operator with
+    a lower precedence than a unary minus is printed in parentheses, so it is
+    an atom.
+    """
+    if not isinstance(node, ExpressionNode):
+        return ATOM_PRECEDENCE
+
+    if node.op in LINE_PRECEDENCES:
+        if node.negated and LINE_PRECEDENCES[node.op] < LINE_PRECEDENCES[OP_MUL]:
+            return ATOM_PRECEDENCE
+
+        return LINE_PRECEDENCES[node.op]
+
+    if node.arity() == 1 and node.op not in BRACKET_OPERATORS \
+            and node.op != OP_LOG and not node.is_postfix():
+        return UNARY_PRECEDENCE
+
+    return ATOM_PRECEDENCE
+
+
+def is_negative(node):
+    """
+    Check if the printed line of a node starts with a minus sign.
+    """
+    return bool(node.negated) or (node.is_leaf and node.is_numeric()
+                                  and node.value < 0)
+
+
+def multiplication_sign(left, right, l, r):
+    """
+    Operator between the printed factors l and r of a multiplication, which is
+    omitted when it is implied: 2x, 2(x + 1), (x + 1)x, ab. An identifier is
+    separated from a following power or function by a space: a b ^ 2.
+    """
+    if is_negative(right) or left.is_op(OP_DIV):
+        return ' * '
+
+    if l[-1] == ')':
+        return ''
+
+    if not (left.is_leaf or left.is_op(OP_MUL)) or r[0].isdigit():
+        return ' * '
+
+    if l[-1].isdigit() or r[0] in '([|':
+        return ''
+
+    if not l[-1].isalpha():
+        return ' * '
+
+    # Repeated identifiers keep their operator: x * x, x * x ^ 2
+    if re.search('[a-zA-Z]+$', l).group(0) == re.match('[a-zA-Z]+', r).group(0):
+        return ' * '
+
+    return '' if right.is_leaf and len(r) == 1 else ' '
+
+
+def child_line(child, parens):
+    line = str(child)
+
+    return '(' + line + ')' if parens else line
+
+
+def compose_line(node):
+    """
+    Print an operator node in a single line, from the cached lines of its
+    children (see ExpressionNode.__str__()). The negation of the node is not
+    included.
+    """
+    line = node.custom_line()
+
+    if line is not None:
+        return line
+
+    op = node.op
+
+    if op in LINE_PRECEDENCES:
+        pred = LINE_PRECEDENCES[op]
+        left = child_expression(node[0])
+        line = child_line(left, line_precedence(left) < pred
+                or (op in (OP_MUL, OP_DIV, OP_POW)
+                    and left.is_leaf and is_negative(left))
+                or (op == OP_POW and line_precedence(left) == pred))
+
+        for right in map(child_expression, node[1:]):
+            right_pred = line_precedence(right)
+
+            if op in (OP_ADD, OP_SUB) and is_negative(right):
+                # A negated term is subtracted: a - b, a - (b + c), a - -b
+                line += ' - ' + str(right)[1:]
+                left = right
+                continue
+
+            if op == OP_POW or op == OP_SUBSCRIPT:
+                parens = not right.is_leaf
+            elif op == OP_DIV:
+                parens = right_pred <= pred
+            else:
+                parens = right_pred < pred or (right_pred == pred
+                        and not is_negative(right) and op != OP_COMMA)
+
+            r = child_line(right, parens)
+
+            if op == OP_MUL:
+                line += multiplication_sign(left, right, line, r) + r
+            elif op == OP_COMMA:
+                line += ', ' + r
+            else:
+                line += ' %s %s' % (node.value, r)
+
+            # The left operand of the next factor is the product so far
+            left = node if op == OP_MUL else right
+
+        return line
+
+    if op in BRACKET_OPERATORS:
+        brackets = OP_VALUE_MAP[op]
+
+        return brackets[0] + str(child_expression(node[0])) + brackets[1]
+
+    if node.arity() == 1:
+        # Let the node wrap its child in brackets, on a copy of the node
+        wrapped = copy.copy(node)
+        wrapped.preprocess_str_exp()
+        child = child_expression(wrapped[0])
+        line = child_line(child,
+                          line_precedence(child) <= UNARY_PRECEDENCE)
+
+        if node.is_postfix():
+            line += node.operator()
+        elif line[0] == '(':
+            line = node.operator() + line
+        else:
+            line = node.operator() + ' ' + line
+
+        return node.postprocess_str(line)
+
+    return '%s(%s)' % (node.operator(),
+                       ', '.join([str(child_expression(child))
+                                  for child in node]))
+
+
+def generate_line(node):
+    """
+    Print an expression in a single line, in which parentheses are added where
+    needed.
+    """
+    if not isinstance(node, ExpressionNode):
+        return '-' * node.negated + str(node.value)
+
+    line = compose_line(node)
+
+    if node.negated and line_precedence(node) == ATOM_PRECEDENCE \
+            and node.op in LINE_PRECEDENCES:
+        line = '(' + line + ')'
+
+    return '-' * node.negated + line
+
+
+def graph_node(node):
+    """
+    Convert an expression to graph_drawing nodes, which are only used to draw
+    the expression as a tree (see ExpressionNode.graph()). Operator nodes are
+    titled with their operator.
+    """
+    stack = [(node, False)]
+    converted = []
+
+    while stack:
+        node, visited = stack.pop()
+        node = child_expression(node)
+
+        if node.is_leaf:
+            converted.append(Leaf(node.value, negated=node.negated))
+        elif visited:
+            i = len(converted) - len(node)
+            children = converted[i:]
+            del converted[i:]
+            converted.append(Node(node.operator(), *children,
+                                  negated=node.negated))
+        else:
+            stack.append((node, True))
+            stack.extend([(child, False) for child in reversed(node.nodes)])
+
+    return converted[0]
 
 
 class ExpressionBase(object):
+    # Interned nodes are referenced weakly by their InternTable
+    __slots__ = ('__weakref__',)
+
+    # Hash-consed nodes are created by InternTable
+    interned = False
+
     def __lt__(self, other):
         """
         Comparison between this expression{node,leaf} and another
@@ -228,6 +557,137 @@ class ExpressionBase(object):
     def clone(self):
         return copy.deepcopy(self)
 
+    def __copy__(self):
+        """
+        Create a shallow copy with its own list of the same child nodes. The
+        copy of an interned node is mutable.
+        """
+        cls = ExpressionLeaf if self.is_leaf else ExpressionNode
+        node = cls.__new__(cls)
+
+        # The caches are copied after the children, whose assignment clears
+        # them
+        for name in cls.__slots__:
+            value = getattr(self, name)
+            setattr(node, name, list(value) if name == 'nodes' else value)
+
+        node.intern_table = None
+
+        return node
+
+    def __deepcopy__(self, memo):
+        """
+        Deep copy the list of child nodes, and copy the other slots directly
+        since their values are immutable.
+        """
+        cls = self.__class__
+        node = cls.__new__(cls)
+        memo[id(self)] = node
+
+        # See __copy__()
+        for name in cls.__slots__:
+            value = getattr(self, name)
+
+            if name == 'nodes':
+                value = copy.deepcopy(value, memo)
+
+            setattr(node, name, value)
+
+        return node
+
+    def __neg__(self):
+        return self.negate()
+
+    def structure_hash(self):
+        """
+        Merkle hash of the structure of the node, which is equal for strictly
+        equal nodes. The hash is cached until the node or one of its
+        descendants is modified, see clear_caches().
+        """
+        if self.hash_cache is not None:
+            return self.hash_cache
+
+        for node in outdated_postorder(self, 'hash_cache'):
+            if node.is_leaf:
+                h = hash((node.type, node.value, node.negated))
+            else:
+                h = hash((TYPE_OPERATOR, node.op, node.negated)
+                         + tuple([child.hash_cache
+                                  if isinstance(child, ExpressionBase)
+                                  else hash((TYPE_MAP.get(type(child)), child, 0))
+                                  for child in node]))
+
+            node.hash_cache = h
+
+        return self.hash_cache
+
+    def canonical_key(self):
+        """
+        Canonical form of the node, excluding its own negation, which is equal
+        for non-strictly equal nodes (see equals()). The nodes in the scope of
+        an n-ary operator are sorted by their canonical form, so that the order
+        of the scope is irrelevant. The key is cached like structure_hash().
+        """
+        if self.key_cache is not None:
+            return self.key_cache
+
+        if self.is_leaf:
+            key = self.type, self.value
+        elif self.op in NARY_OPERATORS:
+            key = TYPE_OPERATOR, self.op, tuple(sorted(
+                    [(n.negated, n.canonical_key())
+                     for n in map(child_expression, get_scope(self))]))
+        else:
+            key = TYPE_OPERATOR, self.op, \
+                  tuple([(n.negated, n.canonical_key())
+                         for n in map(child_expression, self)])
+
+        self.key_cache = key
+
+        return key
+
+    def attributes(self):
+        """
+        Synthesized attributes of the node, which are computed bottom-up from
+        those of its children and cached like structure_hash():
+        - variables: frozenset of the names of the variables in the node.
+        - numeric: whether the node will eventually evaluate to a numeric
+          value, i.e. all leaves are numeric and all operators are in
+          NUMERIC_OPERATORS.
+        - size: the number of nodes.
+        - depth: the length of the longest path to a leaf (0 for a leaf).
+        - operators: bitmask of the operators in the node (see op_feature()).
+        """
+        if self.attribute_cache is not None:
+            return self.attribute_cache
+
+        for node in outdated_postorder(self, 'attribute_cache'):
+            if node.is_leaf:
+                variables = frozenset([node.value]) if node.is_variable() \
+                            else frozenset()
+                attributes = NodeAttributes(variables,
+                                            bool(node.is_numeric()), 1, 0, 0)
+            else:
+                children = [child.attribute_cache
+                            if isinstance(child, ExpressionBase)
+                            else child_expression(child).attributes()
+                            for child in node]
+                variables = frozenset().union(*[a.variables for a in children])
+                numeric = node.op in NUMERIC_OPERATORS \
+                          and all([a.numeric for a in children])
+                operators = 1 << node.op
+
+                for a in children:
+                    operators |= a.operators
+
+                attributes = NodeAttributes(variables, numeric,
+                        1 + sum([a.size for a in children]),
+                        1 + max([a.depth for a in children]), operators)
+
+            node.attribute_cache = attributes
+
+        return self.attribute_cache
+
     def is_op(self, *ops):
         return not self.is_leaf and (self.op in ops or
                 (self.op in (OP_DXDER, OP_PRIME) and OP_DER in ops))
@@ -296,23 +756,50 @@ class ExpressionBase(object):
         """
         Check if a node equal to the specified one exists within this node.
         """
+        if isinstance(node, ExpressionBase):
+            attributes = self.attributes()
+
+            # A variable can only be found by its leaf
+            if node.is_variable():
+                return (include_self or not self.is_leaf) \
+                       and node.value in attributes.variables
+
+            if not node.is_leaf \
+                    and (not attributes.operators & 1 << node.op
+                         or node.attributes().size > attributes.size):
+                return False
+
         if include_self and self.equals(node, ignore_negation=True):
             return True
 
-        if not self.is_leaf:
-            for child in self:
-                if child.contains(node, include_self=True):
-                    return True
+        stack = [] if self.is_leaf else list(self)
+
+        while stack:
+            child = stack.pop()
+
+            child = child_expression(child)
+
+            if child.equals(node, ignore_negation=True):
+                return True
+
+            if not child.is_leaf:
+                stack.extend(child)
 
         return False
 
 
-class ExpressionNode(Node, ExpressionBase):
+class ExpressionNode(ExpressionBase):
+    # All attributes are stored in slots, so nodes do not have an instance
+    # dictionary. The caches hold the values of structure_hash(),
+    # canonical_key(), attributes() and __str__(), or None if they are not
+    # computed yet.
+    __slots__ = ('nodes', 'value', 'negated', 'type', 'op', 'parens',
+                 'intern_table', 'hash_cache', 'key_cache', 'attribute_cache',
+                 'line_cache')
+    is_leaf = False
+
     def __init__(self, *args, **kwargs):
-        super(ExpressionNode, self).__init__(*args, **kwargs)
-        self.type = TYPE_OPERATOR
         op = args[0]
-        self.parens = False
 
         if isinstance(op, str):
             self.value = op
@@ -321,6 +808,27 @@ class ExpressionNode(Node, ExpressionBase):
             self.value = OP_VALUE_MAP[op]
             self.op = op
 
+        self.nodes = list(args[1:])
+        self.negated = kwargs.get('negated', 0)
+        self.type = TYPE_OPERATOR
+        self.parens = False
+        self.intern_table = None
+        self.hash_cache = self.key_cache = self.attribute_cache = None
+        self.line_cache = None
+
+        # The operands of a first operand with the same operator are operands
+        # of this node, like in the sequence (a + b) + c = a + b + c
+        if self.nodes and self.is_sequence(self.nodes[0]):
+            self.nodes[:1] = self.nodes[0].nodes
+
+    def is_sequence(self, child):
+        """
+        Check if a child node would continue the sequence of operands of this
+        n-ary node, if it were the first child.
+        """
+        return self.op in NARY_OPERATORS and isinstance(child, ExpressionNode) \
+               and child.op == self.op and not child.negated
+
     def arity(self):
         if self.op in UNARY_FUNCTIONS:
             return 1
@@ -358,15 +866,39 @@ class ExpressionNode(Node, ExpressionBase):
             return self.value + str(self[1])
 
         if self.op == OP_INT and len(self) == 4:
-            return bounds_str(Leaf('int'), self[2], self[3])
+            return bounds_str('int', self[2], self[3])
 
         return self.value
 
     def is_postfix(self):
         return self.op in (OP_PRIME, OP_INT_DEF)
 
+    def __getitem__(self, key):
+        return self.nodes[key]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __repr__(self):
+        return str(self)
+
     def __str__(self):  # pragma: nocover
-        return generate_line(self)
+        """
+        Print the node in a single line, see generate_line(). The line is
+        cached like structure_hash(), since the same unmodified expression is
+        usually printed several times (e.g. in the hint and in the step of a
+        rewrite). The line of a modified node is composed from the cached
+        lines of its unmodified children.
+        """
+        if self.line_cache is None:
+            for node in outdated_postorder(self, 'line_cache'):
+                if not node.is_leaf:
+                    node.line_cache = generate_line(node)
+
+        return self.line_cache
 
     def custom_line(self):
         if self.op == OP_INT_DEF:
@@ -387,16 +919,50 @@ class ExpressionNode(Node, ExpressionBase):
 
     def __eq__(self, other):
         """
-        Check strict equivalence.
+        Check strict equivalence. Nested operator nodes are compared using a
+        stack instead of recursion.
         """
-        return isinstance(other, ExpressionNode) and self.op == other.op \
-               and self.negated == other.negated and self.nodes == other.nodes
+        stack = [(self, other)]
+
+        while stack:
+            a, b = stack.pop()
+
+            if a is b:
+                continue
+
+            if a.interned and getattr(b, 'intern_table', None) \
+                    is a.intern_table:
+                return False
+
+            # The structural hashes are a fast negative filter, which prevents
+            # traversing unequal trees completely
+            if not isinstance(b, ExpressionNode) or a.op != b.op \
+                    or a.negated != b.negated or len(a.nodes) != len(b.nodes) \
+                    or a.structure_hash() != b.structure_hash():
+                return False
+
+            for x, y in zip(a.nodes, b.nodes):
+                if isinstance(x, ExpressionNode):
+                    stack.append((x, y))
+                elif not x == y:
+                    return False
+
+        return True
+
+    def __setitem__(self, key, value):
+        clear_caches(self)
+
+        # Keep the operands of a sequence in a single node, see __init__()
+        if key in (0, -len(self.nodes)) and self.is_sequence(value):
+            self.nodes[:1] = value.nodes
+        else:
+            self.nodes[key] = value
 
     def substitute(self, old_child, new_child):
-        self.nodes[self.nodes.index(old_child)] = new_child
+        self[self.nodes.index(old_child)] = new_child
 
     def graph(self):  # pragma: nocover
-        return generate_graph(preprocess_node(self))
+        return generate_graph(graph_node(self))
 
     def extract_polynome_properties(self):
         """
@@ -447,10 +1013,13 @@ class ExpressionNode(Node, ExpressionBase):
         #      ╭─┴╮
         #      r  e
         #
+        # The last factor is compared to the product of the other factors
+        factors = [nary_node(OP_MUL, self.nodes[:-1]), self[-1]]
+
         # rule: c * r ^ e | (r ^ e) * c
         for i, j in ((0, 1), (1, 0)):
-            if self[j].is_power():
-                return (self[i], self[j][0], self[j][1])
+            if factors[j].is_power():
+                return (factors[i], factors[j][0], factors[j][1])
 
         # Normalize c * r and r * c -> c * r. Otherwise, the tuple will not
         # match if the order of the expression is different. Example:
@@ -458,9 +1027,9 @@ class ExpressionNode(Node, ExpressionBase):
         # without normalization, those expressions will not match.
         #
         # rule: c * r | r * c
-        if self[0] < self[1]:
-            return (self[0], self[1], ExpressionLeaf(1))
-        return (self[1], self[0], ExpressionLeaf(1))
+        if factors[0] < factors[1]:
+            return (factors[0], factors[1], ExpressionLeaf(1))
+        return (factors[1], factors[0], ExpressionLeaf(1))
 
     def equals(self, other, ignore_negation=False):
         """
@@ -472,37 +1041,17 @@ class ExpressionNode(Node, ExpressionBase):
           Any difference in order of the scopes is irrelevant.
         - If both nodes are divisions, the nominator and denominator have to be
           non-strictly equal.
+        This is done by comparing the canonical keys of the nodes, in which the
+        scopes are sorted.
         """
+        if self is other:
+            return True
+
         if not isinstance(other, ExpressionNode) or other.op != self.op:
             return False
 
-        if self.op in NARY_OPERATORS:
-            s0 = Scope(self)
-            s1 = set(Scope(other))
-
-            # Scopes should be of equal size
-            if len(s0) != len(s1):
-                return False
-
-            # Each node in one scope should have an image node in the other
-            matched = set()
-
-            for n0 in s0:
-                found = False
-
-                for n1 in s1 - matched:
-                    if n0.equals(n1):
-                        found = True
-                        matched.add(n1)
-                        break
-
-                if not found:
-                    return False
-        else:
-            # Check if all children are non-strictly equal, preserving order
-            for i, child in enumerate(self):
-                if not child.equals(other[i]):
-                    return False
+        if self.canonical_key() != other.canonical_key():
+            return False
 
         if ignore_negation:
             return True
@@ -510,16 +1059,31 @@ class ExpressionNode(Node, ExpressionBase):
         return self.negated == other.negated
 
 
-class ExpressionLeaf(Leaf, ExpressionBase):
-    def __init__(self, *args, **kwargs):
-        super(ExpressionLeaf, self).__init__(*args, **kwargs)
-        self.type = TYPE_MAP[type(args[0])]
+class ExpressionLeaf(ExpressionBase):
+    # See ExpressionNode.__slots__
+    __slots__ = ('value', 'negated', 'type', 'parens', 'intern_table',
+                 'hash_cache', 'key_cache', 'attribute_cache')
+    is_leaf = True
+
+    def __init__(self, value, negated=0):
+        self.value = value
+        self.negated = negated
+        self.type = TYPE_MAP[type(value)]
         self.parens = False
+        self.intern_table = None
+        self.hash_cache = self.key_cache = self.attribute_cache = None
 
     def __eq__(self, other):
         """
         Check strict equivalence.
         """
+        if self is other:
+            return True
+
+        if self.interned and getattr(other, 'intern_table', None) \
+                is self.intern_table:
+            return False
+
         other_type = type(other)
 
         if other_type in TYPE_MAP:
@@ -529,6 +1093,9 @@ class ExpressionLeaf(Leaf, ExpressionBase):
         return self.negated == other.negated and self.type == other.type \
                and self.value == other.value
 
+    def __str__(self):
+        return generate_line(self)
+
     def __repr__(self):
         return str(self)
 
@@ -567,19 +1134,361 @@ class ExpressionLeaf(Leaf, ExpressionBase):
         return (1 - 2 * (self.negated & 1)) * self.value
 
 
+def cache_clearing_slot(cls, name):
+    """
+    Property that reads a slot of an expression class, and clears the caches
+    of the node when the slot is written.
+    """
+    slot = getattr(cls, name)
+
+    def write(node, value):
+        slot.__set__(node, value)
+        clear_caches(node)
+
+    return property(slot.__get__, write)
+
+
+ExpressionNode.nodes = cache_clearing_slot(ExpressionNode, 'nodes')
+ExpressionNode.negated = cache_clearing_slot(ExpressionNode, 'negated')
+ExpressionLeaf.negated = cache_clearing_slot(ExpressionLeaf, 'negated')
+
+
+def immutable_slot(cls, name):
+    """
+    Property that reads a slot of an expression class, and raises a
+    ValueError on writes, see InternedNode.
+    """
+    slot = getattr(cls, name)
+
+    def write(node, value):
+        raise ValueError('Interned node "%s" cannot be modified.' % node)
+
+    read = slot.fget if isinstance(slot, property) else slot.__get__
+
+    return property(read, write)
+
+
+class InternedNode(ExpressionNode):
+    """
+    Immutable operator node that is shared by all structurally identical
+    subtrees in an InternTable.
+    """
+    __slots__ = ()
+    interned = True
+    nodes = immutable_slot(ExpressionNode, 'nodes')
+    value = immutable_slot(ExpressionNode, 'value')
+    negated = immutable_slot(ExpressionNode, 'negated')
+
+    def __setitem__(self, key, value):
+        raise ValueError('Interned node "%s" cannot be modified.' % self)
+
+    def substitute(self, old_child, new_child):
+        raise ValueError('Interned node "%s" cannot be modified.' % self)
+
+    def clone(self):
+        """
+        Create a mutable copy in which the shared subtrees are copied
+        separately. The subtrees are copied using a stack instead of
+        recursion.
+        """
+        root = copy.copy(self)
+        stack = [root]
+
+        while stack:
+            node = stack.pop()
+
+            if not node.is_leaf:
+                node.nodes = map(copy.copy, node.nodes)
+                stack.extend(node.nodes)
+
+        return root
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+
+class InternedLeaf(ExpressionLeaf):
+    """
+    Immutable leaf that is shared by all equal leaves in an InternTable.
+    """
+    __slots__ = ()
+    interned = True
+    value = immutable_slot(ExpressionLeaf, 'value')
+    negated = immutable_slot(ExpressionLeaf, 'negated')
+
+    def clone(self):
+        return copy.copy(self)
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+
+class InternTable(object):
+    """
+    Table of hash-consed expression nodes. Interning a node returns a shared
+    node for each structurally identical subtree, so that strict equality of
+    nodes in the same table is identity, and their (identity-based) hash is
+    consistent with equality. Interned nodes cannot be modified, writes to
+    their children, value or negation raise a ValueError. negate() and
+    to_expression() return interned nodes instead of copies, and clone()
+    returns a mutable copy. Nodes that are no longer referenced elsewhere are
+    removed from the table. The table can be shared by multiple threads.
+    """
+
+    def __init__(self):
+        self.nodes = weakref.WeakValueDictionary()
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def intern(self, node, negated=None):
+        """
+        Find or create the interned node that is strictly equal to the
+        specified node, optionally with another negation. The subtrees are
+        interned in postorder using a stack instead of recursion.
+        """
+        if negated is None:
+            if node.intern_table is self:
+                return node
+
+            negated = node.negated
+
+        root = node
+        shared = {}
+        stack = [(node, False)]
+
+        while stack:
+            node, visited = stack.pop()
+
+            if node.intern_table is self and node is not root:
+                shared[id(node)] = node
+            elif node.is_leaf or visited:
+                shared[id(node)] = self.share(node,
+                        negated if node is root else node.negated,
+                        None if node.is_leaf
+                        else [shared[id(child)] for child in node])
+            else:
+                stack.append((node, True))
+                stack.extend([(child, False) for child in node.nodes])
+
+        return shared[id(root)]
+
+    def share(self, node, negated, children):
+        """
+        Find or create the interned node for a node with the specified
+        negation and interned children.
+        """
+        if children is None:
+            key = node.type, node.value, negated
+            cls = InternedLeaf
+        else:
+            key = (TYPE_OPERATOR, node.op, negated) + tuple(map(id, children))
+            cls = InternedNode
+
+        # Two threads must not create different shared nodes for one key
+        with self.lock:
+            shared = self.nodes.get(key)
+
+            if shared is None:
+                # Fill in the mutable copy before it becomes immutable
+                shared = copy.copy(node)
+                shared.negated = negated
+                clear_caches(shared)
+
+                if children is not None:
+                    shared.nodes = children
+
+                shared.intern_table = self
+                shared.__class__ = cls
+                self.nodes[key] = shared
+
+        return shared
+
+
+# Intern table that is used by intern_node()
+INTERN_TABLE = InternTable()
+
+
+def intern_node(node):
+    """
+    Intern an expression in the global intern table, see InternTable.
+    """
+    return INTERN_TABLE.intern(node)
+
+
+# Header of the binary encoding of an expression, see encode_node(). The
+# version is incremented when the format changes.
+CODEC_MAGIC = 'TRS'
+CODEC_VERSION = 1
+
+# Types of the values in the constant pool of an encoded expression
+CODEC_TYPES = {
+        TYPE_INTEGER: int,
+        TYPE_FLOAT: float,
+        TYPE_IDENTIFIER: str,
+        }
+
+
+def write_varint(buf, n):
+    """
+    Append a non-negative integer to a bytearray, 7 bits per byte.
+    """
+    while n > 0x7f:
+        buf.append(0x80 | (n & 0x7f))
+        n >>= 7
+
+    buf.append(n)
+
+
+def read_varint(buf, i):
+    """
+    Read a non-negative integer from a bytearray at index i. Returns the
+    integer and the index of the next byte.
+    """
+    n = shift = 0
+
+    while True:
+        if i >= len(buf):
+            raise ValueError('Encoded expression is truncated.')
+
+        byte = buf[i]
+        n |= (byte & 0x7f) << shift
+        i += 1
+        shift += 7
+
+        if byte < 0x80:
+            return n, i
+
+
+def encode_node(node):
+    """
+    Encode an expression in a compact binary string, which is decoded by
+    decode_node(). The encoding consists of a header, a pool of the distinct
+    leaf values and a preorder stream of the nodes. Each node is encoded as a
+    varint of its negation and parentheses, followed by either twice the pool
+    index of a leaf, or twice the operator of an operator node plus one and
+    its number of children.
+    """
+    pool = {}
+    constants = bytearray()
+    stream = bytearray()
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        write_varint(stream, node.negated << 1 | bool(node.parens))
+
+        if node.is_leaf:
+            key = node.type, node.value
+
+            if key not in pool:
+                pool[key] = len(pool)
+                value = node.value
+
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+
+                value = repr(value) if node.type == TYPE_FLOAT else str(value)
+                constants.append(node.type)
+                write_varint(constants, len(value))
+                constants.extend(value)
+
+            write_varint(stream, pool[key] << 1)
+        else:
+            write_varint(stream, node.op << 1 | 1)
+            write_varint(stream, len(node))
+            stack.extend(reversed(node.nodes))
+
+    header = bytearray(CODEC_MAGIC)
+    header.append(CODEC_VERSION)
+    write_varint(header, len(pool))
+
+    return str(header + constants + stream)
+
+
+def decode_node(data):
+    """
+    Decode an expression that was encoded by encode_node(). The nodes are
+    created in reverse preorder, so that nested expressions do not exceed the
+    recursion limit.
+    """
+    buf = bytearray(data)
+    i = len(CODEC_MAGIC)
+
+    if buf[:i] != CODEC_MAGIC:
+        raise ValueError('Data is not an encoded expression.')
+
+    if i >= len(buf) or buf[i] != CODEC_VERSION:
+        raise ValueError('Unsupported expression encoding version.')
+
+    count, i = read_varint(buf, i + 1)
+    constants = []
+
+    for j in xrange(count):
+        if i >= len(buf) or buf[i] not in CODEC_TYPES:
+            raise ValueError('Invalid constant in encoded expression.')
+
+        value_type = CODEC_TYPES[buf[i]]
+        length, i = read_varint(buf, i + 1)
+        constants.append(value_type(str(buf[i:i + length])))
+        i += length
+
+    records = []
+
+    while i < len(buf):
+        flags, i = read_varint(buf, i)
+        code, i = read_varint(buf, i)
+
+        if code & 1:
+            arity, i = read_varint(buf, i)
+            records.append((flags, code >> 1, arity))
+        elif code >> 1 < len(constants):
+            records.append((flags, constants[code >> 1], None))
+        else:
+            raise ValueError('Invalid constant in encoded expression.')
+
+    stack = []
+
+    for flags, value, arity in reversed(records):
+        if arity is None:
+            node = ExpressionLeaf(value)
+        elif arity > len(stack):
+            raise ValueError('Encoded expression is truncated.')
+        else:
+            node = ExpressionNode(value, *[stack.pop()
+                                           for j in xrange(arity)])
+
+        node.negated = flags >> 1
+        node.parens = bool(flags & 1)
+        stack.append(node)
+
+    if len(stack) != 1:
+        raise ValueError('Encoded expression does not contain a single root.')
+
+    return stack[0]
+
+
 class Scope(object):
+    """
+    The n nodes in the n-ary scope of an operator node. If the node has no
+    nested operands, the scope is a view of the list of children of the node,
+    which is only copied when the scope is modified.
+    """
 
     def __init__(self, node):
         self.node = node
-        self.nodes = get_scope(node)
 
-        for i, n in enumerate(self.nodes):
-            n.scope_index = i
+        if any([is_nested_operand(node, child) for child in node]):
+            self.nodes = get_scope(node)
+        else:
+            self.nodes = node.nodes
 
     def __getitem__(self, key):
         return self.nodes[key]
 
     def __setitem__(self, key, value):
+        self.unshare()
         self.nodes[key] = value
 
     def __len__(self):
@@ -596,24 +1505,33 @@ class Scope(object):
         return '<Scope of "%s">' % repr(self.node)
 
     def index(self, node):
-        return node.scope_index
+        """
+        Find the index of a node in the scope by identity, since the scope may
+        contain multiple equal nodes.
+        """
+        for i, n in enumerate(self.nodes):
+            if n is node:
+                return i
 
-    def remove(self, node, replacement=None):
-        try:
-            i = node.scope_index
+        raise ValueError('Node "%s" is not in the scope of "%s".'
+                         % (node, self.node))
 
-            if replacement:
-                self[i] = replacement
-                replacement.scope_index = i
-            else:
-                del self.nodes[i]
+    def unshare(self):
+        """
+        Copy the list of nodes before it is modified, if it is the list of
+        children of the scope node.
+        """
+        if self.nodes is self.node.nodes:
+            self.nodes = list(self.nodes)
 
-                # Update remaining scope indices
-                for n in self.nodes[i:]:
-                    n.scope_index -= 1
-        except AttributeError:
-            raise ValueError('Node "%s" is not in the scope of "%s".'
-                             % (node, self.node))
+    def remove(self, node, replacement=None):
+        i = self.index(node)
+
+        if replacement:
+            self[i] = replacement
+        else:
+            self.unshare()
+            del self.nodes[i]
 
     def replace(self, node, replacement):
         self.remove(node, replacement=replacement)
@@ -625,26 +1543,43 @@ class Scope(object):
 
     # FIXME: def as_binary_node(self):
     def as_nary_node(self):
-        return nary_node(self.node.op, self.nodes) \
-                .negate(self.node.negated, clone=False)
+        node = nary_node(self.node.op, self.nodes)
+
+        # A single node is not a new node, so it is copied to leave the node
+        # in the expression intact when the result is modified
+        if len(self.nodes) == 1:
+            node = copy.copy(node)
+
+        return node.negate(self.node.negated, clone=False)
 
     def all_except(self, node):
-        before = range(0, node.scope_index)
-        after = range(node.scope_index + 1, len(self))
-        nodes = [self[i] for i in before + after]
+        i = self.index(node)
+        nodes = self.nodes[:i] + self.nodes[i + 1:]
 
-        return negate(nary_node(self.node.op, nodes), self.node.negated)
+        # A single remaining node is not a new node, so it is cloned to leave
+        # the negation of the node in the expression intact
+        return negate(nary_node(self.node.op, nodes), self.node.negated,
+                      clone=len(nodes) == 1)
 
 
 def nary_node(operator, scope):
     """
-    Create a binary expression tree for an n-ary operator. Takes the operator
-    and a list of expression nodes as arguments.
+    Create an expression node for an n-ary operator. Takes the operator and a
+    list of expression nodes as arguments. A single node is returned itself.
     """
     if len(scope) == 1:
         return scope[0]
 
-    return ExpressionNode(operator, nary_node(operator, scope[:-1]), scope[-1])
+    return ExpressionNode(operator, *scope)
+
+
+def is_nested_operand(node, child):
+    """
+    Check if a child node is in the n-ary scope of the operator of a node with
+    its own operands, e.g. b + c in a + (b + c).
+    """
+    return isinstance(child, ExpressionBase) and child.is_op(node.op) \
+           and not child.negated
 
 
 def get_scope(node):
@@ -653,9 +1588,15 @@ def get_scope(node):
     """
     scope = []
 
-    for child in node:
-        if child.is_op(node.op) and not child.negated:
-            scope += get_scope(child)
+    # Traverse the nested operands of the scope in order, using the stack of
+    # nodes that still have to be visited instead of recursion
+    stack = list(node)[::-1]
+
+    while stack:
+        child = stack.pop()
+
+        if is_nested_operand(node, child):
+            stack.extend(child.nodes[::-1])
         else:
             scope.append(child)
 
@@ -670,6 +1611,43 @@ def get_scope(node):
     return scope
 
 
+def op_feature(*ops):
+    """
+    Create a feature bitmask that indicates the presence of any of the
+    specified operators in the children of a node.
+    """
+    features = 0
+
+    for op in ops:
+        features |= 1 << op
+
+    return features
+
+
+def child_features(node):
+    """
+    Create a feature bitmask of the nodes within the n-ary scope of an
+    operator node, or of the children of a non-n-ary operator node. The
+    bitmask contains the operators of the nodes, and whether there are
+    numeric, identifier and negated nodes.
+    """
+    features = 0
+
+    for child in get_scope(node) if node.op in NARY_OPERATORS else node:
+        if child.negated:
+            features |= FEATURE_NEGATED
+
+        if child.is_leaf:
+            if child.type == TYPE_IDENTIFIER:
+                features |= FEATURE_IDENTIFIER
+            else:
+                features |= FEATURE_NUMERIC
+        else:
+            features |= 1 << child.op
+
+    return features
+
+
 def negate(node, n=1, clone=False):
     """
     Negate the given node n times. If clone is set to true, return a new node
@@ -677,9 +1655,14 @@ def negate(node, n=1, clone=False):
     """
     #assert n >= 0
 
+    if node.interned:
+        return node.intern_table.intern(node, n)
+
     if clone:
         node = node.clone()
 
+    clear_caches(node)
+
     node.negated = n
 
     return node
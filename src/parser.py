@@ -32,14 +32,23 @@ from node import ExpressionNode as Node, \
         ExpressionLeaf as Leaf, OP_MAP, OP_DXDER, TOKEN_MAP, TYPE_OPERATOR, \
         OP_COMMA, OP_MUL, OP_POW, OP_LOG, OP_ADD, Scope, E, OP_ABS, \
         DEFAULT_LOGARITHM_BASE, SPECIAL_TOKENS, OP_INT, OP_INT_DEF, \
-        INFINITY, OP_PRIME, OP_DIV
+        INFINITY, OP_PRIME, OP_DIV, intern_node, invalidate_subtree
 from rules.utils import find_variable
 from rules.precedences import IMPLICIT_RULES
-from strategy import find_possibilities
+from strategy import find_possibilities, find_hint, PossibilityCache, \
+        POSSIBILITY_MEMO
 from possibilities import apply_suggestion
+from pratt import PrattParser
+from input_buffer import InputBuffer, file_lines, prompt_lines
 
-import Queue
+import errno
+import hashlib
+import itertools
 import re
+import shutil
+import tempfile
+import threading
+import time
 
 
 # Rewriting an expression is stopped after this number of steps is passed.
@@ -48,6 +57,39 @@ MAXIMUM_REWRITE_STEPS = 30
 # Precedence of the TIMES operator ("*")
 TIMES_PRED = pred(Node(OP_MUL))
 
+# The Bison parser engine is not reentrant, so Parser instances that use it
+# cannot parse concurrently. The do_parse() function that pybison generates
+# stores the parser object and the input and action callbacks in globals of
+# the library before it calls yyparse(), also for a "%define api.pure full"
+# grammar, and the scanner can only reach the parser through those globals
+# (see YY_INPUT in the lex script). A reentrant scanner with the parser in
+# yyextra would therefore still share them. This lock only serializes the use
+# of the library, so that parsers in different threads do not overwrite each
+# other's globals. Use the Pratt parser engine (pratt=True) to parse in
+# multiple threads concurrently: it keeps all parse state in the instance.
+BISON_LOCK = threading.RLock()
+
+
+def grammar_hash(parser_class):
+    """
+    Hash of everything that the generated Bison parser library of a parser
+    class is built from: the grammar rules in the docstrings of its handlers,
+    its precedences, tokens, start symbol and lexscript.
+    """
+    h = hashlib.sha1()
+
+    for name in sorted(dir(parser_class)):
+        if name.startswith('on_'):
+            doc = getattr(parser_class, name).__doc__ or ''
+            h.update('%s:%s\n' % (name, ' '.join(doc.split())))
+
+    h.update(repr(parser_class.precedences))
+    h.update(repr(parser_class.tokens))
+    h.update(repr(parser_class.start))
+    h.update(parser_class.lexscript)
+
+    return h.hexdigest()
+
 
 # Check for n-ary operator in child nodes
 def combine(op, op_type, *nodes):
@@ -82,6 +124,131 @@ def apply_operator_negation(op, exp):
     exp.negated += len(op) - 1
 
 
+# Characters that keywords are replaced with by the preprocessor, see
+# Parser.hook_read_after()
+RESERVED_CHARS = '\x00-\x09\x0b-\x0c\x0e-\x19'
+
+IMPLICIT_MULTIPLICATION = re.compile(
+        '(?:([)\]])\s*([([])'                         # )(  -> ) * (
+                                                      # )[  -> ) * [
+                                                      # ](  -> [ * (
+                                                      # ][  -> [ * [
+        + '|([' + RESERVED_CHARS + 'a-z0-9])\s*([([])'  # a(  -> a * (
+                                                      # a[  -> a * [
+        + '|(\))\s*([' + RESERVED_CHARS + 'a-z0-9])'    # )a  -> ) * a
+        + '|([' + RESERVED_CHARS + 'a-z])\s*'
+          + '([' + RESERVED_CHARS + 'a-z0-9])'          # ab  -> a * b
+        + '|(\|)(\|)'                                 # ||  -> | * |
+        + '|([0-9])\s*([' + RESERVED_CHARS + 'a-z])'    # 4a  -> 4 * a
+        + '|([' + RESERVED_CHARS + 'a-z])([0-9])'       # a4  -> a ^ 4
+        + '|([' + RESERVED_CHARS + '0-9])(\s+[0-9]))',  # 4 4 -> 4 * 4
+        # FIXME: Last line is a bit useless
+        re.IGNORECASE)
+
+# Compiled keyword patterns of the preprocessor for each tuple of words
+KEYWORD_PATTERNS = {}
+
+
+def keyword_patterns(words):
+    """
+    Create the list of keywords that are replaced with escape sequences by the
+    preprocessor, and their compiled patterns.
+    """
+    if words not in KEYWORD_PATTERNS:
+        keywords = list(words)
+        keywords.insert(0xa, '\n')
+        keywords.insert(0xc, '\f')
+        keywords.insert(0xd, '\r')
+
+        # FIXME: Why case-insensitivity?
+        # FIXME: good question...
+        KEYWORD_PATTERNS[words] = [(keyword, re.compile(keyword, re.I))
+                                   for keyword in keywords]
+
+    return KEYWORD_PATTERNS[words]
+
+
+# Whitespace that contains escape sequences of keywords, which are whitespace
+# characters themselves. The order in which implicit multiplications are
+# replaced matters for such data, see insert_multiplications().
+AMBIGUOUS_WHITESPACE = re.compile('\x0c|[\t\x0b]\s*[\t\x0b]')
+
+
+def implicit_multiplication(match):
+    """
+    Create the replacement of a match of IMPLICIT_MULTIPLICATION.
+    """
+    left, right = filter(None, match.groups())
+
+    # Make sure there are no multiplication and exponentiation signs inserted
+    # between a function and its argument(s): "sin x" should not be written as
+    # "sin*x", because that is bogus.
+    # Bugfix: omit 0x0c (pi) to prevent "pi a" (should be "pi*a")
+    o = ord(left)
+
+    if o <= 0x9 or o == 0xb:
+        return left + ' ' + right
+
+    # If all characters on the right are numbers. e.g. "a4", the expression
+    # implies exponentiation. Make sure ")4" is not converted into an
+    # exponentiation, because that's multiplication.
+    #if left != ')' and not left.isdigit() and right.isdigit():
+    #    return '%s^%s' % (left, right)
+
+    # match: ab | abc | abcd (where left = "a")
+    return '*'.join([left] + list(right.lstrip(' ')))
+
+
+def insert_multiplications_iteratively(data):
+    """
+    Insert multiplication signs between implicitly multiplied operands, by
+    replacing all matches of IMPLICIT_MULTIPLICATION after each offset in the
+    data. This takes quadratic time, see insert_multiplications().
+    """
+    i = 0
+
+    while i < len(data):
+        data = data[:i] + IMPLICIT_MULTIPLICATION.sub(implicit_multiplication,
+                                                      data[i:])
+        i += 1
+
+    return data
+
+
+def insert_multiplications(data):
+    """
+    Insert multiplication signs between implicitly multiplied operands, in a
+    single pass over the data. The right operand of a multiplication can be
+    the left operand of the next one (e.g. "abc"), so the search for the next
+    match starts at the right operand of the previous match.
+
+    The result is equal to that of insert_multiplications_iteratively(), except
+    for data with ambiguous whitespace. There, a later match that starts at an
+    escape sequence is replaced before an earlier match is found, which
+    changes the whitespace that the earlier match can skip. Such data is
+    passed to insert_multiplications_iteratively() instead.
+    """
+    if AMBIGUOUS_WHITESPACE.search(data):
+        return insert_multiplications_iteratively(data)
+
+    result = []
+    search = IMPLICIT_MULTIPLICATION.search
+    i = 0
+    match = search(data)
+
+    while match:
+        # The replacement ends with the last character of the right operand,
+        # at which the next match may start
+        result.append(data[i:match.start()])
+        result.append(implicit_multiplication(match)[:-1])
+        i = match.end() - 1
+        match = search(data, i)
+
+    result.append(data[i:])
+
+    return ''.join(result)
+
+
 class Parser(BisonParser):
     """
     Implements the calculator parser. Grammar rules are defined in the method
@@ -92,8 +259,9 @@ class Parser(BisonParser):
     words = tuple(filter(lambda w: w.isalpha(), OP_MAP.iterkeys())) \
              + ('raise', 'graph') + tuple(SPECIAL_TOKENS)
 
-    # Output directory of generated pybison files, including a trailing slash.
-    buildDirectory = PYBISON_BUILD + '/'
+    # Cache of the generated pybison files, which contains a build directory
+    # for each grammar hash (see grammar_hash() and load_library()).
+    build_cache = PYBISON_BUILD + '/cache'
 
     # ----------------------------------------------------------------
     # lexer tokens - these must match those in your lex script (below)
@@ -125,49 +293,179 @@ class Parser(BisonParser):
         )
 
     def __init__(self, **kwargs):
-        BisonParser.__init__(self, **kwargs)
+        # The pure-Python Pratt parser engine does not use the generated Bison
+        # parser library, so there is no need to build it
+        self.pratt = PrattParser(self) if kwargs.get('pratt', False) else None
+
+        # Lock that serializes the runs of the parser. Bison parsers share
+        # BISON_LOCK, so only Pratt parsers run concurrently
+        self.lock = threading.RLock() if self.pratt else BISON_LOCK
+
+        if self.pratt:
+            self.file = kwargs.get('file', sys.stdin)
+            self.verbose = kwargs.get('verbose', False)
+
+            if 'read' in kwargs:
+                self.read = kwargs['read']
+        else:
+            with self.lock:
+                self.load_library(**kwargs)
+
         self.interactive = kwargs.get('interactive', 0)
         self.timeout = kwargs.get('timeout', 0)
+        self.incremental = kwargs.get('incremental', False)
         self.root_node = None
         self.possibilities = None
+        self.possibility_cache = PossibilityCache() \
+                                 if self.incremental else None
+        self.possibility_memo = POSSIBILITY_MEMO \
+                                if kwargs.get('memoize', False) else None
+        self.intern_steps = kwargs.get('intern', False)
+        self.persistent = kwargs.get('persistent', False)
+        self.flat_root = False
+
+        # Trees of the parsed lines during run_all()
+        self.bulk_results = None
 
         self.reset()
 
+    def load_library(self, **kwargs):
+        """
+        Initialize the Bison parser with the library in the build cache
+        directory of the grammar hash, so that the library is only built when
+        the grammar has changed. The library is built in a temporary directory
+        that is renamed to the build directory afterwards, so that other
+        processes never load an incomplete build.
+        """
+        start = time.time()
+        self.grammar_hash = grammar_hash(self.__class__)
+        directory = os.path.join(self.build_cache, self.grammar_hash)
+        cached = os.path.isdir(directory)
+
+        if cached:
+            self.buildDirectory = directory + '/'
+            BisonParser.__init__(self, **kwargs)
+        else:
+            try:
+                os.makedirs(self.build_cache)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            build = tempfile.mkdtemp(prefix=self.grammar_hash + '.',
+                                     dir=self.build_cache)
+            self.buildDirectory = build + '/'
+
+            try:
+                BisonParser.__init__(self, **kwargs)
+            except:
+                shutil.rmtree(build, True)
+                raise
+
+            try:
+                os.rename(build, directory)
+            except OSError:
+                # Another process has finished the same build first
+                shutil.rmtree(build, True)
+
+            self.buildDirectory = directory + '/'
+
+        if self.verbose:  # pragma: nocover
+            print '%s parser library %s in %.3f seconds' \
+                  % ('Loaded' if cached else 'Built', self.grammar_hash,
+                     time.time() - start)
+
     def reset(self):
-        super(Parser, self).reset()
+        if not self.pratt:
+            with self.lock:
+                super(Parser, self).reset()
 
-        self.read_buffer = ''
-        self.read_queue = Queue.Queue()
+        self.read_buffer = InputBuffer()
 
         #self.subtree_map = {}
         self.set_root_node(None)
         self.possibilities = None
 
+        if self.incremental:
+            self.possibility_cache.clear()
+
     def run(self, *args, **kwargs):
-        self.reset()
-        return super(Parser, self).run(*args, **kwargs)
+        with self.lock:
+            self.reset()
+
+            if self.pratt:
+                return self.pratt.run()
+
+            return super(Parser, self).run(*args, **kwargs)
+
+    def run_all(self, expressions, *args, **kwargs):
+        """
+        Parse an iterable of expressions (one per line) in a single run of the
+        parser, and return the list of their expression trees. A line that
+        cannot be parsed does not abort the other lines: its tree is None, and
+        the parser continues with a new run from the next line. The errors are
+        returned as a list of (index, exception) tuples.
+        """
+        lines = list(expressions)
+
+        for exp in lines:
+            if '\n' in exp:
+                raise ValueError('Expression %s contains a newline.' % repr(exp))
+
+        trees = []
+        errors = []
+
+        with self.lock:
+            read = self.read
+            self.read = self.read_queued
+
+            try:
+                while len(trees) < len(lines):
+                    self.reset()
+                    self.bulk_results = []
+                    self.read_buffer.append(itertools.islice(lines, len(trees),
+                                                             None))
+
+                    try:
+                        if self.pratt:
+                            self.pratt.run()
+                        else:
+                            super(Parser, self).run(*args, **kwargs)
+                    except Exception as e:
+                        errors.append((len(trees) + len(self.bulk_results), e))
+                        self.bulk_results.append(None)
+
+                    trees.extend(self.bulk_results)
+            finally:
+                self.read = read
+                self.bulk_results = None
+
+        return trees, errors
+
+    def read_queued(self, nbytes):
+        """
+        Read the lines in the read buffer, one line at a time. Returns an empty
+        string if the read buffer is exhausted.
+        """
+        return self.read_buffer.read(nbytes)
 
     # Override default read method with a version that prompts for input.
     def read(self, nbytes):
         if self.file == sys.stdin and self.file.closed:
             return ''
 
-        if not self.read_buffer and not self.read_queue.empty():
-            self.read_buffer = self.read_queue.get_nowait() + '\n'
-
-        if self.read_buffer:
-            read_buffer = self.read_buffer[:nbytes]
+        read_buffer = self.read_buffer.read(nbytes)
 
-            self.read_buffer = self.read_buffer[nbytes:]
+        if read_buffer:
             return read_buffer
 
-        try:
-            read_buffer = raw_input('>>> ' if self.interactive else '') + '\n'
-        except EOFError:
-            return ''
+        if self.file == sys.stdin:
+            self.read_buffer.append(prompt_lines('>>> ' if self.interactive
+                                                 else ''))
+        else:
+            self.read_buffer.append(file_lines(self.file))
 
-        self.read_buffer = read_buffer[nbytes:]
-        return read_buffer[:nbytes]
+        return self.read_buffer.read(nbytes)
 
     def hook_read_before(self):
         pass
@@ -182,66 +480,18 @@ class Parser(BisonParser):
             return data
 
         # Replace known keywords with escape sequences.
-        words = list(self.words)
-        words.insert(0xa, '\n')
-        words.insert(0xc, '\f')
-        words.insert(0xd, '\r')
-
-        for i, keyword in enumerate(words):
-            # FIXME: Why case-insensitivity?
-            # FIXME: good question...
-            data = re.sub(keyword, chr(i), data, flags=re.I)
-
-        rsv = '\x00-\x09\x0b-\x0c\x0e-\x19'
-        pattern = ('(?:([)\]])\s*([([])'             # )(  -> ) * (
-                                                     # )[  -> ) * [
-                                                     # ](  -> [ * (
-                                                     # ][  -> [ * [
-                + '|([' + rsv + 'a-z0-9])\s*([([])'  # a(  -> a * (
-                                                     # a[  -> a * [
-                + '|(\))\s*([' + rsv + 'a-z0-9])'    # )a  -> ) * a
-                + '|([' + rsv + 'a-z])\s*'
-                  + '([' + rsv + 'a-z0-9])'          # ab  -> a * b
-                + '|(\|)(\|)'                        # ||  -> | * |
-                + '|([0-9])\s*([' + rsv + 'a-z])'    # 4a  -> 4 * a
-                + '|([' + rsv + 'a-z])([0-9])'       # a4  -> a ^ 4
-                + '|([' + rsv + '0-9])(\s+[0-9]))'   # 4 4 -> 4 * 4
-                # FIXME: Last line is a bit useless
-                )
-
-        def preprocess_data(match):
-            left, right = filter(None, match.groups())
-
-            # Make sure there are no multiplication and exponentiation signs
-            # inserted between a function and its argument(s): "sin x" should
-            # not be written as "sin*x", because that is bogus.
-            # Bugfix: omit 0x0c (pi) to prevent "pi a" (should be "pi*a")
-            o = ord(left)
-            if o <= 0x9 or o == 0xb:
-                return left + ' ' + right
-
-            # If all characters on the right are numbers. e.g. "a4", the
-            # expression implies exponentiation. Make sure ")4" is not
-            # converted into an exponentiation, because that's multiplication.
-            #if left != ')' and not left.isdigit() and right.isdigit():
-            #    return '%s^%s' % (left, right)
-
-            # match: ab | abc | abcd (where left = "a")
-            return '*'.join([left] + list(re.sub('^ +', '', right)))
+        keywords = keyword_patterns(self.words)
+
+        for i, (keyword, pattern) in enumerate(keywords):
+            data = pattern.sub(chr(i), data)
 
         if self.verbose:  # pragma: nocover
             data_before = data
 
-        # Iteratively replace all matches.
-        i = 0
-
-        while i < len(data):
-            data = data[:i] + re.sub(pattern, preprocess_data, data[i:],
-                                     flags=re.IGNORECASE)
-            i += 1
+        data = insert_multiplications(data)
 
         # Replace escape sequences with original keywords.
-        for i, keyword in enumerate(words):
+        for i, (keyword, pattern) in enumerate(keywords):
             data = data.replace(chr(i), keyword)
 
         # Remove TIMES operators around OR that the preprocessor put there
@@ -265,6 +515,7 @@ class Parser(BisonParser):
     def set_root_node(self, node):
         self.root_node = node
         self.possibilities = None
+        self.flat_root = False
 
     def find_possibilities(self):
         if not self.root_node:
@@ -275,7 +526,9 @@ class Parser(BisonParser):
                 print 'Expression has not changed, not updating possibilities'
             return
 
-        self.possibilities = find_possibilities(self.root_node)
+        self.possibilities = find_possibilities(self.root_node,
+                                                cache=self.possibility_cache,
+                                                memo=self.possibility_memo)
 
     def display_hint(self):
         hint = self.give_hint()
@@ -285,7 +538,18 @@ class Parser(BisonParser):
         else:
             print 'No further reduction is possible.'
 
-    def give_hint(self):
+    def give_hint(self, lazy=False):
+        """
+        Find the possibility with the highest priority. In lazy mode, only the
+        hint is searched for instead of finding (and sorting) all
+        possibilities, unless the possibilities are known already.
+        """
+        if lazy and self.possibilities is None:
+            if not self.root_node:
+                raise RuntimeError('No expression')
+
+            return find_hint(self.root_node)
+
         self.find_possibilities()
 
         if self.possibilities:
@@ -297,6 +561,21 @@ class Parser(BisonParser):
         for i, p in enumerate(self.possibilities):
             print '%d %s' % (i, p)
 
+    def apply_possibility(self, possibility):
+        # Persistent steps copy the path to the rewritten node and share all
+        # other nodes with the previous step. This requires the multiplications
+        # in the expression to be flat, so the parsed expression is flattened
+        # in-place by the first step.
+        persistent = self.persistent and self.flat_root
+        self.set_root_node(apply_suggestion(self.root_node, possibility,
+                                            persistent=persistent))
+        self.flat_root = self.persistent
+
+        # The scope in the arguments of the possibility has been modified, so
+        # the cached possibilities of its root node cannot be reused
+        if self.incremental and not persistent:
+            self.possibility_cache.invalidate(possibility.root)
+
     def rewrite(self, index=0, include_step=False, verbose=False,
             check_implicit=True):
         self.find_possibilities()
@@ -311,7 +590,7 @@ class Parser(BisonParser):
         elif verbose:  # pragma: nocover
             print suggestion
 
-        self.set_root_node(apply_suggestion(self.root_node, suggestion))
+        self.apply_possibility(suggestion)
 
         if self.verbose:  # pragma: nocover
             print '         ', self.root_node
@@ -345,7 +624,7 @@ class Parser(BisonParser):
                 if self.verbose:  # pragma: nocover
                     print 'IMPLICIT:', sugg
 
-                self.set_root_node(apply_suggestion(self.root_node, sugg))
+                self.apply_possibility(sugg)
 
                 if self.verbose:  # pragma: nocover
                     print '         ', self.root_node
@@ -358,6 +637,14 @@ class Parser(BisonParser):
         if include_step:
             # Make sure that the node is cloned, otherwise the next rewrite
             # attempt will modify the root node (since it's mutable).
+            # Interned steps share their unchanged subtrees instead, and
+            # persistent steps are never modified.
+            if self.intern_steps:
+                return suggestion, intern_node(self.root_node)
+
+            if self.persistent:
+                return suggestion, self.root_node
+
             return suggestion, self.root_node.clone()
 
         return self.root_node
@@ -418,6 +705,9 @@ class Parser(BisonParser):
             if self.interactive and values[1]:  # pragma: nocover
                 print values[1]
 
+            if self.bulk_results is not None:
+                self.bulk_results.append(values[1])
+
             return values[1]
 
     def on_line(self, target, option, names, values):
@@ -434,6 +724,8 @@ class Parser(BisonParser):
              | RAISE NEWLINE
         """
         if option in (1, 2):  # rule: {exp,debug} NEWLINE
+            # The parse targets modify the negation of nodes directly
+            invalidate_subtree(values[0])
             self.set_root_node(values[0])
             return values[0]
 
@@ -627,13 +919,15 @@ class Parser(BisonParser):
 
         if option == 0:  # rule: exp TIMES exp
             first = values[0]
-            node = Node(values[1], first, values[2])
+            negated = 0
 
+            # The negation is moved before the node is created, so that the
+            # factors of the first node are merged into the new node
             if first.negated and not first.parens:
-                node.negated += first.negated
+                negated = first.negated
                 first.negated = 0
 
-            return node
+            return Node(values[1], first, values[2], negated=negated)
 
         if 1 <= option <= 4:  # rule: exp {PLUS,EQ,AND,OR} exp
             return Node(values[1], values[0], values[2])
@@ -647,7 +941,8 @@ class Parser(BisonParser):
                 negated = top.negated
                 top.negated = 0
 
-            if top.is_op(OP_MUL) and bottom.is_op(OP_MUL):
+            if top.is_op(OP_MUL) and bottom.is_op(OP_MUL) \
+                    and len(top) == len(bottom) == 2:
                 dtop, fx = top
                 dbot, x = bottom
 
@@ -707,20 +1002,20 @@ class Parser(BisonParser):
 
     for token in SPECIAL_TOKENS:
         if len(token) > 1:
-            operators += '"%s"%s{ returntoken(IDENTIFIER); }\n' \
+            operators += '"%s"%s{ returninterned(IDENTIFIER); }\n' \
                          % (token, ' ' * (8 - len(token)))
 
     for op_str, op in OP_MAP.iteritems():
         if TOKEN_MAP[op] == 'FUNCTION':
             functions.append(op_str)
         else:
-            operators += '"%s"%s{ returntoken(%s); }\n' \
+            operators += '"%s"%s{ returninterned(%s); }\n' \
                          % (op_str, ' ' * (8 - len(op_str)), TOKEN_MAP[op])
 
     # Put all functions in a single regex
     if functions:
         fun_or = '("' + '"|"'.join(functions) + '")'
-        operators += fun_or + ' { returntoken(FUNCTION); }\n'
+        operators += fun_or + ' { returninterned(FUNCTION); }\n'
         operators += fun_or + '[ ]*\( { returntoken(FUNCTION_PAREN); }\n'
 
     # -----------------------------------------
@@ -737,8 +1032,14 @@ class Parser(BisonParser):
     extern void *py_parser;
     extern void (*py_input)(PyObject *parser, char *buf, int *result,
                             int max_size);
+    /* The string object is a copy of yytext, which is owned by flex. Tokens
+     * of which the value has a small set of possible strings (identifiers,
+     * operators and keywords) are interned, so that a single string object
+     * is shared by all tokens with the same value. */
     #define returntoken(tok) \
-            yylval = PyString_FromString(strdup(yytext)); return (tok);
+            yylval = PyString_FromStringAndSize(yytext, yyleng); return (tok);
+    #define returninterned(tok) \
+            yylval = PyString_InternFromString(yytext); return (tok);
     #define YY_INPUT(buf,result,max_size) { \
             (*py_input)(py_parser, buf, &result, max_size); \
     }
@@ -765,21 +1066,21 @@ class Parser(BisonParser):
 
     d[ ]*"/"[ ]*"d*"[a-z] { returntoken(DERIVATIVE); }
     [0-9]+"."?[0-9]* { returntoken(NUMBER); }
-    [a-zA-Z]  { returntoken(IDENTIFIER); }
-    "("       { returntoken(LPAREN); }
-    ")"       { returntoken(RPAREN); }
-    "["       { returntoken(LBRACKET); }
-    "]"       { returntoken(RBRACKET); }
-    "{"       { returntoken(LCBRACKET); }
-    "}"       { returntoken(RCBRACKET); }
-    "|"       { returntoken(PIPE); }
+    [a-zA-Z]  { returninterned(IDENTIFIER); }
+    "("       { returninterned(LPAREN); }
+    ")"       { returninterned(RPAREN); }
+    "["       { returninterned(LBRACKET); }
+    "]"       { returninterned(RBRACKET); }
+    "{"       { returninterned(LCBRACKET); }
+    "}"       { returninterned(RCBRACKET); }
+    "|"       { returninterned(PIPE); }
     """ + operators + r"""
-    "raise"   { returntoken(RAISE); }
-    "graph"   { returntoken(GRAPH); }
+    "raise"   { returninterned(RAISE); }
+    "graph"   { returninterned(GRAPH); }
     "quit"    { yyterminate(); returntoken(QUIT); }
 
     [ \t\v\f] { }
-    [\n]      { yycolumn = 0; returntoken(NEWLINE); }
+    [\n]      { yycolumn = 0; returninterned(NEWLINE); }
     .         { printf("unknown char %c ignored.\n", yytext[0]); }
 
     %%
@@ -12,7 +12,10 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from node import TYPE_OPERATOR, OP_MUL, Scope
+from node import TYPE_OPERATOR, OP_MUL, ExpressionBase, Scope, clear_caches, \
+        invalidate_path, is_nested_operand
+from flat_tree import FlatTree
+import copy
 import re
 
 
@@ -24,10 +27,18 @@ MESSAGES = {}
 
 
 class Possibility(object):
-    def __init__(self, root, handler, args=()):
+    """
+    Application of a rewrite handler to a node with the specified arguments.
+    The path is the sequence of child indices that leads from the root of the
+    expression to the node, which is set by find_possibilities().
+    """
+    __slots__ = ('root', 'handler', 'args', 'path')
+
+    def __init__(self, root, handler, args=(), path=None):
         self.root = root
         self.handler = handler
         self.args = args
+        self.path = path
 
     def __str__(self):
         if self.handler in MESSAGES:
@@ -67,40 +78,299 @@ def find_parent_node(root, child):
     while nodes:
         node = nodes.pop()
 
-        while node:
-            if node.type != TYPE_OPERATOR:
-                break
+        if not isinstance(node, ExpressionBase) \
+                or node.type != TYPE_OPERATOR:
+            continue
+
+        if child in node:
+            return node
 
-            if child in node:
-                return node
+        nodes.extend(reversed(node.nodes))
 
-            if len(node) > 1:
-                nodes.append(node[1])
 
-            node = node[0]
+def is_flat_mult(node):
+    """
+    Check if a multiplication has no nested factors, which is the shape that
+    is created by nary_node().
+    """
+    return len(node) > 1 \
+           and not any([is_nested_operand(node, child) for child in node])
 
 
 def flatten_mult(node):
+    return flatten_mult_changes(node)[0]
+
+
+def flatten_mult_changes(node):
+    """
+    Flatten the multiplications in an expression, see flatten_mult(). Returns
+    the flattened node and whether the expression has changed, in which case
+    the caches of the modified nodes have been cleared.
+    """
     if node.is_leaf:
-        return node
+        return node, False
 
     if node.is_op(OP_MUL):
-        scope = Scope(node)
-        scope.nodes = map(flatten_mult, scope)
-        return scope.as_nary_node()
+        if not is_flat_mult(node):
+            scope = Scope(node)
+            scope.nodes = map(flatten_mult, scope)
+            return scope.as_nary_node(), True
+
+        # Flatten the factors of an already flat multiplication in-place, so
+        # that unchanged nodes keep their identity (which is used by the
+        # incremental possibility cache)
+        changed = False
+
+        for i, factor in enumerate(node.nodes):
+            factor, factor_changed = flatten_mult_changes(factor)
+
+            if factor_changed:
+                node.nodes[i] = factor
+                changed = True
+
+        if changed:
+            clear_caches(node)
+
+        return node, changed
+
+    children = map(flatten_mult_changes, node)
+
+    if not any([changed for child, changed in children]):
+        return node, False
+
+    node.nodes = [child for child, changed in children]
+    clear_caches(node)
+
+    return node, True
+
+
+def find_path_parent(root, suggestion):
+    """
+    Find the parent node of a suggestion's root node and the index of the root
+    node in it by following the path of the suggestion, in O(depth). Returns
+    None if the suggestion has no path or its path is outdated.
+    """
+    path = suggestion.path
+
+    if not path:
+        return None
+
+    parent = root
+
+    for i in path[:-1]:
+        if parent.is_leaf or i >= len(parent):
+            return None
+
+        parent = parent[i]
+
+    i = path[-1]
+
+    if parent.is_leaf or i >= len(parent) or parent[i] is not suggestion.root:
+        return None
+
+    return parent, i
+
+
+def find_node_path(root, node):
+    """
+    Find the path of a node in an expression by identity, in preorder.
+    Returns None if the node does not occur in the expression.
+    """
+    tree = FlatTree.from_node(root)
+
+    for i in tree.preorder():
+        if tree.sources[i] is node:
+            return tree.path(i)
+
+
+def find_path(root, suggestion):
+    """
+    Find the path of a suggestion's root node in an expression. The path of
+    the suggestion itself is used if it is up to date. Otherwise, the node is
+    searched for by identity and then by equality, in preorder. Returns None
+    if the node does not occur in the expression.
+    """
+    if suggestion.root is root:
+        return ()
+
+    parent = find_path_parent(root, suggestion)
+
+    if parent:
+        return suggestion.path
+
+    tree = FlatTree.from_node(root)
+
+    for i in tree.preorder():
+        if tree.sources[i] is suggestion.root:
+            return tree.path(i)
+
+    for i in tree.preorder():
+        if tree.sources[i] == suggestion.root:
+            return tree.path(i)
+
+
+def replace_path(root, path, subtree):
+    """
+    Replace the node at a path in an expression with a new subtree, without
+    modifying the expression. Only the ancestors of the replaced node are
+    copied, all other nodes are shared with the original expression.
+    Multiplications on the path are flattened like flatten_mult() does, so the
+    shared nodes are assumed to be flat already.
+    """
+    ancestors = []
+    node = root
 
-    node.nodes = map(flatten_mult, node)
+    for i in path:
+        ancestors.append(node)
+        node = node[i]
+
+    node = subtree
+
+    for parent, i in reversed(zip(ancestors, path)):
+        parent = copy.copy(parent)
+        parent[i] = node
+
+        if parent.is_op(OP_MUL) and not is_flat_mult(parent):
+            parent = Scope(parent).as_nary_node()
+
+        node = parent
 
     return node
 
 
-def apply_suggestion(root, suggestion):
-    # TODO: clone the root node before modifying. After deep copying the root
-    # node, the subtree_map cannot be used since the hash() of each node in the
-    # deep copied root node has changed.
-    #root = root.clone()
+def argument_nodes(value, nodes):
+    """
+    Collect the nodes in the arguments of a possibility, including the nodes
+    of scopes and their nested operands, in a dictionary that maps their ids
+    to the nodes.
+    """
+    if isinstance(value, ExpressionBase):
+        nodes[id(value)] = value
+    elif isinstance(value, Scope):
+        stack = [value.node]
+
+        while stack:
+            node = stack.pop()
+            nodes[id(node)] = node
+            stack.extend([child for child in node
+                          if is_nested_operand(value.node, child)])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            argument_nodes(item, nodes)
+
+    return nodes
+
+
+def copy_arguments(value, copies):
+    """
+    Replace the nodes in the arguments of a possibility with their copies.
+    """
+    if isinstance(value, ExpressionBase):
+        return copies.get(id(value), value)
+
+    if isinstance(value, Scope):
+        scope = copy.copy(value)
+        scope.node = copies[id(value.node)]
+        scope.nodes = [copies.get(id(n), n) for n in value.nodes]
+
+        return scope
+
+    if isinstance(value, (list, tuple)):
+        return type(value)([copy_arguments(item, copies) for item in value])
+
+    return value
+
+
+def copy_suggestion(suggestion):
+    """
+    Copy the root node and the arguments of a suggestion, so that a handler
+    can modify them in-place. Only the root node, the argument nodes, the
+    nested operands of scopes and the nodes on the paths between them are
+    copied. All other nodes are shared with the original expression.
+    """
+    root = suggestion.root
+    targets = argument_nodes(suggestion.args, {id(root): root})
+
+    # Find the parents of the nodes in the subtree, until all argument nodes
+    # are found
+    parents = {id(root): None}
+    remaining = len(targets) - 1
+    stack = [root]
+
+    while stack and remaining:
+        node = stack.pop()
+
+        for child in node:
+            if isinstance(child, ExpressionBase) and id(child) not in parents:
+                parents[id(child)] = node
+                remaining -= id(child) in targets
 
+                if not child.is_leaf:
+                    stack.append(child)
+
+    # Copy the argument nodes and their ancestors in the subtree
+    copies = {}
+
+    for node in targets.itervalues():
+        while node is not None and id(node) not in copies:
+            copies[id(node)] = copy.copy(node)
+            node = parents.get(id(node))
+
+    for node in copies.itervalues():
+        if not node.is_leaf:
+            for i, child in enumerate(node.nodes):
+                node.nodes[i] = copies.get(id(child), child)
+
+    return copies[id(root)], copy_arguments(suggestion.args, copies)
+
+
+def apply_persistent_suggestion(root, suggestion):
+    """
+    Apply a suggestion without modifying the expression, by copying the path
+    from the root to the rewritten node (see replace_path()). Handlers may
+    modify their arguments in-place, so they are applied to a partial copy of
+    the suggestion's root node (see copy_suggestion()).
+    """
+    path = find_path(root, suggestion)
+    node, args = copy_suggestion(suggestion)
+    subtree = flatten_mult(suggestion.handler(node, args))
+
+    if path is None:
+        return subtree
+
+    return replace_path(root, path, subtree)
+
+
+def apply_suggestion(root, suggestion, persistent=False):
+    """
+    Apply a suggestion to an expression and return the new expression. By
+    default, the expression is modified in-place. In persistent mode, the
+    expression is left intact and shares its unmodified subtrees with the new
+    expression (see apply_persistent_suggestion()).
+    """
+    if persistent:
+        return apply_persistent_suggestion(root, suggestion)
+
+    # Use the path of the suggestion if it is known, which unlike
+    # find_parent_node() does not compare nodes structurally and cannot select
+    # an equal subtree at another position
+    parent = find_path_parent(root, suggestion)
+
+    # Handlers create new nodes for the rewritten parts of the subtree, and
+    # the nodes that they modify clear their own caches (see clear_caches()).
+    # Only the caches of the ancestors of the subtree have to be cleared
     subtree = suggestion.handler(suggestion.root, suggestion.args)
+
+    if suggestion.path == () and suggestion.root is root:
+        return flatten_mult(subtree)
+
+    if parent:
+        parent_node, i = parent
+        parent_node[i] = subtree
+        invalidate_path(root, suggestion.path[:-1])
+
+        return flatten_mult(root)
+
     parent_node = find_parent_node(root, suggestion.root)
 
     # There is either a parent node or the subtree is the root node.
@@ -114,6 +384,7 @@ def apply_suggestion(root, suggestion):
 
     if parent_node:
         parent_node.substitute(suggestion.root, subtree)
+        invalidate_path(root, find_node_path(root, parent_node))
     else:
         root = subtree
 
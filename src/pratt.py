@@ -0,0 +1,394 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Pure-Python parser engine for the grammar of the Bison parser in parser.py,
+which does not require the generated parser library.
+
+The engine is an operator precedence (Pratt) parser that calls the same
+handlers (on_exp, on_binary, ...) as the Bison engine. The rules and their
+option numbers are read from the docstrings of the handlers, and the
+shift/reduce conflicts of the grammar are resolved like Bison does: the
+lookahead operator is shifted if its precedence is higher than that of the
+rule that would be reduced, or if it is equal and the operator is
+right-associative.
+"""
+import re
+import sys
+
+from node import OP_MAP, TOKEN_MAP, SPECIAL_TOKENS
+
+
+# Number of bytes that is requested by each call to the read function, which
+# is the size of the input buffer of flex
+READ_SIZE = 8192
+
+
+class PrattSyntaxError(Exception):
+    pass
+
+
+def lexer_rules():
+    """
+    Create the list of (token, pattern) pairs of the tokens in the lexscript
+    of the Bison parser. The patterns are ordered such that the first matching
+    pattern is also the longest match, like flex does.
+    """
+    functions = []
+    words = [(token, 'IDENTIFIER') for token in SPECIAL_TOKENS
+             if len(token) > 1]
+
+    for op_str, op in OP_MAP.iteritems():
+        if TOKEN_MAP[op] == 'FUNCTION':
+            functions.append(op_str)
+
+        words.append((op_str, TOKEN_MAP[op]))
+
+    words += [('raise', 'RAISE'), ('graph', 'GRAPH'), ('quit', 'QUIT')]
+    words.sort(key=lambda (word, token): -len(word))
+    functions.sort(key=lambda f: -len(f))
+
+    return [('DERIVATIVE', r'd *\/ *d\*[a-z]'),
+            ('FUNCTION_PAREN',
+             r'(?:%s) *\(' % '|'.join(map(re.escape, functions)))] \
+           + [(token, re.escape(word)) for word, token in words] \
+           + [('NUMBER', r'[0-9]+\.?[0-9]*'),
+              ('IDENTIFIER', r'[a-zA-Z]'),
+              ('LPAREN', r'\('),
+              ('RPAREN', r'\)'),
+              ('LBRACKET', r'\['),
+              ('RBRACKET', r'\]'),
+              ('LCBRACKET', r'\{'),
+              ('RCBRACKET', r'\}'),
+              ('PIPE', r'\|'),
+              (None, '[ \t\v\f]+'),
+              ('NEWLINE', r'\n'),
+              ('UNKNOWN', '.')]
+
+
+LEXER_RULES = lexer_rules()
+
+# Tokens of which the text is not interned, because it has many possible values
+# (like the returntoken macro of the lexscript)
+UNINTERNED_TOKENS = ('NUMBER', 'DERIVATIVE', 'FUNCTION_PAREN')
+LEXER_TOKENS = [token for token, pattern in LEXER_RULES]
+LEXER = re.compile('|'.join(['(%s)' % pattern
+                             for token, pattern in LEXER_RULES]))
+
+
+def tokenize(data):
+    """
+    Split data into (token, text) pairs. Whitespace is skipped, and unknown
+    characters are ignored with a warning like the Bison parser's scanner
+    does. The texts of identifiers, operators and keywords are interned.
+    """
+    for match in LEXER.finditer(data):
+        token = LEXER_TOKENS[match.lastindex - 1]
+
+        if token == 'UNKNOWN':
+            sys.stdout.write('unknown char %s ignored.\n' % match.group())
+        elif token in UNINTERNED_TOKENS:
+            yield token, match.group()
+        elif token:
+            yield token, intern(match.group())
+
+
+def grammar_rules(parser):
+    """
+    Read the grammar rules from the docstrings of the handlers of a parser.
+    Returns a dictionary that maps each target to a list of the symbols of its
+    options, and a dictionary of the %prec tokens of the rules that have one.
+    """
+    rules = {}
+    prec = {}
+
+    for name in dir(parser):
+        doc = getattr(parser, name).__doc__ if name.startswith('on_') else None
+
+        if not doc or ':' not in doc:
+            continue
+
+        target, options = doc.split(':', 1)
+        rules[target.strip()] = symbols = []
+
+        for option in options.split('|'):
+            option = option.split()
+
+            if '%prec' in option:
+                i = option.index('%prec')
+                prec[(target.strip(), tuple(option[:i]))] = option[i + 1]
+                option = option[:i]
+
+            symbols.append(tuple(option))
+
+    return rules, prec
+
+
+class PrattParser(object):
+    """
+    Parser engine that parses the input of a parser (see parser.Parser) and
+    calls its handlers, without the generated Bison parser library. The input
+    is read using the parser's read method and preprocessed by its
+    hook_read_after method, line by line.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.rules, self.rule_prec = grammar_rules(parser)
+        self.levels = {}
+
+        for level, (assoc, tokens) in enumerate(parser.precedences):
+            for token in tokens:
+                self.levels[token] = level, assoc
+
+        # Operators that follow their left operand, which are the tokens of
+        # the rules "exp TOKEN" and "exp TOKEN exp" of the targets of "exp"
+        self.operators = {}
+
+        for target, options in self.rules.iteritems():
+            if (target,) not in self.rules['exp']:
+                continue
+
+            for symbols in options:
+                if len(symbols) > 1 and symbols[0] == 'exp':
+                    self.operators[symbols[1]] = target, symbols
+
+        self.lookahead = None
+        self.stream = None
+
+    def lines(self):
+        """
+        Read the input of the parser, and generate the preprocessed input in
+        chunks of complete lines, so that tokens are not split between two
+        chunks.
+        """
+        self.parser.hook_read_before()
+        data = self.parser.read(READ_SIZE)
+        buf = ''
+
+        while data:
+            buf += self.parser.hook_read_after(data)
+
+            if '\n' in buf:
+                lines, buf = buf.rsplit('\n', 1)
+                yield lines + '\n'
+
+            self.parser.hook_read_before()
+            data = self.parser.read(READ_SIZE)
+
+        if buf:
+            yield buf
+
+    def tokens(self):
+        """
+        Scan the input of the parser. Scanning stops at the "quit" keyword.
+        """
+        for data in self.lines():
+            for token in tokenize(data):
+                if token[0] == 'QUIT':
+                    return
+
+                yield token
+
+    def peek(self):
+        if self.lookahead is None:
+            self.lookahead = next(self.stream, ('$end', ''))
+
+        return self.lookahead[0]
+
+    def next(self):
+        self.peek()
+        token, self.lookahead = self.lookahead, None
+
+        return token
+
+    def expect(self, token):
+        if self.peek() != token:
+            self.error()
+
+        return self.next()[1]
+
+    def error(self):
+        token, text = self.next()
+
+        raise PrattSyntaxError('Syntax error at "%s" (token %s).'
+                               % (text.replace('\n', '\\n'), token))
+
+    def reduce(self, target, symbols, values):
+        """
+        Call the handler of a rule, and the hook_handler of the parser with its
+        return value.
+        """
+        option = self.rules[target].index(symbols)
+        names = list(symbols)
+        retval = getattr(self.parser, 'on_' + target)(target, option, names,
+                                                      values)
+
+        return self.parser.hook_handler(target, option, names, values, retval)
+
+    def reduce_exp(self, target, symbols, values):
+        """
+        Reduce a rule of a target, followed by the rule "exp : target".
+        """
+        value = self.reduce(target, symbols, values)
+
+        return self.reduce('exp', (target,), [value])
+
+    def precedence(self, target, symbols):
+        """
+        Find the precedence token of a rule: its %prec token, or otherwise its
+        last terminal that has a precedence.
+        """
+        if (target, symbols) in self.rule_prec:
+            return self.rule_prec[(target, symbols)]
+
+        for symbol in reversed(symbols):
+            if symbol in self.levels:
+                return symbol
+
+    def shift(self, token, prec):
+        """
+        Resolve the conflict between shifting an operator token and reducing a
+        rule with precedence token prec.
+        """
+        if prec is None or token not in self.levels:
+            return True
+
+        level, assoc = self.levels[token]
+        rule_level = self.levels[prec][0]
+
+        if level != rule_level:
+            return level > rule_level
+
+        if assoc == 'nonassoc':
+            self.error()
+
+        return assoc == 'right'
+
+    def run(self):
+        """
+        Parse all input, and return the value of the last line (or None if
+        there is no input).
+        """
+        self.stream = self.tokens()
+        self.lookahead = None
+        value = self.reduce('input', (), [])
+
+        while self.peek() != '$end':
+            value = self.reduce('input', ('input', 'line'),
+                                [value, self.line()])
+
+        return value
+
+    def line(self):
+        token = self.peek()
+
+        if token == 'GRAPH':
+            values = [self.next()[1]]
+            values.append(self.expression(self.precedence('debug',
+                                                          ('GRAPH', 'exp'))))
+            values = [self.reduce('debug', ('GRAPH', 'exp'), values)]
+            symbols = ('debug', 'NEWLINE')
+        elif (token,) in self.rules['line'] \
+                or (token, 'NEWLINE') in self.rules['line']:
+            values = [self.next()[1]]
+            symbols = (token,)
+
+            if token == 'REWRITE' and self.peek() == 'NUMBER':
+                values.append(self.next()[1])
+                symbols += ('NUMBER',)
+
+            if token != 'NEWLINE':
+                symbols += ('NEWLINE',)
+        else:
+            values = [self.expression(None)]
+            symbols = ('exp', 'NEWLINE')
+
+        if symbols[-1] == 'NEWLINE' and len(values) < len(symbols):
+            values.append(self.expect('NEWLINE'))
+
+        if symbols not in self.rules['line']:
+            self.error()
+
+        return self.reduce('line', symbols, values)
+
+    def expression(self, prec):
+        """
+        Parse an expression that is the last symbol of a rule with precedence
+        token prec. Operators are applied to the expression for as long as
+        they are shifted instead of reducing the rule.
+        """
+        left = self.operand()
+
+        while self.peek() in self.operators and self.shift(self.peek(), prec):
+            target, symbols = self.operators[self.peek()]
+            values = [left, self.next()[1]]
+
+            if len(symbols) == 3:
+                values.append(self.expression(self.precedence(target,
+                                                              symbols)))
+
+            left = self.reduce_exp(target, symbols, values)
+
+        return left
+
+    def operand(self):
+        """
+        Parse an expression that starts with a prefix operator, an opening
+        parenthesis or a terminal.
+        """
+        token, text = self.next()
+
+        if token in ('NUMBER', 'IDENTIFIER'):
+            return self.reduce('exp', (token,), [text])
+
+        if token in ('LPAREN', 'LBRACKET', 'LCBRACKET'):
+            symbols = (token, 'exp', token.replace('L', 'R', 1))
+            values = [text, self.expression(None), self.expect(symbols[2])]
+
+            return self.reduce('exp', symbols, values)
+
+        if token in ('FUNCTION_PAREN', 'PIPE'):
+            symbols = (token, 'exp', 'RPAREN' if token != 'PIPE' else 'PIPE')
+            values = [text, self.expression(None), self.expect(symbols[2])]
+
+            return self.reduce_exp('unary', symbols, values)
+
+        # Raised functions and logarithms with a subscript base, and integrals
+        # with bounds, are the prefix of a unary rule
+        if self.peek() in ('POW', 'SUB') \
+                and token in ('FUNCTION', 'LOGARITHM', 'INTEGRAL'):
+            symbols = (token, self.peek(), 'exp')
+
+            for target in ('raised_function', 'logarithm_subscript',
+                           'integral_bounds'):
+                if symbols in self.rules[target]:
+                    break
+            else:
+                self.error()
+
+            values = [text, self.next()[1],
+                      self.expression(self.precedence(target, symbols))]
+            token = target
+            text = self.reduce(target, symbols, values)
+
+        symbols = (token, 'exp')
+
+        if symbols not in self.rules['unary']:
+            self.lookahead = token, text
+            self.error()
+
+        values = [text, self.expression(self.precedence('unary', symbols))]
+
+        return self.reduce_exp('unary', symbols, values)
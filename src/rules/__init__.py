@@ -47,6 +47,7 @@ from .integrals import match_solve_definite, match_constant_integral, \
 from .lineq import match_move_term, match_multiple_equations, match_double_case
 from .absolute import match_factor_out_abs_term
 from .sqrt import match_reduce_sqrt
+from .patterns import DiscriminationNet
 
 
 RULES = {
@@ -62,8 +63,10 @@ RULES = {
                  match_negated_division, match_extract_fraction_terms,
                  match_division_in_denominator, match_fraction_in_division,
                  match_remove_division_negation],
-        OP_POW: [match_multiply_exponents, match_duplicate_exponent,
-                 match_raised_fraction, match_remove_negative_child,
+        OP_POW: [DiscriminationNet(match_multiply_exponents,
+                                   match_duplicate_exponent,
+                                   match_raised_fraction),
+                 match_remove_negative_child,
                  match_exponent_to_root, match_extend_exponent,
                  match_constant_exponent, match_raise_numerics,
                  match_raised_base],
@@ -79,7 +82,8 @@ RULES = {
                  match_quotient_rule],
         OP_LOG: [match_constant_logarithm, match_factor_out_exponent,
                  match_expand_terms],
-        OP_INT: [match_integrate_variable_power, match_constant_integral,
+        OP_INT: [DiscriminationNet(match_integrate_variable_power,
+                                   match_constant_integral),
                  match_factor_out_constant, match_division_integral,
                  match_function_integral, match_sum_rule_integral],
         OP_INT_DEF: [match_remove_definite_constant, match_solve_definite],
@@ -90,3 +94,7 @@ RULES = {
         OP_OR: [match_double_case],
         }
 RULES[OP_DXDER] = RULES[OP_PRIME] = RULES[OP_DER]
+
+# Match functions that accept a MatchContext as second argument, which is
+# shared by all match functions that are run on the same node
+CONTEXT_RULES = set(RULES[OP_ADD] + RULES[OP_MUL])
@@ -14,8 +14,8 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import product
 
-from .utils import is_numeric_node
-from ..node import ExpressionNode as N, Scope, OP_ADD, OP_MUL
+from .utils import is_numeric_node, MatchContext, REQUIREMENTS
+from ..node import ExpressionNode as N, Scope, OP_ADD, OP_MUL, op_feature
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
@@ -29,7 +29,7 @@ def is_expandable(node):
             and not all(map(is_numeric_node, Scope(node)))
 
 
-def match_expand(node):
+def match_expand(node, context=None):
     """
     Expand multiplication of non-numeric additions.
 
@@ -41,7 +41,7 @@ def match_expand(node):
     assert node.is_op(OP_MUL)
 
     p = []
-    scope = Scope(node)
+    scope = (context or MatchContext(node)).scope
     l = len(scope)
 
     for distance in range(1, l):
@@ -58,6 +58,9 @@ def match_expand(node):
     return p
 
 
+REQUIREMENTS[match_expand] = [op_feature(OP_ADD)]
+
+
 def expand(root, args):
     """
     a(b + c)        ->  ab + ac
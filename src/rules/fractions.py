@@ -14,10 +14,10 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import combinations, product, ifilterfalse
 
-from .utils import least_common_multiple, partition, is_numeric_node, \
-        evals_to_numeric
+from .utils import least_common_multiple, is_numeric_node, \
+        evals_to_numeric, MatchContext, REQUIREMENTS
 from ..node import ExpressionNode as N, ExpressionLeaf as L, Scope, OP_DIV, \
-        OP_ADD, OP_MUL, negate
+        OP_ADD, OP_MUL, negate, op_feature
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 from .negation import negate_polynome
@@ -84,7 +84,7 @@ def division_by_self(root, args):
 MESSAGES[division_by_self] = _('Division of {1} by itself reduces to `1`.')
 
 
-def match_add_fractions(node):
+def match_add_fractions(node, context=None):
     """
     a / b + c / b and a, c in Z        ->  (a + c) / b
     a / b + c / d and a, b, c, d in Z  ->  a' / e + c' / e  # e = lcm(b, d)
@@ -94,9 +94,10 @@ def match_add_fractions(node):
     assert node.is_op(OP_ADD)
 
     p = []
-    scope = Scope(node)
-    fractions, others = partition(lambda n: n.is_op(OP_DIV), scope)
-    numerics = filter(is_numeric_node, others)
+    context = context or MatchContext(node)
+    scope = context.scope
+    fractions = context.fractions
+    numerics = context.numerics
 
     for ab, cd in combinations(fractions, 2):
         a, b = ab
@@ -131,6 +132,9 @@ def match_add_fractions(node):
     return p
 
 
+REQUIREMENTS[match_add_fractions] = [op_feature(OP_DIV)]
+
+
 def add_nominators(root, args):
     """
     a / b + c / b and a, c in Z  ->  (a + c) / b
@@ -192,7 +196,7 @@ MESSAGES[constant_to_fraction] = \
         _('Rewrite constant {3} to a fraction to be able to add it to {2}.')
 
 
-def match_multiply_fractions(node):
+def match_multiply_fractions(node, context=None):
     """
     a / b * c / d  ->  (ac) / (bd)
     a / b * c and (eval(c) in Z or eval(a / b) not in Z)  ->  (ac) / b
@@ -200,8 +204,10 @@ def match_multiply_fractions(node):
     assert node.is_op(OP_MUL)
 
     p = []
-    scope = Scope(node)
-    fractions, others = partition(lambda n: n.is_op(OP_DIV), scope)
+    context = context or MatchContext(node)
+    scope = context.scope
+    fractions = context.fractions
+    others = [n for n in scope if not n.is_op(OP_DIV)]
 
     for ab, cd in combinations(fractions, 2):
         p.append(P(node, multiply_fractions, (scope, ab, cd)))
@@ -213,6 +219,9 @@ def match_multiply_fractions(node):
     return p
 
 
+REQUIREMENTS[match_multiply_fractions] = [op_feature(OP_DIV)]
+
+
 def multiply_fractions(root, args):
     """
     a / b * (c / d)  ->  ac / (bd)
@@ -277,6 +286,9 @@ def match_divide_fractions(node):
     return p
 
 
+REQUIREMENTS[match_divide_fractions] = [op_feature(OP_DIV)]
+
+
 def divide_fraction(root, args):
     """
     a / b / c  ->  a / (bc)
@@ -453,6 +465,9 @@ def match_division_in_denominator(node):
             for n in Scope(denom) if n.is_op(OP_DIV)]
 
 
+REQUIREMENTS[match_division_in_denominator] = [op_feature(OP_ADD)]
+
+
 def multiply_with_term(root, args):
     """
     a / (b / c + d)  ->  (ca) / (c(b / c + d))
@@ -467,14 +482,15 @@ MESSAGES[multiply_with_term] = \
         _('Multiply nominator and denominator of {0} with {1}.')
 
 
-def match_combine_fractions(node):
+def match_combine_fractions(node, context=None):
     """
     a/b + c/d  ->  ad/(bd) + bc/(bd)  # ->  (ad + bc)/(bd)
     """
     assert node.is_op(OP_ADD)
 
-    scope = Scope(node)
-    fractions = [n for n in scope if n.is_op(OP_DIV)]
+    context = context or MatchContext(node)
+    scope = context.scope
+    fractions = context.fractions
     p = []
 
     for left, right in combinations(fractions, 2):
@@ -483,14 +499,17 @@ def match_combine_fractions(node):
     return p
 
 
+REQUIREMENTS[match_combine_fractions] = [op_feature(OP_DIV)]
+
+
 def combine_fractions(root, args):
     """
     a/b + c/d  ->  ad/(bd) + bc/(bd)
     """
     scope, ab, cd = args
     (a, b), (c, d) = ab, cd
-    a = negate(a, ab.negated)
-    d = negate(d, cd.negated)
+    a = negate(a, ab.negated, clone=True)
+    d = negate(d, cd.negated, clone=True)
 
     scope.replace(ab, a * d / (b * d) + b * c / (b * d))
     scope.remove(cd)
@@ -562,6 +581,9 @@ def match_fraction_in_division(node):
     return p
 
 
+REQUIREMENTS[match_fraction_in_division] = [op_feature(OP_MUL)]
+
+
 def fraction_in_division(root, args):
     """
     (1 / a * b) / c  ->  b / (ac)
@@ -14,23 +14,25 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import permutations
 
+from .utils import MatchContext, REQUIREMENTS
 from ..node import ExpressionNode as N, ExpressionLeaf as L, OP_ADD, OP_MUL, \
-        OP_DIV, OP_SIN, OP_COS, OP_TAN, OP_SQRT, PI, TYPE_OPERATOR, sin, cos, \
-        Scope, negate
+        OP_DIV, OP_SIN, OP_COS, OP_TAN, OP_SQRT, OP_POW, PI, TYPE_OPERATOR, \
+        sin, cos, Scope, negate, op_feature, FEATURE_NEGATED
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
 
-def match_add_quadrants(node):
+def match_add_quadrants(node, context=None):
     """
     sin(t) ^ 2 + cos(t) ^ 2  ->  1
     """
     assert node.is_op(OP_ADD)
 
     p = []
-    scope = Scope(node)
+    context = context or MatchContext(node)
+    scope = context.scope
 
-    for sin_q, cos_q in permutations(scope, 2):
+    for sin_q, cos_q in permutations(context.powers, 2):
         if sin_q.is_power(2) and cos_q.is_power(2):
             s, c = sin_q[0], cos_q[0]
 
@@ -47,6 +49,9 @@ def match_add_quadrants(node):
     return p
 
 
+REQUIREMENTS[match_add_quadrants] = [op_feature(OP_POW)]
+
+
 def add_quadrants(root, args):
     """
     sin(t) ^ 2 + cos(t) ^ 2  ->  1
@@ -94,6 +99,9 @@ def match_negated_parameter(node):
     return []
 
 
+REQUIREMENTS[match_negated_parameter] = [FEATURE_NEGATED]
+
+
 def negated_sinus_parameter(root, args):
     """
     sin(-t)  ->  -sin(t)
@@ -123,7 +131,7 @@ def match_half_pi_subtraction(node):
     """
     assert node.is_op(OP_SIN) or node.is_op(OP_COS)
 
-    if node[0].is_op(OP_ADD):
+    if node[0].is_op(OP_ADD) and len(node[0]) == 2:
         half_pi, t = node[0]
 
         if half_pi == L(PI) / 2:
@@ -133,6 +141,9 @@ def match_half_pi_subtraction(node):
     return []
 
 
+REQUIREMENTS[match_half_pi_subtraction] = [op_feature(OP_ADD)]
+
+
 def half_pi_subtraction_sinus(root, args):
     pass
 
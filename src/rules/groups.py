@@ -14,14 +14,14 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import combinations
 
-from .utils import evals_to_numeric
+from .utils import evals_to_numeric, MatchContext
 from ..node import ExpressionLeaf as Leaf, Scope, OP_ADD, OP_MUL, nary_node, \
         negate
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
 
-def match_combine_groups(node):
+def match_combine_groups(node, context=None):
     """
     Match possible combinations of groups of expressions using non-strict
     equivalence.
@@ -37,7 +37,7 @@ def match_combine_groups(node):
 
     p = []
     groups = []
-    scope = Scope(node)
+    scope = (context or MatchContext(node)).scope
 
     for n in scope:
         if not n.is_numeric():
@@ -60,7 +60,19 @@ def match_combine_groups(node):
 
                     groups.append((sub_node, g, n, False))
 
-    for (c0, g0, n0, root0), (c1, g1, n1, root1) in combinations(groups, 2):
+    # Only groups with equal canonical keys can be combined, so the pairs are
+    # formed within buckets of equal keys instead of comparing all groups
+    buckets = {}
+
+    for i, (c, g, n, root) in enumerate(groups):
+        buckets.setdefault(g.canonical_key(), []).append(i)
+
+    pairs = sorted([pair for indices in buckets.itervalues()
+                    for pair in combinations(indices, 2)])
+
+    for i, j in pairs:
+        (c0, g0, n0, root0), (c1, g1, n1, root1) = groups[i], groups[j]
+
         if not root0:
             c0 = c0.negate(n0.negated)
 
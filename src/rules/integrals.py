@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from .utils import find_variables, substitute, find_variable
+from .patterns import DiscriminationNet, Rule
 from ..node import ExpressionLeaf as L, OP_INT, OP_INT_DEF, OP_MUL, OP_DIV, \
         OP_LOG, OP_SIN, OP_COS, Scope, sin, cos, ln, integral, int_def, \
         absolute, OP_ADD, negate
@@ -91,27 +92,6 @@ def solve_definite_msg(root, args):  # pragma: nocover
 MESSAGES[solve_definite] = solve_definite_msg
 
 
-def match_integrate_variable_power(node):
-    """
-    int x ^ n dx  ->  1 / (n + 1) * x ^ (n + 1)
-    int g ^ x dx  ->  g ^ x / ln(g)
-    """
-    assert node.is_op(OP_INT)
-
-    f, x = node[:2]
-
-    if f.is_power() and not f.negated:
-        root, exponent = f
-
-        if root == x and not exponent.contains(x):
-            return [P(node, integrate_variable_root)]
-
-        if exponent == x and not root.contains(x):
-            return [P(node, integrate_variable_exponent)]
-
-    return []
-
-
 def integrate_variable_root(root, args):
     """
     int x ^ n dx  ->  1 / (n + 1) * x ^ (n + 1)
@@ -138,22 +118,34 @@ MESSAGES[integrate_variable_exponent] = \
         _('Apply standard integral `int(g ^ x) = g ^ x / ln(g) + c`.')
 
 
-def match_constant_integral(node):
+def is_root_power(node, x, n, **bounds):
     """
-    int x dx  ->  int x ^ 1 dx  # ->  x ^ 2 / 2 + c
-    int c dx  ->  cx
+    Side condition of `int x ^ n dx`: the power is not negated and its
+    exponent does not contain x.
     """
-    assert node.is_op(OP_INT)
+    return not node[0].negated and not n.contains(x)
 
-    fx, x = node[:2]
 
-    if fx == x:
-        return [P(node, single_variable_integral)]
+def is_exponent_power(node, g, x, **bounds):
+    """
+    Side condition of `int g ^ x dx`: the power is not negated and its root
+    does not contain x.
+    """
+    return not node[0].negated and not g.contains(x)
 
-    if not fx.contains(x):
-        return [P(node, constant_integral)]
 
-    return []
+# int x ^ n dx  ->  1 / (n + 1) * x ^ (n + 1)
+# int g ^ x dx  ->  g ^ x / ln(g)
+# Definite integrals have two additional children for the bounds
+match_integrate_variable_power = DiscriminationNet(
+        Rule(lambda x, n: integral(x ** n, x), integrate_variable_root,
+             condition=is_root_power),
+        Rule(lambda x, n, a, b: integral(x ** n, x, a, b),
+             integrate_variable_root, condition=is_root_power),
+        Rule(lambda g, x: integral(g ** x, x), integrate_variable_exponent,
+             condition=is_exponent_power),
+        Rule(lambda g, x, a, b: integral(g ** x, x, a, b),
+             integrate_variable_exponent, condition=is_exponent_power))
 
 
 def single_variable_integral(root, args):
@@ -180,6 +172,24 @@ MESSAGES[constant_integral] = _('{0[0]} does not contain {0[1]}, so its ' \
         'integral over {0[1]} is its multiplication with {0[1]}.')
 
 
+def is_constant_function(node, c, x, **bounds):
+    """
+    Side condition of `int c dx`: c does not contain x.
+    """
+    return not c.contains(x)
+
+
+# int x dx  ->  int x ^ 1 dx  # ->  x ^ 2 / 2 + c
+# int c dx  ->  cx
+match_constant_integral = DiscriminationNet(
+        Rule(lambda x: integral(x, x), single_variable_integral),
+        Rule(lambda x, a, b: integral(x, x, a, b), single_variable_integral),
+        Rule(lambda c, x: integral(c, x), constant_integral,
+             condition=is_constant_function),
+        Rule(lambda c, x, a, b: integral(c, x, a, b), constant_integral,
+             condition=is_constant_function))
+
+
 def match_factor_out_constant(node):
     """
     int cf(x) dx  ->  c int f(x) dx
@@ -14,9 +14,9 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import permutations, combinations
 
-from .utils import find_variable, evals_to_numeric, substitute
+from .utils import find_variable, evals_to_numeric, substitute, REQUIREMENTS
 from ..node import ExpressionLeaf as L, Scope, OP_EQ, OP_ADD, OP_MUL, OP_DIV, \
-        eq, OP_ABS, OP_AND, OP_OR
+        eq, OP_ABS, OP_AND, OP_OR, op_feature
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
@@ -196,6 +196,9 @@ def match_multiple_equations(node):
     return p
 
 
+REQUIREMENTS[match_multiple_equations] = [op_feature(OP_EQ)]
+
+
 def substitute_variable(root, args):
     """
     Substitution rule:
@@ -15,9 +15,11 @@
 from itertools import combinations, product, ifilterfalse
 import math
 
-from .utils import find_variables, partition, divides, is_numeric_node
+from .utils import find_variables, partition, divides, is_numeric_node, \
+        MatchContext, REQUIREMENTS
 from ..node import ExpressionLeaf as L, OP_LOG, OP_ADD, OP_MUL, OP_POW, \
-        Scope, log, DEFAULT_LOGARITHM_BASE, E, OP_DIV
+        Scope, log, DEFAULT_LOGARITHM_BASE, E, OP_DIV, op_feature, \
+        FEATURE_NUMERIC
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
@@ -87,7 +89,7 @@ def divide_same_base(root, args):
 MESSAGES[divide_same_base] = _('Apply `log_b(a) = log(a) / log(b)` on {0}.')
 
 
-def match_add_logarithms(node):
+def match_add_logarithms(node, context=None):
     """
     log(a) + log(b) and a,b in Z   ->  log(ab)
     -log(a) - log(b) and a,b in Z  ->  -(log(a) + log(b))  # ->  -log(ab)
@@ -97,8 +99,9 @@ def match_add_logarithms(node):
     assert node.is_op(OP_ADD)
 
     p = []
-    scope = Scope(node)
-    logarithms = filter(lambda n: n.is_op(OP_LOG), scope)
+    context = context or MatchContext(node)
+    scope = context.scope
+    logarithms = context.logarithms
 
     for log_a, log_b in combinations(logarithms, 2):
         # Compare base
@@ -127,6 +130,9 @@ def match_add_logarithms(node):
     return p
 
 
+REQUIREMENTS[match_add_logarithms] = [op_feature(OP_LOG)]
+
+
 def add_logarithms(root, args):
     """
     log(a) + log(b)  ->  log(ab)
@@ -206,6 +212,9 @@ def match_raised_base(node):
     return p
 
 
+REQUIREMENTS[match_raised_base] = [op_feature(OP_LOG, OP_MUL)]
+
+
 def factor_in_exponent_multiplicant(root, args):
     """
     g ^ (b * log_g(a))  ->  g ^ log_g(a ^ b)
@@ -263,6 +272,10 @@ def match_factor_out_exponent(node):
     return p
 
 
+REQUIREMENTS[match_factor_out_exponent] = \
+        [op_feature(OP_POW) | FEATURE_NUMERIC]
+
+
 def split_negative_exponent(root, args):
     """
     log(a ^ -b)  ->  log((a ^ b) ^ -1)  # =>*  -log(a ^ b)
@@ -308,7 +321,7 @@ def make_raised_base(root, args):
 MESSAGES[make_raised_base] = _('Write {0[0]} as a power of {0[1]}.')
 
 
-def match_factor_in_multiplicant(node):
+def match_factor_in_multiplicant(node, context=None):
     """
     Only bring a multiplicant inside a logarithm if both the multiplicant and
     the logaritm's content are constants. This will yield a new simplification
@@ -318,10 +331,11 @@ def match_factor_in_multiplicant(node):
     """
     assert node.is_op(OP_MUL)
 
-    scope = Scope(node)
-    constants = filter(lambda n: n.is_int(), scope)
-    logarithms = filter(lambda n: n.is_op(OP_LOG) \
-                                  and not len(find_variables(n)), scope)
+    context = context or MatchContext(node)
+    scope = context.scope
+    constants = filter(lambda n: n.is_int(), context.numerics)
+    logarithms = filter(lambda n: not len(find_variables(n)),
+                        context.logarithms)
     p = []
 
     for constant, logarithm in product(constants, logarithms):
@@ -330,6 +344,10 @@ def match_factor_in_multiplicant(node):
     return p
 
 
+REQUIREMENTS[match_factor_in_multiplicant] = \
+        [op_feature(OP_LOG), FEATURE_NUMERIC]
+
+
 def factor_in_multiplicant(root, args):
     """
     alog(b)  ->  log(b ^ a)
@@ -367,6 +385,9 @@ def match_expand_terms(node):
     return []
 
 
+REQUIREMENTS[match_expand_terms] = [op_feature(OP_MUL, OP_DIV)]
+
+
 def expand_multiplication_terms(root, args):
     """
     log(ab) and a not in Z  ->  log(a) + log(b)
@@ -12,12 +12,13 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from ..node import Scope, OP_ADD, OP_MUL, OP_DIV
+from .utils import MatchContext, REQUIREMENTS
+from ..node import Scope, OP_ADD, OP_MUL, OP_DIV, FEATURE_NEGATED
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
 
-def match_negated_factor(node):
+def match_negated_factor(node, context=None):
     """
     This rule assures that negations in the scope of a multiplication are
     brought to the multiplication itself.
@@ -29,7 +30,7 @@ def match_negated_factor(node):
     assert node.is_op(OP_MUL)
 
     p = []
-    scope = Scope(node)
+    scope = (context or MatchContext(node)).scope
 
     for factor in scope:
         if factor.negated:
@@ -38,6 +39,9 @@ def match_negated_factor(node):
     return p
 
 
+REQUIREMENTS[match_negated_factor] = [FEATURE_NEGATED]
+
+
 def negated_factor(root, args):
     """
     (-a)b   ->  -ab
@@ -138,6 +142,9 @@ def match_negated_division(node):
     return p
 
 
+REQUIREMENTS[match_negated_division] = [FEATURE_NEGATED]
+
+
 def negated_nominator(root, args):
     """
     (-a) / b  ->  -a / b
@@ -14,14 +14,15 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import combinations
 
-from .utils import greatest_common_divisor, is_numeric_node
+from .utils import greatest_common_divisor, is_numeric_node, MatchContext, \
+        REQUIREMENTS
 from ..node import ExpressionLeaf as Leaf, Scope, OP_ADD, OP_DIV, OP_MUL, \
-        OP_POW
+        OP_POW, FEATURE_NUMERIC
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
 
-def match_add_numerics(node):
+def match_add_numerics(node, context=None):
     """
     Combine two constants to a single constant in an n-ary addition.
 
@@ -36,13 +37,14 @@ def match_add_numerics(node):
     assert node.is_op(OP_ADD)
 
     p = []
-    scope = Scope(node)
+    context = context or MatchContext(node)
+    scope = context.scope
     numerics = []
 
-    for n in scope:
+    for n in context.numerics:
         if n == 0:
             p.append(P(node, remove_zero, (scope, n)))
-        elif n.is_numeric():
+        else:
             numerics.append(n)
 
     for c0, c1 in combinations(numerics, 2):
@@ -51,6 +53,9 @@ def match_add_numerics(node):
     return p
 
 
+REQUIREMENTS[match_add_numerics] = [FEATURE_NUMERIC]
+
+
 def remove_zero(root, args):
     """
     0 + a  ->  a
@@ -137,6 +142,9 @@ def match_divide_numerics(node):
     return []
 
 
+REQUIREMENTS[match_divide_numerics] = [FEATURE_NUMERIC]
+
+
 def divide_numerics(root, args):
     """
     Combine two divided constants into a single constant.
@@ -174,7 +182,7 @@ MESSAGES[reduce_fraction_constants] = \
         _('Divide the nominator and denominator of fraction {0} by {1}.')
 
 
-def match_multiply_numerics(node):
+def match_multiply_numerics(node, context=None):
     """
     3 * 2      ->  6
     3.0 * 2    ->  6.0
@@ -184,8 +192,9 @@ def match_multiply_numerics(node):
     assert node.is_op(OP_MUL)
 
     p = []
-    scope = Scope(node)
-    numerics = filter(is_numeric_node, scope)
+    context = context or MatchContext(node)
+    scope = context.scope
+    numerics = context.numerics
 
     for n in numerics:
         if n.value == 0:
@@ -200,6 +209,9 @@ def match_multiply_numerics(node):
     return p
 
 
+REQUIREMENTS[match_multiply_numerics] = [FEATURE_NUMERIC]
+
+
 def multiply_zero(root, args):
     """
     0 * a   ->  0
@@ -263,6 +275,9 @@ def match_raise_numerics(node):
     return []
 
 
+REQUIREMENTS[match_raise_numerics] = [FEATURE_NUMERIC]
+
+
 def raise_numerics(root, args):
     """
     2 ^ 3     ->  8
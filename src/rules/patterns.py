@@ -0,0 +1,206 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Declarative rewrite rules. Instead of writing a match function, a rule is
+declared as a pattern expression with an optional side condition, e.g.:
+
+    match_multiply_exponents = DiscriminationNet(
+            Rule(lambda a, p, q: (a ** p) ** q, multiply_exponents,
+                 args=lambda node, a, p, q: (a, p, q)))
+
+The arguments of the pattern function are the variables of the pattern, each
+of which matches any subtree. A variable that occurs multiple times only
+matches strictly equal subtrees, and numeric leaves in a pattern only match
+equal leaves. Operator nodes in a pattern match nodes with the same operator
+and number of children, regardless of their negation; negations can be checked
+in the side condition.
+
+The patterns of all rules in a discrimination net are stored in a single trie
+of preorder symbols, so that all rules are matched in one pass over a node.
+"""
+from ..node import ExpressionLeaf as L
+from ..possibilities import Possibility as P
+
+
+# Symbol of a pattern variable or numeric leaf in the preorder symbols of a
+# pattern, which matches any subtree
+WILDCARD = None
+
+
+def pattern_symbols(pattern):
+    """
+    Create the list of preorder symbols of a pattern expression, along with
+    the list of pattern leaves that correspond to the wildcard symbols.
+    """
+    symbols = []
+    leaves = []
+    stack = [pattern]
+
+    while stack:
+        node = stack.pop()
+
+        if node.negated:
+            raise ValueError('Negation "%s" in pattern "%s" should be checked '
+                             'in a side condition.' % (node, pattern))
+
+        if node.is_leaf:
+            symbols.append(WILDCARD)
+            leaves.append(node)
+        else:
+            symbols.append((node.op, len(node)))
+            stack.extend(reversed(node.nodes))
+
+    return symbols, leaves
+
+
+class Rule(object):
+    """
+    Rewrite rule that creates a possibility with the specified rewrite handler
+    for nodes that match a pattern and meet a side condition. The pattern is
+    a function that builds the pattern expression from its variables. The
+    optional args and condition functions are called with the matched node and
+    the subtrees bound to the variables as keyword arguments.
+    """
+
+    def __init__(self, pattern, handler, args=None, condition=None):
+        names = pattern.func_code.co_varnames[:pattern.func_code.co_argcount]
+        self.pattern = pattern(*map(L, names))
+        self.symbols, self.leaves = pattern_symbols(self.pattern)
+        self.handler = handler
+        self.args = args
+        self.condition = condition
+
+    def __repr__(self):
+        return '<Rule pattern="%s" handler=%s>' \
+                % (self.pattern, self.handler.func_name)
+
+    def bind(self, terms):
+        """
+        Bind the subtrees that are matched by the wildcard symbols of the
+        pattern to its variables. Return None if a repeated variable or a
+        numeric leaf does not match.
+        """
+        bindings = {}
+
+        for leaf, term in zip(self.leaves, terms):
+            if not leaf.is_identifier():
+                if not term == leaf:
+                    return None
+            elif leaf.value not in bindings:
+                bindings[leaf.value] = term
+            elif not bindings[leaf.value] == term:
+                return None
+
+        return bindings
+
+    def possibility(self, node, bindings):
+        """
+        Create a possibility for a matched node, or None if the node does not
+        meet the side condition of the rule.
+        """
+        if self.condition and not self.condition(node, **bindings):
+            return None
+
+        if self.args:
+            return P(node, self.handler, self.args(node, **bindings))
+
+        return P(node, self.handler)
+
+
+class DiscriminationNet(object):
+    """
+    Match function for a sequence of rules, which are compiled into a trie of
+    the preorder symbols of their patterns. The trie is traversed once for a
+    node, following both the symbol of each subtree and the wildcard symbol.
+    Other discrimination nets can be passed to combine their rules. The
+    possibilities are returned in the order of the rules.
+    """
+
+    def __init__(self, *matches):
+        self.rules = []
+        self.root = ({}, [])
+
+        for match in matches:
+            for rule in getattr(match, 'rules', [match]):
+                self.add(rule)
+
+    def __repr__(self):
+        return '<DiscriminationNet rules=%s>' % self.rules
+
+    @property
+    def handlers(self):
+        return set([rule.handler for rule in self.rules])
+
+    def add(self, rule):
+        """
+        Add the preorder symbols of a rule's pattern to the trie.
+        """
+        edges, rules = self.root
+
+        for symbol in rule.symbols:
+            if symbol not in edges:
+                edges[symbol] = ({}, [])
+
+            edges, rules = edges[symbol]
+
+        rules.append((len(self.rules), rule))
+        self.rules.append(rule)
+
+    def match(self, node):
+        """
+        Find the rules whose patterns match a node structurally, along with
+        the subtrees matched by their wildcard symbols. The list of subtrees
+        that still have to be matched is used as a stack.
+        """
+        matches = []
+        states = [(self.root, [node], [])]
+
+        while states:
+            (edges, rules), terms, bound = states.pop()
+
+            if not terms:
+                matches += [(i, rule, bound) for i, rule in rules]
+                continue
+
+            term = terms[-1]
+            rest = terms[:-1]
+
+            if WILDCARD in edges:
+                states.append((edges[WILDCARD], rest, bound + [term]))
+
+            if not term.is_leaf:
+                symbol = (term.op, len(term))
+
+                if symbol in edges:
+                    states.append((edges[symbol], rest + term.nodes[::-1],
+                                   bound))
+
+        matches.sort(key=lambda m: m[0])
+
+        return [(rule, terms) for i, rule, terms in matches]
+
+    def __call__(self, node):
+        p = []
+
+        for rule, terms in self.match(node):
+            bindings = rule.bind(terms)
+
+            if bindings is not None:
+                pos = rule.possibility(node, bindings)
+
+                if pos is not None:
+                    p.append(pos)
+
+        return p
@@ -14,13 +14,17 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 from itertools import combinations
 
+from .utils import MatchContext, REQUIREMENTS
+from .patterns import DiscriminationNet, Rule
 from ..node import ExpressionNode as N, ExpressionLeaf as L, Scope, \
-                   OP_MUL, OP_DIV, OP_POW, OP_ADD, OP_SQRT, negate
+                   OP_MUL, OP_DIV, OP_POW, OP_ADD, OP_SQRT, negate, \
+                   op_feature, FEATURE_NUMERIC, FEATURE_IDENTIFIER, \
+                   FEATURE_NEGATED
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
 
 
-def match_add_exponents(node):
+def match_add_exponents(node, context=None):
     """
     a^p * a^q  ->  a^(p + q)
     a * a^q    ->  a^(1 + q)
@@ -32,7 +36,7 @@ def match_add_exponents(node):
 
     p = []
     powers = {}
-    scope = Scope(node)
+    scope = (context or MatchContext(node)).scope
 
     for n in scope:
         # Order powers by their roots, e.g. a^p and a^q are put in the same
@@ -62,6 +66,9 @@ def match_add_exponents(node):
     return p
 
 
+REQUIREMENTS[match_add_exponents] = [op_feature(OP_POW) | FEATURE_IDENTIFIER]
+
+
 def add_exponents(root, args):
     """
     a^p * a^q  ->  a^(p + q)
@@ -82,32 +89,6 @@ def add_exponents(root, args):
 MESSAGES[add_exponents] = _('Add the exponents of {2} and {3}.')
 
 
-def match_subtract_exponents(node):
-    """
-    a^p / a^q  ->  a^(p - q)
-    a^p / a    ->  a^(p - 1)
-    a / a^q    ->  a^(1 - q)
-    """
-    assert node.is_op(OP_DIV)
-
-    left, right = node
-    left_pow, right_pow = left.is_op(OP_POW), right.is_op(OP_POW)
-
-    if left_pow and right_pow and left[0] == right[0]:
-        # A power is divided by a power with the same root
-        return [P(node, subtract_exponents, tuple(left) + (right[1],))]
-
-    if left_pow and left[0] == right:
-        # A power is divided by a its root
-        return [P(node, subtract_exponents, tuple(left) + (1,))]
-
-    if right_pow and left == right[0]:
-        # An identifier is divided by a power of itself
-        return [P(node, subtract_exponents, (left, 1, right[1]))]
-
-    return []
-
-
 def subtract_exponents(root, args):
     """
     a^p / a^q  ->  a^(p - q)
@@ -120,18 +101,22 @@ def subtract_exponents(root, args):
 MESSAGES[subtract_exponents] = _('Substract the exponents {2} and {3}.')
 
 
-def match_multiply_exponents(node):
-    """
-    (a^p)^q  ->  a^(pq)
-    """
-    assert node.is_op(OP_POW)
-
-    left, right = node
+# a^p / a^q  ->  a^(p - q)
+# a^p / a    ->  a^(p - 1)
+# a / a^q    ->  a^(1 - q)
+match_subtract_exponents = DiscriminationNet(
+        # A power is divided by a power with the same root
+        Rule(lambda a, p, q: a ** p / a ** q, subtract_exponents,
+             args=lambda node, a, p, q: (a, p, q)),
+        # A power is divided by a its root
+        Rule(lambda a, p: a ** p / a, subtract_exponents,
+             args=lambda node, a, p: (a, p, 1)),
+        # An identifier is divided by a power of itself
+        Rule(lambda a, q: a / a ** q, subtract_exponents,
+             args=lambda node, a, q: (a, 1, q)))
 
-    if left.is_op(OP_POW):
-        return [P(node, multiply_exponents, tuple(left) + (right,))]
 
-    return []
+REQUIREMENTS[match_subtract_exponents] = [op_feature(OP_POW)]
 
 
 def multiply_exponents(root, args):
@@ -146,18 +131,10 @@ def multiply_exponents(root, args):
 MESSAGES[multiply_exponents] = _('Multiply the exponents {2} and {3}.')
 
 
-def match_duplicate_exponent(node):
-    """
-    (ab)^p  ->  a^p * b^p
-    """
-    assert node.is_op(OP_POW)
-
-    root, exponent = node
-
-    if root.is_op(OP_MUL):
-        return [P(node, duplicate_exponent, (list(Scope(root)), exponent))]
-
-    return []
+# (a^p)^q  ->  a^(pq)
+match_multiply_exponents = DiscriminationNet(
+        Rule(lambda a, p, q: (a ** p) ** q, multiply_exponents,
+             args=lambda node, a, p, q: (a, p, q)))
 
 
 def duplicate_exponent(root, args):
@@ -177,18 +154,10 @@ def duplicate_exponent(root, args):
 MESSAGES[duplicate_exponent] = _('Duplicate the exponent {2}.')
 
 
-def match_raised_fraction(node):
-    """
-    (a / b) ^ p  ->  a^p / b^p
-    """
-    assert node.is_op(OP_POW)
-
-    root, exponent = node
-
-    if root.is_op(OP_DIV):
-        return [P(node, raised_fraction, (root, exponent))]
-
-    return []
+# (ab)^p  ->  a^p * b^p
+match_duplicate_exponent = DiscriminationNet(
+        Rule(lambda a, b, p: (a * b) ** p, duplicate_exponent,
+             args=lambda node, a, b, p: (list(Scope(node[0])), p)))
 
 
 def raised_fraction(root, args):
@@ -204,6 +173,12 @@ MESSAGES[raised_fraction] = _('Apply the exponent {2} to the nominator and'
         ' denominator of fraction {1}.')
 
 
+# (a / b) ^ p  ->  a^p / b^p
+match_raised_fraction = DiscriminationNet(
+        Rule(lambda a, b, p: (a / b) ** p, raised_fraction,
+             args=lambda node, a, b, p: (node[0], p)))
+
+
 def match_remove_negative_child(node):
     """
     a ^ -p                           ->  1 / a ^ p
@@ -223,6 +198,9 @@ def match_remove_negative_child(node):
     return pos
 
 
+REQUIREMENTS[match_remove_negative_child] = [FEATURE_NEGATED]
+
+
 def remove_negative_exponent(root, args):
     """
     a ^ -p  ->  1 / a ^ p
@@ -262,6 +240,9 @@ def match_exponent_to_root(node):
     return []
 
 
+REQUIREMENTS[match_exponent_to_root] = [op_feature(OP_DIV)]
+
+
 def exponent_to_root(root, args):
     """
     a^(1 / 2)  ->  sqrt(a)
@@ -296,6 +277,9 @@ def match_extend_exponent(node):
     return []
 
 
+REQUIREMENTS[match_extend_exponent] = [FEATURE_NUMERIC]
+
+
 def extend_exponent(root, args):
     """
     (a + ... + z)^n -> (a + ... + z)(a + ... + z)^(n - 1)  # n > 1
@@ -328,6 +312,9 @@ def match_constant_exponent(node):
     return []
 
 
+REQUIREMENTS[match_constant_exponent] = [FEATURE_NUMERIC]
+
+
 def remove_power_of_zero(root, args):
     """
     a ^ 0  ->  1
@@ -111,11 +111,6 @@ RELATIVE = [
         ]
 
 
-# Convert to dictionaries for efficient lookup
-HIGH = dict([(h, i) for i, h in enumerate(HIGH)])
-LOW = dict([(h, i) for i, h in enumerate(LOW)])
-
-
 # List of implicit rules. Implicit rules are considered trivial and are
 # therefore not printed in verbose rewrite_all mode
 IMPLICIT_RULES = [
@@ -12,7 +12,7 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from .utils import iter_pairs, evals_to_numeric
+from .utils import iter_pairs, evals_to_numeric, MatchContext
 from ..node import ExpressionNode as N, Scope, OP_ADD, OP_MUL
 from ..possibilities import Possibility as P, MESSAGES
 from ..translate import _
@@ -127,7 +127,7 @@ def swap_poly((left, right)):
     return left_var > right_var
 
 
-def match_sort_monomial(node):
+def match_sort_monomial(node, context=None):
     """
     Sort a monomial, pursuing the following form:
     x^0 * x^1 * ... * x^n
@@ -135,13 +135,13 @@ def match_sort_monomial(node):
     """
     assert node.is_op(OP_MUL)
 
-    scope = Scope(node)
+    scope = (context or MatchContext(node)).scope
 
     return [P(node, swap_factors, (scope, l, r))
             for l, r in filter(swap_mono, iter_pairs(scope))]
 
 
-def match_sort_polynome(node):
+def match_sort_polynome(node, context=None):
     """
     Sort a polynome, pursuing the following form:
     c_n * x^n * ... * c_1 * x^1 * c_0 * x^0
@@ -149,7 +149,7 @@ def match_sort_polynome(node):
     """
     assert node.is_op(OP_ADD)
 
-    scope = Scope(node)
+    scope = (context or MatchContext(node)).scope
 
     return [P(node, swap_factors, (scope, l, r))
             for l, r in filter(swap_poly, iter_pairs(scope))]
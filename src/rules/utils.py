@@ -12,8 +12,8 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from ..node import ExpressionNode as N, ExpressionLeaf as L, OP_MUL, OP_DIV, \
-        OP_ADD, OP_POW, OP_SQRT
+from ..node import ExpressionNode as N, ExpressionLeaf as L, Scope, OP_MUL, \
+        OP_DIV, OP_POW, OP_LOG, nary_node
 
 
 def greatest_common_divisor(a, b):
@@ -61,7 +61,7 @@ def is_fraction(node, nominator, denominator):
     if node.is_op(OP_MUL):
         # 1 / denominator * nominator
         # nominator * 1 / denominator
-        left, right = node
+        left, right = nary_node(OP_MUL, node[:-1]), node[-1]
         fraction = L(1) / denominator
 
         return (left == nominator and right == fraction) \
@@ -70,6 +70,54 @@ def is_fraction(node, nominator, denominator):
     return False
 
 
+# Features that the children of a node must have for a match function to be
+# able to match, see child_features(). Each requirement is a list of feature
+# bitmasks, of which each should have at least one feature in common with the
+# child features of the node
+REQUIREMENTS = {}
+
+
+def meets_requirements(match, features):
+    """
+    Check if the child features of a node meet the requirements of a match
+    function. Match functions without requirements always meet them.
+    """
+    for required in REQUIREMENTS.get(match, ()):
+        if not features & required:
+            return False
+
+    return True
+
+
+class MatchContext(object):
+    """
+    Scope of an n-ary node and partitions of its children, which are shared by
+    all match functions that are run on the node. This way, the scope is only
+    computed once per node instead of once per match function.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.scope = Scope(node)
+        self.numerics = []
+        self.fractions = []
+        self.powers = []
+        self.logarithms = []
+
+        for n in self.scope:
+            if n.is_numeric():
+                self.numerics.append(n)
+            elif n.is_op(OP_DIV):
+                self.fractions.append(n)
+            elif n.is_op(OP_POW):
+                self.powers.append(n)
+            elif n.is_op(OP_LOG):
+                self.logarithms.append(n)
+
+    def __repr__(self):
+        return '<MatchContext of "%s">' % repr(self.node)
+
+
 def partition(callback, iterable):
     """
     Partition an iterable into two parts using a callback that returns a
@@ -91,13 +139,7 @@ def find_variables(node):
     """
     Find all variables in a node.
     """
-    if node.is_variable():
-        return set([node.value])
-
-    if not node.is_leaf:
-        return reduce(lambda a, b: a | b, map(find_variables, node))
-
-    return set()
+    return set(node.attributes().variables)
 
 
 def first_sorted_variable(variables):
@@ -203,11 +245,7 @@ def evals_to_numeric(node):
     all leaves are numeric and there are only operators that can be
     considerered a constant or will evaluate to one (+, *, /, ^, sqrt).
     """
-    if node.is_leaf:
-        return node.is_numeric()
-
-    return node.op in (OP_ADD, OP_MUL, OP_DIV, OP_POW, OP_SQRT) \
-           and all(map(evals_to_numeric, node))
+    return node.attributes().numeric
 
 
 def iter_pairs(list_iterable):
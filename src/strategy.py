@@ -12,101 +12,611 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from node import OP_NEG, NARY_OPERATORS
-from rules import RULES
+from types import FunctionType, CodeType
+from collections import OrderedDict
+import threading
+
+from node import OP_NEG, NARY_OPERATORS, ExpressionBase, Scope, \
+        child_features
+from flat_tree import FlatTree
+from rules import RULES, CONTEXT_RULES
+from rules.utils import MatchContext, meets_requirements
 from rules.precedences import HIGH, LOW, RELATIVE
+from possibilities import Possibility as P
 
 
-def compare_possibilities(a, b):
+def find_cycle(edges):
     """
-    Comparable function for (possibility, depth) pairs.
-    Returns a positive number if A has a lower priority than B, a negative
-    number for the reverse case, and 0 if the possibilities have equal
-    priorities.
+    Find a cycle in a directed graph, given as a dictionary that maps each
+    node to a list of successors. Returns the list of nodes in the cycle, or
+    None if the graph is acyclic.
     """
-    (pa, da), (pb, db) = a, b
-    ha, hb = pa.handler, pb.handler
+    visited = set()
 
-    # Equal handlers means equal precedences
-    if ha == hb:
-        return 0
+    for start in edges:
+        if start in visited:
+            continue
 
-    # Check if A and B have a precedence relative to eachother
-    for rel in RELATIVE:
-        if ha in rel and hb in rel:
-            return cmp(rel.index(ha), rel.index(hb))
+        path = [start]
+        stack = [iter(edges.get(start, []))]
 
-    # If A has a high priority, it might be moved to the start of the list
-    if ha in HIGH:
-        # Id B has a high priority too, compare the positions in the list
-        if hb in HIGH:
-            return HIGH[ha] - HIGH[hb]
+        while stack:
+            for node in stack[-1]:
+                if node in path:
+                    return path[path.index(node):] + [node]
 
-        # Move A towards the beginning of the list
-        return -1
+                if node not in visited:
+                    path.append(node)
+                    stack.append(iter(edges.get(node, [])))
+                    break
+            else:
+                visited.add(path.pop())
+                stack.pop()
+
+    return None
 
-    # If only B has a high priority, move it up with respect to A
-    if hb in HIGH:
-        return 1
 
-    # If A has a low priority, it might be moved to the end of the list
-    if ha in LOW:
-        # Id B has a low priority too, compare the positions in the list
-        if hb in LOW:
-            return LOW[ha] - LOW[hb]
+def compile_precedences(high, low, relative):
+    """
+    Compile the HIGH, LOW and RELATIVE precedence lists into a rank table that
+    maps rewrite handlers to integers, and a table of the relative precedences
+    that override the ranks. Handlers that do not occur in the rank table get
+    the default rank, which lies between the ranks of the HIGH and LOW
+    handlers.
 
-        # Move A towards the end of the list
-        return 1
+    A relative precedence only orders its own handlers with respect to each
+    other, it does not move them with respect to other handlers. The overrides
+    map a pair of handlers (a, b) to -1 if A has a higher priority than B, or
+    to 1 for the reverse case. Relative precedences that agree with the ranks
+    are left out. A ValueError is raised if the precedences contain duplicates
+    or cycles.
 
-    # If only B has a high priority, move it down with respect to A
-    if hb in LOW:
-        return -1
+    Returns a tuple (ranks, default_rank, overrides).
+    """
+    fixed = high + low
 
-    # default: use order that was generated implicitely by leftmost-innermost
-    # expression traversal
-    return 0
+    if len(set(fixed)) != len(fixed):
+        raise ValueError('A handler occurs more than once in the HIGH and '
+                         'LOW precedence lists.')
 
+    edges = {}
 
-def depth_possibilities(node, depth=0, parent_op=None):
-    p = []
+    for rel in relative:
+        for a, b in zip(rel[:-1], rel[1:]):
+            edges.setdefault(a, []).append(b)
+
+    cycle = find_cycle(edges)
+
+    if cycle:
+        raise ValueError('Cyclic relative precedences: %s.'
+                         % ' > '.join([h.func_name for h in cycle]))
+
+    ranks = dict([(h, i) for i, h in enumerate(high)])
+    default_rank = len(high)
+    ranks.update([(h, default_rank + 1 + i) for i, h in enumerate(low)])
+    overrides = {}
+    seen = set()
+
+    # The first tuple in RELATIVE that contains both handlers of a pair
+    # determines their precedence
+    for rel in relative:
+        for i, a in enumerate(rel):
+            for b in rel[i + 1:]:
+                if (a, b) in seen:
+                    continue
+
+                seen |= set([(a, b), (b, a)])
+
+                if ranks.get(a, default_rank) >= ranks.get(b, default_rank):
+                    overrides[(a, b)] = -1
+                    overrides[(b, a)] = 1
+
+    return ranks, default_rank, overrides
+
+
+RANKS, DEFAULT_RANK, OVERRIDES = compile_precedences(HIGH, LOW, RELATIVE)
+
+# Handlers that occur in an override, mapped to the other handlers in their
+# overrides
+OVERRIDE_PARTNERS = {}
+
+for a, b in OVERRIDES:
+    OVERRIDE_PARTNERS.setdefault(a, set()).add(b)
+
+
+def handler_rank(handler):
+    """
+    Rank of a rewrite handler, lower ranks mean higher priorities.
+    """
+    return RANKS.get(handler, DEFAULT_RANK)
+
+
+def possibility_rank(pair):
+    """
+    Sort key for (possibility, depth) pairs.
+    """
+    return RANKS.get(pair[0].handler, DEFAULT_RANK)
+
+
+def compare_possibilities(a, b):
+    """
+    Comparison function for (possibility, depth) pairs. Returns a positive
+    number if A has a lower priority than B, a negative number for the reverse
+    case, and 0 if the possibilities have equal priorities.
+    """
+    ha, hb = a[0].handler, b[0].handler
+
+    if (ha, hb) in OVERRIDES:
+        return OVERRIDES[(ha, hb)]
+
+    return cmp(RANKS.get(ha, DEFAULT_RANK), RANKS.get(hb, DEFAULT_RANK))
+
+
+def has_overrides(handlers):
+    """
+    Check if a set of handlers contains both handlers of a relative precedence
+    that overrides their ranks.
+    """
+    return any([not OVERRIDE_PARTNERS[h].isdisjoint(handlers)
+                for h in handlers.intersection(OVERRIDE_PARTNERS)])
+
+
+def sort_possibilities(possibilities):
+    """
+    Sort a list of (possibility, depth) pairs by priority. The sort is stable,
+    so possibilities with equal priorities keep the order that was generated
+    implicitely by leftmost-innermost expression traversal. The comparison
+    function is only needed if a relative precedence overrides the ranks,
+    otherwise the ranks are used as sort key.
+    """
+    if has_overrides(set([pos.handler for pos, depth in possibilities])):
+        possibilities.sort(compare_possibilities)
+    else:
+        possibilities.sort(key=possibility_rank)
+
+
+def node_handlers(node, parent_op=None):
+    """
+    Find the handlers that should be run on a node, given the operator of its
+    parent node.
+    """
     handlers = []
 
-    # Add operator-specific handlers
-    if not node.is_leaf:
-        # Traverse through child nodes first using postorder traversal
-        for child in node:
-            # FIXME: "depth + 1" is disabled for the purpose of
-            #        leftmost-innermost traversal
-            p += depth_possibilities(child, depth, node.op)
-
-        # Add operator-specific handlers. Prevent duplicate possibilities in
-        # n-ary nodes by only executing the handlers on the outermost node of
-        # related nodes with the same operator
-        if node.op in RULES and (node.op != parent_op \
-                                 or node.op not in NARY_OPERATORS):
-            handlers += RULES[node.op]
+    # Add operator-specific handlers. Prevent duplicate possibilities in n-ary
+    # nodes by only executing the handlers on the outermost node of related
+    # nodes with the same operator. Skip handlers that require child features
+    # which the node does not have
+    if not node.is_leaf and node.op in RULES \
+            and (node.op != parent_op or node.op not in NARY_OPERATORS):
+        features = child_features(node)
+        handlers += [h for h in RULES[node.op]
+                     if meets_requirements(h, features)]
 
     # Add negation handlers after operator-specific handlers to obtain an
     # outermost effect for negations
     if node.negated:
         handlers += RULES[OP_NEG]
 
-    # Run handlers
-    for handler in handlers:
-        p += [(pos, depth) for pos in handler(node)]
+    return handlers
+
+
+def flat_postorder(node, parent_op=None):
+    """
+    Iterate over (node, parent_op, tree, i) tuples of the nodes in an
+    expression in postorder, using a FlatTree so that large expressions do not
+    exceed the recursion limit. The node is tree.sources[i], so that its path
+    can be found with tree.path(i) when it is needed.
+    """
+    tree = FlatTree.from_node(node)
+
+    for i in tree.postorder():
+        op = tree.ops[tree.parents[i]] if i else parent_op
+        yield tree.sources[i], op, tree, i
+
+
+def depth_possibilities(node, depth=0, parent_op=None, memo=None, path=()):
+    p = []
+
+    # Traverse through child nodes first using postorder traversal
+    # FIXME: "depth + 1" is disabled for the purpose of leftmost-innermost
+    #        traversal
+    for n, op, tree, i in flat_postorder(node, parent_op):
+        own = node_possibilities(n, op, memo)
+
+        # Finding a path takes O(depth), so only the paths of nodes that have
+        # possibilities are found
+        if own:
+            set_paths(own, n, path + tree.path(i))
+            p += [(pos, depth) for pos in own]
 
     #print node, p
     return p
 
 
-def find_possibilities(node):
+def run_handlers(node, handlers):
+    """
+    Run a list of handlers on a node and return the found possibilities. The
+    handlers in CONTEXT_RULES share a single MatchContext.
+    """
+    p = []
+    context = None
+
+    for handler in handlers:
+        if handler in CONTEXT_RULES:
+            if context is None:
+                context = MatchContext(node)
+
+            p += handler(node, context)
+        else:
+            p += handler(node)
+
+    return p
+
+
+def set_paths(possibilities, node, path):
+    """
+    Set the path of the possibilities whose root is the specified node.
+    """
+    for pos in possibilities:
+        if pos.root is node:
+            pos.path = path
+
+    return possibilities
+
+
+def node_possibilities(node, parent_op=None, memo=None):
+    """
+    Find the possibilities of the handlers of a node, given the operator of
+    its parent node. If a PossibilityMemo is given, the possibilities are
+    looked up in the memo first.
+    """
+    handlers = node_handlers(node, parent_op)
+
+    if memo is None or not handlers:
+        return run_handlers(node, handlers)
+
+    return memo.possibilities(node, handlers, parent_op)
+
+
+def referenced_nodes(value, ids):
+    """
+    Collect the ids of the nodes that are referenced by a possibility argument,
+    directly or as the node of a scope.
+    """
+    if isinstance(value, ExpressionBase):
+        ids.add(id(value))
+    elif isinstance(value, Scope):
+        ids.add(id(value.node))
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            referenced_nodes(v, ids)
+
+    return ids
+
+
+def node_indices(node, ids):
+    """
+    Create a dictionary that maps the ids of the specified nodes in a subtree
+    to their indices in preorder. A node that occurs more than once gets the
+    index of its first occurrence. The subtree is traversed iteratively, up to
+    the last of the specified nodes.
+    """
+    indices = {}
+    stack = [node]
+    i = 0
+
+    while stack and len(indices) < len(ids):
+        node = stack.pop()
+
+        if id(node) in ids:
+            indices.setdefault(id(node), i)
+
+        if isinstance(node, ExpressionBase) and not node.is_leaf:
+            stack.extend(reversed(node.nodes))
+
+        i += 1
+
+    return indices
+
+
+def preorder_nodes(node, count):
+    """
+    List the first COUNT nodes of a subtree in preorder, see node_indices().
+    """
+    nodes = []
+    stack = [node]
+
+    while stack and len(nodes) < count:
+        node = stack.pop()
+        nodes.append(node)
+
+        if isinstance(node, ExpressionBase) and not node.is_leaf:
+            stack.extend(reversed(node.nodes))
+
+    return nodes
+
+
+# Kinds of references in possibility templates
+REF_NODE = 0
+REF_SCOPE = 1
+REF_CLONE = 2
+
+# Types of possibility arguments that can be used in a template as-is
+TEMPLATE_TYPES = (int, long, float, str, unicode, bool, type(None))
+
+
+class TemplateRef(object):
+    """
+    Reference in a possibility template to a node in the subtree by its index
+    in preorder, to the scope of such a node, or to a node outside the subtree
+    which is cloned when the template is bound.
+    """
+
+    def __init__(self, kind, value):
+        self.kind = kind
+        self.value = value
+
+    def bind(self, nodes, scopes):
+        if self.kind == REF_NODE:
+            return nodes[self.value]
+
+        if self.kind == REF_SCOPE:
+            if self.value not in scopes:
+                scopes[self.value] = Scope(nodes[self.value])
+
+            return scopes[self.value]
+
+        return self.value.clone()
+
+
+def create_template(value, indices):
+    """
+    Create a template of a possibility argument, in which the nodes of a
+    subtree are replaced by references. Raises ValueError for arguments that
+    cannot be bound to another subtree.
+    """
+    if isinstance(value, ExpressionBase):
+        if id(value) in indices:
+            return TemplateRef(REF_NODE, indices[id(value)])
+
+        return TemplateRef(REF_CLONE, value.clone())
+
+    if isinstance(value, Scope):
+        if id(value.node) not in indices:
+            raise ValueError('Scope of "%s" is outside of the subtree.'
+                             % value.node)
+
+        return TemplateRef(REF_SCOPE, indices[id(value.node)])
+
+    if isinstance(value, (list, tuple)):
+        return type(value)([create_template(v, indices) for v in value])
+
+    if isinstance(value, TEMPLATE_TYPES):
+        return value
+
+    raise ValueError('Cannot create a template of "%s".' % repr(value))
+
+
+def bind_template(template, nodes, scopes):
+    """
+    Replace the references in a template by the nodes of a subtree, which are
+    listed in preorder.
+    """
+    if isinstance(template, TemplateRef):
+        return template.bind(nodes, scopes)
+
+    if isinstance(template, (list, tuple)):
+        return type(template)([bind_template(t, nodes, scopes)
+                               for t in template])
+
+    return template
+
+
+class PossibilityMemo(object):
+    """
+    Bounded memo of the possibilities found by the handlers of a node, keyed by
+    the structure hash of the node's subtree and the operator of its parent
+    node. Handlers are pure functions of the subtree they inspect, so strictly
+    equal subtrees have equal possibilities, e.g. across rewrite steps or for
+    repeated subexpressions. Each entry holds the node it was created for, to
+    which a hit is confirmed by strict equality, and the possibilities as
+    templates, which are bound to the nodes of the live subtree on a hit. The
+    templates refer to these nodes by their index in preorder, so only the
+    first part of the subtree up to the last referenced node has to be
+    traversed to bind them. When the memo is
+    full, the least recently used entry is evicted. The memo can be shared by
+    multiple threads, the handlers are run outside of its lock.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<PossibilityMemo size=%d entries=%d hits=%d misses=%d>' \
+                % (self.size, len(self), self.hits, self.misses)
+
+    def resize(self, size):
+        with self.lock:
+            self.size = size
+            self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def possibilities(self, node, handlers, parent_op=None):
+        """
+        Find the possibilities of a list of handlers on a node, using the memo
+        if the structure of the node has been encountered before.
+        """
+        key = parent_op, node.structure_hash()
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+            if entry is not None:
+                self.entries[key] = entry
+
+        # The node of the entry is rehashed in case it has been modified since
+        # the entry was created, and equal hashes may still belong to unequal
+        # nodes
+        hit = entry is not None and entry[0].structure_hash() == key[1] \
+              and entry[0] == node
+
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if hit:
+            templates, count = entry[1:]
+            nodes = preorder_nodes(node, count)
+            scopes = {}
+
+            return [P(bind_template(root, nodes, scopes), handler,
+                      bind_template(args, nodes, scopes))
+                    for root, handler, args in templates]
+
+        p = run_handlers(node, handlers)
+        ids = set()
+
+        for pos in p:
+            referenced_nodes(pos.root, ids)
+            referenced_nodes(pos.args, ids)
+
+        indices = node_indices(node, ids)
+
+        try:
+            templates = [(create_template(pos.root, indices), pos.handler,
+                          create_template(pos.args, indices)) for pos in p]
+        except ValueError:
+            return p
+
+        # The number of nodes that have to be listed to bind the templates
+        count = max(indices.values()) + 1 if indices else 0
+
+        with self.lock:
+            self.entries[key] = node, templates, count
+            self.evict()
+
+        return p
+
+
+# Possibility memo that is shared by all parsers with the 'memoize' option
+POSSIBILITY_MEMO = PossibilityMemo()
+
+
+class PossibilityCache(object):
     """
-    Find all possibilities inside a node and return them in a list.
+    Cache of the possibilities found by the handlers of each subtree in an
+    expression, used to find the possibilities of an expression incrementally
+    after a rewrite step has been applied.
+
+    A cached entry of a node is only reused if the node itself is unchanged
+    (same operator/value, negation and parent operator), its children are the
+    same objects and all of their entries were reused as well. Therefore, only
+    the handlers of modified nodes and their ancestors are re-run.
     """
-    possibilities = depth_possibilities(node)
+
+    def __init__(self):
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def invalidate(self, node):
+        """
+        Remove the cached entry of a node, e.g. because a possibility in that
+        entry has been applied and its scope has therefore been modified.
+        """
+        self.entries.pop(id(node), None)
+
+    def clear(self):
+        self.entries = {}
+
+
+def node_stamp(node, parent_op):
+    """
+    Attributes of a node that determine the possibilities found by its own
+    handlers, aside from its subtree.
+    """
+    if node.is_leaf:
+        return node.negated, node.type, node.value
+
+    return node.negated, node.op, parent_op, tuple(map(id, node))
+
+
+def cached_depth_possibilities(node, entries, new_entries, parent_op=None,
+                               memo=None, path=()):
+    """
+    Variant of depth_possibilities() that reuses the cached possibilities of
+    unchanged subtrees. The cache entries that are valid for the current
+    expression are collected in NEW_ENTRIES. Returns a tuple (possibilities,
+    reused), where REUSED indicates if the node's own entry was reused.
+    """
+    p = []
+    tree = FlatTree.from_node(node)
+
+    # Whether the entries of all nodes in the subtree of a node were reused
+    reused = [False] * len(tree)
+
+    for i in tree.postorder():
+        n = tree.sources[i]
+        op = tree.ops[tree.parents[i]] if i else parent_op
+        stamp = node_stamp(n, op)
+        entry = entries.get(id(n))
+
+        if all([reused[c] for c in tree.child_indices(i)]) and entry \
+                and entry[0] is n and entry[1] == stamp:
+            # The node may have moved to another position in the expression
+            own = entry[2]
+            reused[i] = True
+        else:
+            own = [(pos, 0) for pos in node_possibilities(n, op, memo)]
+
+        # The node may have moved, so the paths are updated (only for nodes
+        # that have possibilities, see depth_possibilities())
+        if own:
+            set_paths([pos for pos, depth in own], n, path + tree.path(i))
+
+        new_entries[id(n)] = n, stamp, own
+        p += own
+
+    return p, reused[0]
+
+
+def find_possibilities(node, cache=None, memo=None):
+    """
+    Find all possibilities inside a node and return them in a list. If a
+    PossibilityCache is given, the possibilities of unchanged subtrees are
+    taken from the cache instead of being recomputed. If a PossibilityMemo is
+    given, the possibilities of subtrees that have been encountered before are
+    taken from the memo.
+    """
+    if cache is None:
+        possibilities = depth_possibilities(node, memo=memo)
+    else:
+        new_entries = {}
+        possibilities = cached_depth_possibilities(node, cache.entries,
+                                                   new_entries, memo=memo)[0]
+        cache.entries = new_entries
+
     #import copy
     #old_possibilities = copy.deepcopy(possibilities)
-    possibilities.sort(compare_possibilities)
+    sort_possibilities(possibilities)
     #get_handler = lambda (p, d): str(p.handler)
     #if old_possibilities != possibilities:
     #    print 'before:', '\n    '.join(map(get_handler, old_possibilities))
@@ -115,3 +625,166 @@ def find_possibilities(node):
     return [p for p, depth in possibilities]
 
 # 2x ^ 2 = 3x ^ (1 + 1)
+
+
+def is_rewrite_handler(obj):
+    """
+    Check if an object is a rewrite handler, i.e. a function with the
+    signature handler(root, args).
+    """
+    return isinstance(obj, FunctionType) \
+           and obj.func_code.co_argcount == 2 \
+           and obj.func_code.co_varnames[:2] == ('root', 'args')
+
+
+def find_rewrite_handlers(match, visited=None):
+    """
+    Find the rewrite handlers that a match function can create possibilities
+    for, by inspecting the global names that are referenced by the code of the
+    function. Helper functions that are defined in the rules package are
+    inspected recursively. Declarative match functions list their handlers.
+    """
+    if hasattr(match, 'handlers'):
+        return set(match.handlers)
+
+    if visited is None:
+        visited = set([match])
+
+    handlers = set()
+    package = match.__module__.rpartition('.')[0] + '.'
+    codes = [match.func_code]
+
+    while codes:
+        code = codes.pop()
+
+        # Include nested functions and lambda expressions
+        codes += [c for c in code.co_consts if isinstance(c, CodeType)]
+
+        for name in code.co_names:
+            obj = match.func_globals.get(name)
+
+            if is_rewrite_handler(obj):
+                handlers.add(obj)
+            elif isinstance(obj, FunctionType) and obj not in visited \
+                    and obj.__module__.startswith(package):
+                visited.add(obj)
+                handlers |= find_rewrite_handlers(obj, visited)
+
+    return handlers
+
+
+# Rewrite handlers that may be used by the possibilities of each match function
+MATCH_HANDLERS = dict([(match, find_rewrite_handlers(match))
+                       for matches in RULES.itervalues() for match in matches])
+
+
+def match_rank(match):
+    """
+    Rank of the highest priority rewrite handler that a match function can
+    create possibilities for. Match functions whose rewrite handlers are
+    unknown get a rank lower than any handler.
+    """
+    handlers = MATCH_HANDLERS.get(match)
+
+    if not handlers:
+        return -1
+
+    return min(map(handler_rank, handlers))
+
+
+MATCH_RANKS = dict([(match, match_rank(match)) for match in MATCH_HANDLERS])
+
+
+def postorder_handlers(node, parent_op=None):
+    """
+    Iterate over (node, tree, i, handlers) tuples in the order that is used by
+    depth_possibilities(), see flat_postorder().
+    """
+    for n, op, tree, i in flat_postorder(node, parent_op):
+        yield n, tree, i, node_handlers(n, op)
+
+
+def find_hint(node):
+    """
+    Find the possibility with the highest priority inside a node, which is the
+    first possibility returned by find_possibilities(). Match functions are
+    grouped by the priority of the rewrite handlers they can produce, and the
+    groups are run in order of priority. Within a group, nodes are visited in
+    traversal order, and the search is stopped at the first possibility that
+    cannot be outranked by the remaining match functions.
+    """
+    # Collect the nodes on which the match functions of each rank should be
+    # run, along with the position of their possibilities in the traversal
+    # order
+    jobs = {}
+    group_matches = {}
+
+    for k, (n, tree, i, handlers) in enumerate(postorder_handlers(node)):
+        for j, match in enumerate(handlers):
+            rank = MATCH_RANKS[match]
+            jobs.setdefault(rank, []).append(((k, j), match, n, tree, i))
+            group_matches.setdefault(rank, set()).add(match)
+
+    ranks = sorted(jobs)
+
+    # The rewrite handlers that can be produced by the match functions of each
+    # rank and the ranks after it
+    remaining = [set()]
+
+    for rank in reversed(ranks):
+        remaining.append(remaining[-1].union(
+            *[MATCH_HANDLERS[m] for m in group_matches[rank]]))
+
+    remaining.reverse()
+
+    contexts = {}
+    found = []
+    handlers = set()
+    best = best_key = None
+
+    for g, rank in enumerate(ranks):
+        # A relative precedence that overrides the ranks can move a
+        # possibility in front of the best one, so the search is only stopped
+        # if none may apply
+        if best and rank > best_key[0] \
+                and not has_overrides(handlers | remaining[g]):
+            return best
+
+        for position, match, n, tree, i in jobs[rank]:
+            if match in CONTEXT_RULES:
+                if id(n) not in contexts:
+                    contexts[id(n)] = MatchContext(n)
+
+                possibilities = match(n, contexts[id(n)])
+            else:
+                possibilities = match(n)
+
+            if not possibilities:
+                continue
+
+            set_paths(possibilities, n, tree.path(i))
+
+            for l, pos in enumerate(possibilities):
+                key = handler_rank(pos.handler), position + (l,)
+                found.append((key[1], pos))
+                handlers.add(pos.handler)
+
+                if not best or key < best_key:
+                    best, best_key = pos, key
+
+            # Jobs are in traversal order, so the remaining possibilities of
+            # this rank and the next ranks cannot outrank a possibility of
+            # this rank
+            if best_key[0] <= rank \
+                    and not has_overrides(handlers | remaining[g]):
+                return best
+
+    if not has_overrides(handlers):
+        return best
+
+    # Sort all possibilities in traversal order like find_possibilities()
+    found.sort(key=lambda (position, pos): position)
+    possibilities = [(pos, 0) for position, pos in found]
+    sort_possibilities(possibilities)
+
+    return possibilities[0][0]
@@ -14,8 +14,7 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 import sys
 
-from external.graph_drawing.graph import generate_graph
-from external.graph_drawing.line import generate_line
+from src.input_buffer import InputBuffer
 
 
 def create_graph(node):
@@ -25,9 +24,7 @@ def create_graph(node):
 class ParserWrapper(object):
 
     def __init__(self, base_class, **kwargs):
-        self.input_buffer = []
-        self.last_buffer = ''
-        self.input_position = 0
+        self.input_buffer = InputBuffer()
         self.closed = False
 
         self.verbose = kwargs.get('verbose', False)
@@ -40,43 +37,31 @@ class ParserWrapper(object):
 
         return getattr(self.parser, name)
 
-    def readline(self, nbytes=False):
+    def readline(self, nbytes=None):
         return self.read(nbytes)
 
-    def read(self, nbytes=False):
+    def read(self, nbytes=None):
+        buf = self.input_buffer.read(nbytes)
 
-        if len(self.last_buffer) >= nbytes:
-            buf = self.last_buffer[:nbytes]
-            self.last_buffer = self.last_buffer[nbytes:]
-            return buf
-
-        buf = self.last_buffer
-
-        try:
-            buf += self.input_buffer[self.input_position]
-
-            if self.verbose:
-                print 'read:', buf  # pragma: nocover
-
-            self.input_position += 1
-        except IndexError:
+        if not buf:
             self.closed = True
-            return ''
+        elif self.verbose:
+            print 'read:', buf  # pragma: nocover
 
-        self.last_buffer = buf[nbytes:]
         return buf
 
     def close(self):
         self.closed = True
-        self.input_position = len(self.input_buffer)
+        self.input_buffer.clear()
 
     def run(self, input_buffer, *args, **kwargs):
-        map(self.append, input_buffer)
+        self.closed = False
+        self.input_buffer.append(input_buffer)
         return self.parser.run(*args, **kwargs)
 
     def append(self, input):
         self.closed = False
-        self.input_buffer.append(input + '\n')
+        self.input_buffer.append((input,))
 
 
 def run_expressions(base_class, expressions, fail=True, silent=False,
@@ -153,4 +138,4 @@ def graph(parser, *exp, **kwargs):
 
 
 def line(parser, *exp, **kwargs):
-    return generate_line(ParserWrapper(parser, **kwargs).run(exp))
+    return str(ParserWrapper(parser, **kwargs).run(exp))
@@ -15,7 +15,7 @@
 import unittest
 import doctest
 
-from src.node import ExpressionNode
+from src.node import ExpressionNode, ExpressionBase, invalidate_subtree
 from src.parser import Parser
 from src.validation import validate, VALIDATE_SUCCESS, \
         VALIDATE_FAILURE, VALIDATE_NOPROGRESS
@@ -65,10 +65,43 @@ class RulesTestCase(unittest.TestCase):
         for ca, cb in zip(a, b):
             self.assertEqualNodes(ca, cb)
 
+    def assertValidCaches(self, root):
+        """
+        Check that the cached values of the nodes in an expression are equal
+        to the values that are computed without caches.
+        """
+        fresh = root.clone()
+        invalidate_subtree(fresh)
+        stack = [(root, fresh)]
+
+        while stack:
+            node, expected = stack.pop()
+
+            if not isinstance(node, ExpressionBase):
+                continue
+
+            for cache, value in (('hash_cache', expected.structure_hash),
+                                 ('key_cache', expected.canonical_key),
+                                 ('attribute_cache', expected.attributes),
+                                 ('line_cache', expected.__str__)):
+                cached = getattr(node, cache, None)
+
+                if cached is not None:
+                    self.assertEqual(cached, value(),
+                                     'Outdated %s of "%s".' % (cache, expected))
+
+            if not node.is_leaf:
+                stack.extend(zip(node.nodes, expected.nodes))
+
     def assertRewrite(self, rewrite_chain):
         try:
             for i, exp in enumerate(rewrite_chain[:-1]):
-                self.assertMultiLineEqual(str(rewrite(exp)),
+                result = rewrite(exp)
+
+                if result is not None:
+                    self.assertValidCaches(result)
+
+                self.assertMultiLineEqual(str(result),
                                           str(rewrite_chain[i + 1]))
         except AssertionError as e:  # pragma: nocover
             msg = e.args[0]
@@ -0,0 +1,66 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+from src.flat_tree import FlatTree
+from src.node import ExpressionLeaf as L, nary_node, OP_ADD, OP_MUL
+from tests.rulestestcase import RulesTestCase, tree
+
+
+class TestFlatTree(RulesTestCase):
+
+    def test_from_node(self):
+        root = tree('2x + -3')
+        (two, x), three = root
+        flat = FlatTree.from_node(root)
+
+        self.assertEqual(len(flat), 5)
+        self.assertEqual(list(flat.ops), [OP_ADD, OP_MUL, 0, 0, 0])
+        self.assertEqual(flat.values, [None, None, 2, 'x', 3])
+        self.assertEqual(list(flat.negated), [0, 0, 0, 0, 1])
+        self.assertEqual(list(flat.parents), [-1, 0, 1, 1, 0])
+        self.assertEqual(list(flat.sizes), [5, 3, 1, 1, 1])
+        self.assertEqual(list(flat.child_indices(0)), [1, 4])
+        self.assertEqual(list(flat.child_indices(1)), [2, 3])
+        self.assertEqual(list(flat.child_indices(2)), [])
+
+        for i, node in enumerate([root, root[0], two, x, three]):
+            self.assertIs(flat.sources[i], node)
+
+    def test_to_node(self):
+        root = tree('-(a + b) ^ 2 * sin(x) + c')
+        flat = FlatTree.from_node(root)
+        self.assertEqual(flat.to_node(), root)
+        self.assertEqual(flat.to_node(1), root[0])
+        self.assertIsNot(flat.to_node(), root)
+
+    def test_traversal(self):
+        flat = FlatTree.from_node(tree('2x + -3'))
+        self.assertEqual(list(flat.preorder()), [0, 1, 2, 3, 4])
+        self.assertEqual(list(flat.preorder(1)), [1, 2, 3])
+        self.assertEqual(list(flat.postorder()), [2, 3, 1, 4, 0])
+        self.assertEqual(list(flat.postorder(1)), [2, 3, 1])
+
+    def test_path(self):
+        flat = FlatTree.from_node(tree('2x + -3'))
+        self.assertEqual(flat.path(0), ())
+        self.assertEqual(flat.path(3), (0, 1))
+        self.assertEqual(flat.path(4), (1,))
+        self.assertEqual(flat.depth(3), 2)
+
+    def test_long_expression(self):
+        root = nary_node(OP_ADD, [L(i) * L('x') for i in xrange(1, 5000)])
+        flat = FlatTree.from_node(root)
+        self.assertEqual(len(flat), 3 * 4999 + 1)
+        self.assertEqual(flat.to_node(), root)
+        self.assertEqual(list(flat.postorder())[-1], 0)
@@ -0,0 +1,81 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+from StringIO import StringIO
+
+from src.input_buffer import InputBuffer, file_lines
+
+
+class TestInputBuffer(unittest.TestCase):
+
+    def test_read(self):
+        buf = InputBuffer(['ab', 'cde\n'])
+        self.assertEqual(buf.read(8192), 'ab\n')
+        self.assertEqual(buf.read(2), 'cd')
+        self.assertEqual(buf.read(2), 'e\n')
+        self.assertEqual(buf.read(2), '')
+        self.assertFalse(buf.sources)
+
+    def test_read_line(self):
+        buf = InputBuffer(['abc'])
+        self.assertEqual(buf.read(1), 'a')
+        self.assertEqual(buf.read(), 'bc\n')
+        self.assertEqual(buf.read(), '')
+
+    def test_read_unicode(self):
+        buf = InputBuffer([u'ab\xe9c'])
+        self.assertEqual(buf.read(2), u'ab')
+        self.assertEqual(buf.read(2), u'\xe9c')
+        self.assertEqual(buf.read(2), u'\n')
+        self.assertEqual(buf.read(2), '')
+
+        buf = InputBuffer([u'\xe9a + b'])
+        self.assertEqual(buf.read(1), u'\xe9')
+        self.assertEqual(buf.read(), u'a + b\n')
+
+    def test_read_complete_line(self):
+        line = 'a + b\n'
+        self.assertIs(InputBuffer([line]).read(8192), line)
+
+    def test_append(self):
+        buf = InputBuffer()
+        self.assertEqual(buf.read(8192), '')
+        buf.append(['a'])
+        buf.append(iter(['b']))
+        self.assertEqual(buf.read(8192), 'a\n')
+        self.assertEqual(buf.read(8192), 'b\n')
+        self.assertEqual(buf.read(8192), '')
+
+    def test_clear(self):
+        buf = InputBuffer(['abc', 'd'])
+        buf.read(1)
+        buf.clear()
+        self.assertEqual(buf.read(8192), '')
+
+    def test_streaming(self):
+        def source():
+            for i in xrange(3):
+                yield str(i)
+                self.assertIsNone(buf.line)
+
+        buf = InputBuffer(source())
+        self.assertEqual([buf.read(8192) for i in xrange(4)],
+                         ['0\n', '1\n', '2\n', ''])
+
+    def test_file_lines(self):
+        buf = InputBuffer(file_lines(StringIO('a\nb')))
+        self.assertEqual(buf.read(8192), 'a\n')
+        self.assertEqual(buf.read(8192), 'b\n')
+        self.assertEqual(buf.read(8192), '')
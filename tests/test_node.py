@@ -12,18 +12,65 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+import copy
+import glob
+import os.path
+import re
+
+from graph_drawing.line import generate_line
+from graph_drawing.node import Node, Leaf
+
 from src.node import ExpressionNode as N, ExpressionLeaf as L, Scope, \
         nary_node, get_scope, OP_ADD, infinity, absolute, sin, cos, tan, log, \
-        ln, der, integral, int_def, eq
+        ln, der, integral, int_def, eq, child_features, op_feature, OP_MUL, \
+        OP_DIV, OP_POW, FEATURE_NUMERIC, FEATURE_IDENTIFIER, FEATURE_NEGATED, \
+        InternTable, negate, OP_SQRT, encode_node, decode_node, invalidate_path, \
+        graph_node
 from tests.rulestestcase import RulesTestCase, tree
 
 
+class LineNode(Node, N):
+    """
+    Operator node that is also a graph_drawing node, so that it can be printed
+    by graph_drawing's generate_line() using the hooks of ExpressionNode.
+    """
+    def __init__(self, *args, **kwargs):
+        Node.__init__(self, *args, **kwargs)
+        N.__init__(self, *args, **kwargs)
+
+    def __setitem__(self, i, node):
+        self.nodes[i] = line_node(node)
+
+    def __deepcopy__(self, memo):
+        return line_node(self)
+
+
+class LineLeaf(Leaf, L):
+    def __init__(self, value, negated=0):
+        Leaf.__init__(self, value, negated=negated)
+        L.__init__(self, value, negated=negated)
+
+    def __deepcopy__(self, memo):
+        return line_node(self)
+
+
+def line_node(node):
+    """Convert an expression to LineNode and LineLeaf instances."""
+    if node.is_leaf:
+        return LineLeaf(node.value, negated=node.negated)
+
+    line = LineNode(node.op, *map(line_node, node), negated=node.negated)
+    line.value = node.value
+
+    return line
+
+
 class TestNode(RulesTestCase):
 
     def setUp(self):
         self.l = [L(1), N('*', L(2), L(3)), L(4), L(5)]
         self.n, self.f = tree('a + b + cd,f')
-        (self.a, self.b), self.cd = self.n
+        self.a, self.b, self.cd = self.n
         self.c, self.d = self.cd
         self.scope = Scope(self.n)
 
@@ -120,6 +167,13 @@ class TestNode(RulesTestCase):
         plus = N('+', N('+', N('+', *self.l[:2]), self.l[2]), self.l[3])
         self.assertEqual(get_scope(plus), self.l)
 
+    def test_get_scope_long(self):
+        leaves = [L(i) for i in xrange(5000)]
+        plus = nary_node(OP_ADD, leaves)
+        self.assertEqual(get_scope(plus), leaves)
+        self.assertEqual(child_features(plus), FEATURE_NUMERIC)
+        self.assertTrue(plus.contains(L(4999)))
+
     def test_get_scope_negation(self):
         root, a, b, c, d = tree('ab * -cd, a, b, -c, d')
         self.assertEqual(get_scope(root), [a, b, c, d])
@@ -189,6 +243,17 @@ class TestNode(RulesTestCase):
         m0, m1 = tree('-5 * -3,-5 * 6')
         self.assertFalse(m0.equals(m1))
 
+    def test_equals_nested_scope(self):
+        p0, p1, p2 = tree('a + (b + c)d, db + dc + a, a + d(c + b)')
+        self.assertFalse(p0.equals(p1))
+        self.assertTrue(p0.equals(p2))
+
+    def test_canonical_key(self):
+        p0, p1, p2 = tree('a + b - c, -c + (a + b), a - b + c')
+        self.assertEqual(p0.canonical_key(), p1.canonical_key())
+        self.assertNotEqual(p0.canonical_key(), p2.canonical_key())
+        self.assertEqual(tree('-a').canonical_key(), tree('a').canonical_key())
+
     def test_equals_ignore_negation(self):
         p0, p1 = tree('-(a + b), a + b')
         self.assertTrue(p0.equals(p1, ignore_negation=True))
@@ -200,6 +265,12 @@ class TestNode(RulesTestCase):
         self.assertEqual(self.scope.node, self.n)
         self.assertEqual(self.scope.nodes, [self.a, self.b, self.cd])
 
+    def test_scope_view(self):
+        self.assertIs(self.scope.nodes, self.n.nodes)
+        self.scope.remove(self.b)
+        self.assertEqual(self.scope.nodes, [self.a, self.cd])
+        self.assertEqual(self.n.nodes, [self.a, self.b, self.cd])
+
     def test_scope_remove_leaf(self):
         self.scope.remove(self.b)
         self.assertEqual(self.scope.nodes, [self.a, self.cd])
@@ -211,6 +282,15 @@ class TestNode(RulesTestCase):
     def test_scope_remove_error(self):
         self.assertRaises(ValueError, self.scope.remove, self.f)
 
+    def test_scope_remove_equal(self):
+        scope = Scope(tree('a + b + a'))
+        a0, b, a1 = scope
+        scope.remove(a1)
+        self.assertIs(scope[0], a0)
+        self.assertEqual(len(scope), 2)
+        self.assertRaises(ValueError, scope.remove, a1)
+        self.assertEqual(scope.index(b), 1)
+
     def test_scope_replace(self):
         self.scope.replace(self.cd, self.f)
         self.assertEqual(self.scope.nodes, [self.a, self.b, self.f])
@@ -225,6 +305,24 @@ class TestNode(RulesTestCase):
         self.assertEqualNodes(nary_node('+', [a, b, c, d]),
                               N('+', N('+', N('+', a, b), c), d))
 
+    def test_nary_node_flat(self):
+        a, b, c = tree('a,b,c')
+        self.assertEqual(nary_node('+', [a, b, c]).nodes, [a, b, c])
+        self.assertEqual(N('+', N('+', a, b), c).nodes, [a, b, c])
+
+        # Grouped and negated operands are not merged
+        self.assertEqual(N('+', a, N('+', b, c)).nodes, [a, N('+', b, c)])
+        self.assertEqual(len(N('+', -N('+', a, b), c)), 2)
+        self.assertEqual(len(N('*', N('+', a, b), c)), 2)
+
+    def test_nary_node_setitem(self):
+        a, b, c, d = tree('a,b,c,d')
+        root = N('+', a, b)
+        root[0] = c + d
+        self.assertEqual(root.nodes, [c, d, b])
+        root.substitute(d, a + b)
+        self.assertEqual(root.nodes, [c, a + b, b])
+
     def test_scope_as_nary_node(self):
         self.assertEqualNodes(self.scope.as_nary_node(), self.n)
 
@@ -325,3 +423,225 @@ class TestNode(RulesTestCase):
     def test_eq(self):
         x, a, b, expect = tree('x, a, b, x + a = b')
         self.assertEqual(eq(x + a, b), expect)
+
+    def test_op_feature(self):
+        self.assertEqual(op_feature(), 0)
+        self.assertEqual(op_feature(OP_ADD), 1 << OP_ADD)
+        self.assertEqual(op_feature(OP_ADD, OP_MUL),
+                         1 << OP_ADD | 1 << OP_MUL)
+
+    def test_child_features(self):
+        self.assertEqual(child_features(tree('1 + a + b / c')),
+                FEATURE_NUMERIC | FEATURE_IDENTIFIER | op_feature(OP_DIV))
+        self.assertEqual(child_features(tree('a - b ^ 2')),
+                FEATURE_IDENTIFIER | FEATURE_NEGATED | op_feature(OP_POW))
+        self.assertEqual(child_features(tree('2ab')),
+                FEATURE_NUMERIC | FEATURE_IDENTIFIER)
+        self.assertEqual(child_features(tree('(a * b) ^ 2')),
+                FEATURE_NUMERIC | op_feature(OP_MUL))
+        self.assertEqual(child_features(tree('a + -(b + c)')),
+                FEATURE_IDENTIFIER | FEATURE_NEGATED | op_feature(OP_ADD))
+
+    def test_slots(self):
+        root = tree('-(a + 2)')
+        self.assertFalse(hasattr(root, '__dict__'))
+        self.assertFalse(hasattr(root[0], '__dict__'))
+        self.assertEqual(root.clone(), root)
+
+    def test_graph_node(self):
+        node = graph_node(tree('-(a + log_2(x))'))
+        self.assertEqual(node.title, '+')
+        self.assertEqual(node.negated, 1)
+        self.assertEqual(node[0].value, 'a')
+        self.assertEqual(node[1].title, 'log_2')
+        self.assertEqual(node[1][0].value, 'x')
+
+    def test_intern(self):
+        table = InternTable()
+        root = tree('(a + 2)(a + 2)')
+        interned = table.intern(root)
+        self.assertEqual(interned, root)
+        self.assertIs(interned[0], interned[1])
+        self.assertIs(table.intern(root[1]), interned[0])
+        self.assertIs(table.intern(interned), interned)
+        self.assertEqual(len(table), 4)
+        self.assertFalse(root.interned)
+
+    def test_intern_negate(self):
+        table = InternTable()
+        a = table.intern(tree('a + 2'))
+        self.assertIs(negate(a, 1), table.intern(tree('-(a + 2)')))
+        self.assertEqual(a.negated, 0)
+        self.assertIs((-a)[0], a[0])
+
+    def test_intern_clone(self):
+        interned = InternTable().intern(tree('(a + 2)(a + 2)'))
+        root = interned.clone()
+        self.assertEqual(root, interned)
+        self.assertFalse(root.interned or root[0].interned)
+        self.assertIsNot(root[0], root[1])
+        self.assertRaises(ValueError, interned.substitute, interned[0], root)
+
+    def test_intern_immutable(self):
+        interned = InternTable().intern(tree('(a + 2)(a + 2)'))
+        a = interned[0][0]
+        self.assertRaises(ValueError, interned.__setitem__, 0, L(1))
+        self.assertRaises(ValueError, setattr, interned, 'nodes', [])
+        self.assertRaises(ValueError, setattr, interned, 'negated', 1)
+        self.assertRaises(ValueError, setattr, a, 'value', 'b')
+        self.assertRaises(ValueError, setattr, a, 'negated', 1)
+        self.assertEqual(str(interned), '(a + 2)(a + 2)')
+
+    def test_intern_long_expression(self):
+        root = nary_node(OP_ADD, [L(i) * L('x') for i in xrange(1, 5000)])
+        interned = InternTable().intern(root)
+        self.assertEqual(interned, root)
+        self.assertEqual(interned.clone(), root)
+        self.assertFalse(interned.clone()[0].interned)
+
+    def test_structure_hash(self):
+        root, same, other = tree('a + bc, a + bc, a + cb')
+        self.assertEqual(root.structure_hash(), same.structure_hash())
+        self.assertNotEqual(root.structure_hash(), other.structure_hash())
+        self.assertNotEqual(root.structure_hash(),
+                            (-root).structure_hash())
+        self.assertNotEqual(tree('1').structure_hash(),
+                            tree('1.0').structure_hash())
+
+    def test_structure_hash_raw_values(self):
+        self.assertEqual(tree('sin 2'), sin(2))
+        self.assertEqual(tree('a + 2'), N(OP_ADD, 'a', 2))
+        self.assertNotEqual(tree('a + 2'), N(OP_ADD, 'a', 3))
+
+    def test_structure_hash_invalidate(self):
+        root, other = tree('a + bc, a + dc')
+        h = root.structure_hash()
+        self.assertEqual(root.structure_hash(), h)
+
+        root[1].substitute(root[1][0], tree('d'))
+        invalidate_path(root, (1,))
+        self.assertEqual(root.structure_hash(), other.structure_hash())
+        self.assertEqual(root, other)
+
+        negate(root[1], 1)
+        invalidate_path(root, (1,))
+        self.assertNotEqual(root, other)
+
+    def test_structure_hash_invalidate_write(self):
+        root = tree('a + b')
+        root.structure_hash()
+        root.negated = 1
+        self.assertIsNone(root.hash_cache)
+        root.structure_hash()
+        root.nodes = [L('a'), L('c')]
+        self.assertEqual(root.structure_hash(),
+                         tree('-(a + c)').structure_hash())
+
+    def test_structure_hash_invalidate_other_tree(self):
+        root, other = tree('a + b, c + d')
+        h = other.structure_hash()
+        root.substitute(root[0], tree('e'))
+        self.assertEqual(other.hash_cache, h)
+        self.assertEqual(other[0].hash_cache, tree('c').structure_hash())
+
+    def test_attributes(self):
+        root = tree('2x ^ 3 + sqrt(y)')
+        attributes = root.attributes()
+        self.assertEqual(attributes.variables, set(['x', 'y']))
+        self.assertFalse(attributes.numeric)
+        self.assertEqual(attributes.size, 8)
+        self.assertEqual(attributes.depth, 3)
+        self.assertEqual(attributes.operators,
+                         op_feature(OP_ADD, OP_MUL, OP_POW, OP_SQRT))
+        self.assertTrue(tree('2 ^ 3 / 4').attributes().numeric)
+
+    def test_attributes_raw_values(self):
+        self.assertEqual(sin(2).attributes(), tree('sin 2').attributes())
+        self.assertEqual(N(OP_ADD, 'a', 2).attributes(),
+                         tree('a + 2').attributes())
+        self.assertTrue(N(OP_ADD, 'a', 2).contains(tree('a')))
+        self.assertTrue(N(OP_ADD, 'a', 2).contains(tree('2')))
+        self.assertTrue(sin(2).contains(tree('sin 2')))
+        self.assertTrue(N(OP_ADD, 'a', 2).equals(tree('2 + a')))
+
+    def test_attributes_invalidate(self):
+        root = tree('x + 2')
+        self.assertEqual(root.attributes().variables, set(['x']))
+        root.substitute(root[0], tree('y'))
+        self.assertEqual(root.attributes().variables, set(['y']))
+
+    def test_str_cache(self):
+        root = tree('a + b')
+        line = str(root)
+        self.assertEqual(line, 'a + b')
+        self.assertIs(str(root), line)
+
+        root.substitute(root[1], tree('c'))
+        self.assertEqual(str(root), 'a + c')
+
+        negate(root[0], 1)
+        invalidate_path(root, (0,))
+        self.assertEqual(str(root), '-a + c')
+
+        table = InternTable()
+        self.assertEqual(str(table.intern(root, negated=1)), '-(-a + c)')
+
+    def test_str_cache_children(self):
+        root = tree('(a + b)(c + d)')
+        left = str(root[0])
+        self.assertEqual(str(root), '(a + b)(c + d)')
+
+        root.substitute(root[1], tree('e'))
+        self.assertEqual(str(root), '(a + b)e')
+        self.assertIs(root[0].line_cache, left)
+
+    def test_negate_clone_cache(self):
+        root = tree('a + b')
+        str(root)
+        root.attributes()
+        self.assertEqual(str(-root), '-(a + b)')
+        self.assertEqual(str(root.negate(2)), '--(a + b)')
+        self.assertEqual(str(root), 'a + b')
+
+        leaf = tree('a')
+        self.assertEqual(leaf.negate().structure_hash(),
+                         tree('-a').structure_hash())
+
+    def test_clone_cache(self):
+        root = tree('a + b')
+        h = root.structure_hash()
+        self.assertEqual(root.clone().hash_cache, h)
+        self.assertEqual(copy.copy(root).hash_cache, h)
+        self.assertIsNot(copy.copy(root).nodes, root.nodes)
+
+    def test_codec(self):
+        root = tree('-(2x ^ 2.5 + sin(y)) / -x + int_a^b x dx')
+        data = encode_node(root)
+        self.assertEqual(data[:4], 'TRS\x01')
+        self.assertEqual(decode_node(data), root)
+        self.assertEqual(str(decode_node(data)), str(root))
+
+    def test_codec_long_expression(self):
+        root = nary_node(OP_ADD, [L(i) * L('x') for i in xrange(1, 5000)])
+        self.assertEqual(decode_node(encode_node(root)), root)
+
+    def test_codec_invalid(self):
+        data = encode_node(tree('a + 2'))
+        self.assertRaises(ValueError, decode_node, 'XYZ' + data[3:])
+        self.assertRaises(ValueError, decode_node, 'TRS\x00' + data[4:])
+        self.assertRaises(ValueError, decode_node, data[:-1])
+        self.assertRaises(ValueError, decode_node, data + data[-4:])
+
+    def test_line_graph_drawing(self):
+        # Compare the printer with graph_drawing's generate_line() on every
+        # expression that is parsed in the tests
+        pattern = os.path.join(os.path.dirname(__file__), 'test_*.py')
+
+        for name in glob.glob(pattern):
+            for l in open(name):
+                if l.lstrip().startswith('#'):
+                    continue
+
+                for exp in re.findall(r"tree\('([^'\\]*)'\)", l):
+                    root = tree(exp)
+                    self.assertEqual(str(root), generate_line(line_node(root)))
@@ -13,7 +13,14 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from src.parser import Parser, find_possibilities
+import glob
+import os.path
+import re
+import threading
+
+from src.parser import Parser, find_possibilities, keyword_patterns, \
+        insert_multiplications, insert_multiplications_iteratively, \
+        grammar_hash
 from src.node import ExpressionNode as Node, ExpressionLeaf as Leaf, \
         SPECIAL_TOKENS, sin, cos, der, log, ln, integral, int_def, absolute, \
         Scope
@@ -200,7 +207,7 @@ class TestParser(RulesTestCase):
                 [P(root, add_numerics, (Scope(root), l1, l2))])
 
     def test_find_possibilities_duplicates(self):
-        (l1, l2), l3 = root = tree('1 + 2 + 3')
+        l1, l2, l3 = root = tree('1 + 2 + 3')
         self.assertEqual(find_possibilities(root),
                 [P(root, add_numerics, (Scope(root), l1, l2)),
                  P(root, add_numerics, (Scope(root), l1, l3)),
@@ -209,8 +216,107 @@ class TestParser(RulesTestCase):
     def test_no_expression_error(self):
         self.assertRaises(RuntimeError, ParserWrapper(Parser).run, ['', '?'])
 
+    def test_run_all(self):
+        parser = ParserWrapper(Parser)
+        trees, errors = parser.run_all(['a + b', '2 +', '', 'raise', 'c'])
+        self.assertEqual(trees, [tree('a + b'), None, None, None, tree('c')])
+        self.assertEqual([i for i, e in errors], [1, 3])
+        self.assertIsInstance(errors[1][1], RuntimeError)
+        self.assertEqual(parser.root_node, tree('c'))
+
+        self.assertEqual(parser.run_all(iter(['a', 'b'])),
+                         ([tree('a'), tree('b')], []))
+        self.assertRaises(ValueError, parser.run_all, ['a\nb'])
+
+        # The parser can still be used for single expressions afterwards
+        self.assertEqual(parser.run(['d']), tree('d'))
+
+    def test_parsers_in_threads(self):
+        # Bison parsers are serialized by BISON_LOCK, Pratt parsers run
+        # concurrently
+        expressions = ['a + b', 'sin^2 x', '2x ^ 2 - 3', 'int_a^b 2x dx']
+        expected = [tree(exp) for exp in expressions]
+
+        for kwargs in ({}, {'pratt': True}):
+            results = []
+
+            def parse():
+                parser = ParserWrapper(Parser, memoize=True, **kwargs)
+
+                for i in xrange(20):
+                    results.append(parser.run_all(expressions)[0])
+                    parser.find_possibilities()
+
+            threads = [threading.Thread(target=parse) for i in xrange(4)]
+            map(threading.Thread.start, threads)
+            map(threading.Thread.join, threads)
+
+            self.assertEqual(results, [expected] * 80)
+
+    def test_grammar_hash(self):
+        h = grammar_hash(Parser)
+        self.assertEqual(len(h), 40)
+        self.assertEqual(grammar_hash(Parser), h)
+
+        class Reindented(Parser):
+            def on_nary(self, target, option, names, values):
+                """
+                nary    :    exp COMMA exp
+                """
+
+        class Precedences(Parser):
+            precedences = Parser.precedences[1:]
+
+        class Rules(Parser):
+            def on_nary(self, target, option, names, values):
+                """
+                nary : exp COMMA exp
+                     | COMMA exp
+                """
+
+        self.assertEqual(grammar_hash(Reindented), h)
+        self.assertNotEqual(grammar_hash(Precedences), h)
+        self.assertNotEqual(grammar_hash(Rules), h)
+
+    def test_interned_tokens(self):
+        root = tree('sin x * sin x')
+        self.assertIs(root[0].value, root[1].value)
+        self.assertIs(root[0][0].value, root[1][0].value)
+        self.assertNotIn('strdup', Parser.lexscript)
+
     def test_precedence(self):
         self.assertEqual(tree('ab / cd'), tree('a * (b / c) * d'))
 
     def test_pi_multiplication_sign(self):
         self.assertEqual(tree('apia'), tree('a * pi * a'))
+
+    def test_insert_multiplications(self):
+        self.assertEqual(insert_multiplications('2ab(c)'), '2*a*b*(c)')
+        self.assertEqual(insert_multiplications('\x06 x'), '\x06 x')
+        self.assertEqual(insert_multiplications('4 4'), '4*4')
+
+        # Ambiguous whitespace
+        self.assertEqual(insert_multiplications('ya\x0cb'), 'y*a*\x0c*b')
+        self.assertEqual(insert_multiplications('\t0\t\x0b9'),
+                         '\t 0*\t 9')
+
+    def test_insert_multiplications_differential(self):
+        # Compare the single-pass preprocessor to the iterative one, for all
+        # string literals in the tests
+        keywords = keyword_patterns(Parser.words)
+
+        for name in glob.glob(os.path.join(os.path.dirname(__file__), '*.py')):
+            for data in re.findall(r"'([^'\\\n]*)'", open(name).read()):
+                for i, (keyword, pattern) in enumerate(keywords):
+                    data = pattern.sub(chr(i), data)
+
+                self.assertEqual(insert_multiplications(data),
+                                 insert_multiplications_iteratively(data))
+
+    def test_reuse_wrapper(self):
+        parser = ParserWrapper(Parser)
+
+        for i in xrange(3):
+            self.assertEqual(parser.run(['a + %d' % i]), tree('a + %d' % i))
+            self.assertFalse(parser.input_buffer.sources)
+            self.assertIsNone(parser.input_buffer.line)
@@ -14,7 +14,10 @@
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
 import unittest
 
-from src.possibilities import MESSAGES, Possibility as P, flatten_mult
+from src.possibilities import MESSAGES, Possibility as P, flatten_mult, \
+        apply_suggestion, replace_path
+from src.node import Scope
+from src.rules.numerics import add_numerics
 from tests.rulestestcase import tree
 
 from src.parser import Parser
@@ -83,3 +86,75 @@ class TestPossibilities(unittest.TestCase):
     def test_flatten_mult(self):
         self.assertEqual(flatten_mult(tree('2(xx)')), tree('2xx'))
         self.assertEqual(flatten_mult(tree('2(xx) + 1')), tree('2xx + 1'))
+
+    def test_flatten_mult_in_place(self):
+        root = tree('2xx + 1')
+        mult = root[0]
+        self.assertIs(flatten_mult(root)[0], mult)
+
+    def test_args_scope(self):
+        # The scope is stored as-is, so that the possibilities of a node share
+        # the scope of their match context
+        scope = Scope(self.n)
+        p = P(self.n, dummy_handler, (scope, self.l1))
+        self.assertIs(p.args[0], scope)
+
+    def test_apply_suggestion_path(self):
+        root = tree('(2 + 3)(2 + 3)')
+        l2, l3 = second = root[1]
+        p = P(second, add_numerics, (Scope(second), l2, l3), (1,))
+        self.assertEqual(apply_suggestion(root, p), tree('(2 + 3)5'))
+
+    def test_apply_suggestion_caches(self):
+        root = tree('(2 + 3)(2 + 3) + a')
+        first, a = root
+        l2, l3 = second = first[1]
+        h = first[0].structure_hash()
+        root.structure_hash()
+        p = P(second, add_numerics, (Scope(second), l2, l3), (0, 1))
+        root = apply_suggestion(root, p)
+
+        self.assertEqual(first[0].hash_cache, h)
+        self.assertEqual(root.structure_hash(),
+                         tree('(2 + 3)5 + a').structure_hash())
+
+    def test_apply_suggestion_persistent(self):
+        root = tree('(2 + 3)(2 + 3) + a')
+        first, a = root
+        l2, l3 = second = first[1]
+        p = P(second, add_numerics, (Scope(second), l2, l3), (0, 1))
+        result = apply_suggestion(root, p, persistent=True)
+
+        self.assertEqual(result, tree('(2 + 3)5 + a'))
+        self.assertEqual(root, tree('(2 + 3)(2 + 3) + a'))
+        self.assertIs(result[0][0], first[0])
+        self.assertIs(result[1], a)
+
+    def test_apply_suggestion_persistent_scope(self):
+        root = tree('ab + 2 + cd + 3 + e ^ f')
+        ab, l2, cd, l3, ef = Scope(root)
+        p = P(root, add_numerics, (Scope(root), l2, l3), ())
+        result = apply_suggestion(root, p, persistent=True)
+
+        self.assertEqual(result, tree('ab + 5 + cd + e ^ f'))
+        self.assertEqual(root, tree('ab + 2 + cd + 3 + e ^ f'))
+        scope = Scope(result)
+        self.assertIs(scope[0], ab)
+        self.assertIs(scope[2], cd)
+        self.assertIs(scope[3], ef)
+
+    def test_replace_path(self):
+        root = tree('a(b + c)')
+        a, (b, c) = root
+        result = replace_path(root, (1, 0), tree('d'))
+
+        self.assertEqual(result, tree('a(d + c)'))
+        self.assertEqual(root, tree('a(b + c)'))
+        self.assertIs(result[0], a)
+        self.assertIs(result[1][1], c)
+
+    def test_replace_path_flatten_mult(self):
+        root = tree('ab')
+        result = replace_path(root, (1,), tree('cd'))
+        self.assertEqual(result, tree('acd'))
+        self.assertIs(result[0], root[0])
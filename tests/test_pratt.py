@@ -0,0 +1,90 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+import glob
+import os.path
+import re
+
+from src.parser import Parser
+from src.pratt import PrattSyntaxError, tokenize, grammar_rules
+from src.node import sin
+from tests.parser import ParserWrapper
+from tests.rulestestcase import RulesTestCase, tree
+
+
+class TestPratt(RulesTestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(list(tokenize('sin (x) ^ 2\n')),
+                [('FUNCTION_PAREN', 'sin ('), ('IDENTIFIER', 'x'),
+                 ('RPAREN', ')'), ('POW', '^'), ('NUMBER', '2'),
+                 ('NEWLINE', '\n')])
+        self.assertEqual(list(tokenize('d/d*x sqrt pi 2.5')),
+                [('DERIVATIVE', 'd/d*x'), ('FUNCTION', 'sqrt'),
+                 ('IDENTIFIER', 'pi'), ('NUMBER', '2.5')])
+        self.assertEqual(list(tokenize('a ^^ b vv c @@@')),
+                [('IDENTIFIER', 'a'), ('AND', '^^'), ('IDENTIFIER', 'b'),
+                 ('OR', 'vv'), ('IDENTIFIER', 'c'),
+                 ('REWRITE_ALL_VERBOSE', '@@@')])
+
+    def test_tokenize_interned(self):
+        sin1, x1, sin2, x2 = tokenize('sin x sin x')
+        self.assertIs(sin1[1], sin2[1])
+        self.assertIs(x1[1], x2[1])
+
+    def test_grammar_rules(self):
+        rules, prec = grammar_rules(Parser)
+        self.assertEqual(rules['input'], [(), ('input', 'line')])
+        self.assertEqual(rules['unary'][0], ('MINUS', 'exp'))
+        self.assertEqual(prec[('unary', ('MINUS', 'exp'))], 'NEG')
+
+    def test_pratt(self):
+        self.assertEqual(tree('sin^2 x', pratt=True), sin(tree('x')) ** 2)
+        self.assertEqual(tree('a + b * c ^ d', pratt=True),
+                         tree('a + (b * (c ^ d))'))
+        self.assertEqual(tree('a - b - c', pratt=True), tree('(a - b) - c'))
+        self.assertEqual(tree('a ^ b ^ c', pratt=True), tree('a ^ (b ^ c)'))
+
+    def test_conformance(self):
+        # Compare the Pratt parser to the Bison parser, for all expressions
+        # that are parsed in the tests (except for those in comments)
+        for name in glob.glob(os.path.join(os.path.dirname(__file__), '*.py')):
+            for l in open(name):
+                if l.lstrip().startswith('#'):
+                    continue
+
+                for exp in re.findall(r"tree\('([^'\\]*)'\)", l):
+                    expected = tree(exp)
+                    root = tree(exp, pratt=True)
+                    self.assertEqual(root, expected)
+                    self.assertEqual(str(root), str(expected))
+
+    def test_run_all(self):
+        parser = ParserWrapper(Parser, pratt=True)
+        trees, errors = parser.run_all(['a + b', '2 +', 'c'])
+        self.assertEqual(trees, [tree('a + b'), None, tree('c')])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], 1)
+        self.assertIsInstance(errors[0][1], PrattSyntaxError)
+
+    def test_syntax_error(self):
+        parser = ParserWrapper(Parser, pratt=True)
+        self.assertRaises(PrattSyntaxError, parser.run, ['2 +'])
+        self.assertRaises(PrattSyntaxError, parser.run, ['(a'])
+        self.assertRaises(PrattSyntaxError, parser.run, ['a b )'])
+
+    def test_raise(self):
+        parser = ParserWrapper(Parser, pratt=True)
+        self.assertRaises(RuntimeError, parser.run, ['raise'])
+        self.assertRaises(RuntimeError, parser.run, ['', '?'])
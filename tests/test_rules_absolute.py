@@ -41,7 +41,7 @@ class TestRulesAbsolute(RulesTestCase):
                 [P(root, factor_out_abs_term, (Scope(ab), a)),
                  P(root, factor_out_abs_term, (Scope(ab), b))])
 
-        (((a, b), c),) = (abc,) = root = tree('|abc|')
+        ((a, b, c),) = (abc,) = root = tree('|abc|')
         self.assertEqualPos(match_factor_out_abs_term(root),
                 [P(root, factor_out_abs_term, (Scope(abc), a)),
                  P(root, factor_out_abs_term, (Scope(abc), b)),
@@ -76,15 +76,15 @@ class TestRulesAbsolute(RulesTestCase):
 
     def test_factor_out_abs_term(self):
         root, expect = tree('|abc|, |a||bc|')
-        (((a, b), c),) = (abc,) = root
+        ((a, b, c),) = (abc,) = root
         self.assertEqual(factor_out_abs_term(root, (Scope(abc), a)), expect)
 
         root, expect = tree('|abc|, |b||ac|')
-        (((a, b), c),) = (abc,) = root
+        ((a, b, c),) = (abc,) = root
         self.assertEqual(factor_out_abs_term(root, (Scope(abc), b)), expect)
 
         root, expect = tree('-|abc|, -|a||bc|')
-        (((a, b), c),) = (abc,) = root
+        ((a, b, c),) = (abc,) = root
         self.assertEqual(factor_out_abs_term(root, (Scope(abc), a)), expect)
 
     def test_factor_out_abs_sqrt(self):
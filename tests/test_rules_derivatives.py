@@ -72,7 +72,7 @@ class TestRulesDerivatives(RulesTestCase):
 
     def test_match_const_deriv_multiplication_multiple_constants(self):
         root = tree('d/dx 2x * 3')
-        (l2, x), l3 = root[0]
+        l2, x, l3 = root[0]
         scope = Scope(root[0])
         self.assertEqualPos(match_const_deriv_multiplication(root),
                 [P(root, const_deriv_multiplication, (scope, l2, x)),
@@ -246,7 +246,7 @@ class TestRulesDerivatives(RulesTestCase):
         self.assertEqual(sum_rule(root, (Scope(f), x)), der(x) + der(x2))
 
         root = tree('(x ^ 2 + 3 + x)\'')
-        (x2, l3), x = f = root[0]
+        x2, l3, x = f = root[0]
         self.assertEqual(sum_rule(root, (Scope(f), x2)), der(x2) + der(l3 + x))
         self.assertEqual(sum_rule(root, (Scope(f), x)), der(x) + der(x2 + l3))
 
@@ -259,7 +259,7 @@ class TestRulesDerivatives(RulesTestCase):
                          der(x) * x2 + x * der(x2))
 
         root = tree('(x ^ 2 * x * x ^ 3)\'')
-        (x2, x), x3 = f = root[0]
+        x2, x, x3 = f = root[0]
         self.assertEqual(product_rule(root, (Scope(f), x2)),
                          der(x2) * (x * x3) + x2 * der(x * x3))
         self.assertEqual(product_rule(root, (Scope(f), x)),
@@ -41,7 +41,7 @@ class TestRulesFactors(RulesTestCase):
         self.assertEqualPos(match_expand(root),
                 [P(root, expand_double, (Scope(root), ab, cd))])
 
-        (ab, cd), e = root = tree('(a + b)(c + d)e')
+        ab, cd, e = root = tree('(a + b)(c + d)e')
         self.assertEqualPos(match_expand(root),
                 [P(root, expand_double, (Scope(root), ab, cd)),
                  P(root, expand_single, (Scope(root), cd, e)),
@@ -54,7 +54,7 @@ class TestRulesFactors(RulesTestCase):
                               expect)
 
         root, expect = tree('a(b+c)d, a(bd + cd)')
-        (a, bc), d = root
+        a, bc, d = root
         self.assertEqualNodes(expand_single(root, (Scope(root), bc, d)),
                               expect)
 
@@ -67,6 +67,6 @@ class TestRulesFactors(RulesTestCase):
                               expect)
 
         root, expect = tree('a(a + b)b(c + d)c, a(ac + ad + bc + bd)bc')
-        (((a, ab), b), cd), c = root
+        a, ab, b, cd, c = root
         self.assertEqualNodes(expand_double(root, (Scope(root), ab, cd)),
                               expect)
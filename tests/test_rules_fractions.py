@@ -76,7 +76,7 @@ class TestRulesFractions(RulesTestCase):
                 [P(root, equalize_denominators, (Scope(root), n0, n1, 4)),
                  P(root, equalize_denominators, (Scope(root), n0, n1, 8))])
 
-        (((n0, n1), n2), n3), n4 = root = a + l1 / l2 + b + l3 / l4 + c
+        n0, n1, n2, n3, n4 = root = a + l1 / l2 + b + l3 / l4 + c
         possibilities = match_add_fractions(root)
         self.assertEqualPos(possibilities,
                 [P(root, equalize_denominators, (Scope(root), n1, n3, 4)),
@@ -87,7 +87,7 @@ class TestRulesFractions(RulesTestCase):
         self.assertEqualPos(possibilities,
                 [P(root, add_nominators, (Scope(root), n0, n1))])
 
-        (((n0, n1), n2), n3), n4 = root = a + l2 / l4 + b + l3 / l4 + c
+        n0, n1, n2, n3, n4 = root = a + l2 / l4 + b + l3 / l4 + c
         possibilities = match_add_fractions(root)
         self.assertEqualPos(possibilities,
                 [P(root, add_nominators, (Scope(root), n1, n3))])
@@ -100,7 +100,7 @@ class TestRulesFractions(RulesTestCase):
     def test_add_fractions_with_negation(self):
         a, b, c, l1, l2, l3, l4 = tree('a,b,c,1,2,3,4')
 
-        (((n0, n1), n2), n3), n4 = root = a + l2 / l2 + b + (-l3 / l4) + c
+        n0, n1, n2, n3, n4 = root = a + l2 / l2 + b + (-l3 / l4) + c
         self.assertEqualPos(match_add_fractions(root),
                 [P(root, equalize_denominators, (Scope(root), n1, n3, 4)),
                  P(root, equalize_denominators, (Scope(root), n1, n3, 8))])
@@ -109,7 +109,7 @@ class TestRulesFractions(RulesTestCase):
         self.assertEqualPos(match_add_fractions(root),
                 [P(root, equalize_denominators, (Scope(root), n0, n1, 6))])
 
-        (((n0, n1), n2), n3), n4 = root = a + l2 / l4 + b + (-l3 / l4) + c
+        n0, n1, n2, n3, n4 = root = a + l2 / l4 + b + (-l3 / l4) + c
         self.assertEqualPos(match_add_fractions(root),
                 [P(root, add_nominators, (Scope(root), n1, n3))])
 
@@ -167,7 +167,7 @@ class TestRulesFractions(RulesTestCase):
         self.assertEqualPos(match_multiply_fractions(root),
                 [P(root, multiply_fractions, (Scope(root), ab, cd))])
 
-        (ab, e), cd = root = tree('4 / b * 2 * (3 / d)')
+        ab, e, cd = root = tree('4 / b * 2 * (3 / d)')
         self.assertEqualPos(match_multiply_fractions(root),
                 [P(root, multiply_fractions, (Scope(root), ab, cd)),
                  P(root, multiply_with_fraction, (Scope(root), ab, e)),
@@ -182,7 +182,7 @@ class TestRulesFractions(RulesTestCase):
         self.assertEqual(multiply_fractions(root, (Scope(root), ab, cd)),
                          a * c / (b * d))
 
-        (ab, e), cd = root = tree('a / b * e * (c / d)')
+        ab, e, cd = root = tree('a / b * e * (c / d)')
         self.assertEqual(multiply_fractions(root, (Scope(root), ab, cd)),
                          a * c / (b * d) * e)
 
@@ -313,7 +313,7 @@ class TestRulesFractions(RulesTestCase):
         self.assertEqualPos(match_division_in_denominator(root),
                 [P(root, multiply_with_term, (c,))])
 
-        a, ((d, (b, c)), e) = root = tree('a / (d + b / c + e)')
+        a, (d, (b, c), e) = root = tree('a / (d + b / c + e)')
         self.assertEqualPos(match_division_in_denominator(root),
                 [P(root, multiply_with_term, (c,))])
 
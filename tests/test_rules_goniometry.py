@@ -38,11 +38,11 @@ class TestRulesGoniometry(RulesTestCase):
         self.assertEqualPos(match_add_quadrants(root),
                 [P(root, add_quadrants, (Scope(root), s, c))])
 
-        (s, a), c = root = tree('sin^2 t + a + cos^2 t')
+        s, a, c = root = tree('sin^2 t + a + cos^2 t')
         self.assertEqualPos(match_add_quadrants(root),
                 [P(root, add_quadrants, (Scope(root), s, c))])
 
-        (s, c0), c1 = root = tree('sin^2 t + cos^2 t + cos^2 t')
+        s, c0, c1 = root = tree('sin^2 t + cos^2 t + cos^2 t')
         self.assertEqualPos(match_add_quadrants(root),
                 [P(root, add_quadrants, (Scope(root), s, c0)),
                  P(root, add_quadrants, (Scope(root), s, c1))])
@@ -62,7 +62,7 @@ class TestRulesGoniometry(RulesTestCase):
         self.assertEqual(add_quadrants(root, (Scope(root), s, c)), 1)
 
         root, expect = tree('cos(t) ^ 2 + a + sin(t) ^ 2, a + 1')
-        (c, a), s = root
+        c, a, s = root
         self.assertEqual(add_quadrants(root, (Scope(root), s, c)), expect)
 
     def test_factor_out_quadrant_negation(self):
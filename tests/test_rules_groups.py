@@ -49,7 +49,7 @@ class TestRulesGroups(RulesTestCase):
                                                        l2, a1, mul))])
 
     def test_match_combine_groups_two_const(self):
-        ((l2, a0), b), (l3, a1) = (m0, b), m1 = root = tree('2a + b + 3a')
+        (l2, a0), b, (l3, a1) = m0, b, m1 = root = tree('2a + b + 3a')
 
         possibilities = match_combine_groups(root)
         self.assertEqualPos(possibilities,
@@ -57,7 +57,7 @@ class TestRulesGroups(RulesTestCase):
                                                        l3, a1, m1))])
 
     def test_match_combine_groups_n_const(self):
-        ((l2, a0), (l3, a1)), (l4, a2) = (m0, m1), m2 = root = tree('2a+3a+4a')
+        (l2, a0), (l3, a1), (l4, a2) = m0, m1, m2 = root = tree('2a+3a+4a')
 
         possibilities = match_combine_groups(root)
         self.assertEqualPos(possibilities,
@@ -80,7 +80,7 @@ class TestRulesGroups(RulesTestCase):
     def test_match_combine_groups_identifier_group_single_const(self):
         root, l1 = tree('ab + 2ab,1')
         m0, m1 = root
-        (l2, a), b = m1
+        l2, a, b = m1
 
         possibilities = match_combine_groups(root)
         self.assertEqualPos(possibilities,
@@ -107,8 +107,7 @@ class TestRulesGroups(RulesTestCase):
 
     def test_combine_groups_nary(self):
         root, l1 = tree('ab + b + ba,1')
-        abb, ba = root
-        ab, b = abb
+        ab, b, ba = root
         self.assertEqualNodes(combine_groups(root,
                               (Scope(root), l1, ab, ab, l1, ba, ba)),
                               (l1 + 1) * ab + b)
@@ -181,14 +181,14 @@ class TestRulesIntegrals(RulesTestCase):
         self.assertEqualPos(match_sum_rule_integral(root),
                 [P(root, sum_rule_integral, (Scope(root[0]), f))])
 
-        ((f, g), h), x = root = tree('int (2x + 3x + 4x) dx')
+        (f, g, h), x = root = tree('int (2x + 3x + 4x) dx')
         self.assertEqualPos(match_sum_rule_integral(root),
                 [P(root, sum_rule_integral, (Scope(root[0]), f)),
                  P(root, sum_rule_integral, (Scope(root[0]), g)),
                  P(root, sum_rule_integral, (Scope(root[0]), h))])
 
     def test_sum_rule_integral(self):
-        ((f, g), h), x = root = tree('int (2x + 3x + 4x) dx')
+        (f, g, h), x = root = tree('int (2x + 3x + 4x) dx')
         self.assertEqual(sum_rule_integral(root, (Scope(root[0]), f)),
                          tree('int 2x dx + int (3x + 4x) dx'))
         self.assertEqual(sum_rule_integral(root, (Scope(root[0]), g)),
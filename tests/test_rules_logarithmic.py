@@ -208,7 +208,7 @@ class TestRulesLogarithmic(RulesTestCase):
         self.assertEqualPos(match_factor_in_multiplicant(root),
                 [P(root, factor_in_multiplicant, (Scope(root), l2, log_3))])
 
-        (l2, log_3), l4 = root = tree('2log(3)4')
+        l2, log_3, l4 = root = tree('2log(3)4')
         self.assertEqualPos(match_factor_in_multiplicant(root),
                 [P(root, factor_in_multiplicant, (Scope(root), l2, log_3)),
                  P(root, factor_in_multiplicant, (Scope(root), l4, log_3))])
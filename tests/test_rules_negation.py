@@ -28,7 +28,7 @@ class TestRulesNegation(RulesTestCase):
         self.assertEqualPos(match_negated_factor(root),
                 [P(root, negated_factor, (Scope(root), b))])
 
-        (a, b), c = root = tree('a * (-b) * -c')
+        a, b, c = root = tree('a * (-b) * -c')
         scope = Scope(root)
         self.assertEqualPos(match_negated_factor(root),
                 [P(root, negated_factor, (scope, b)),
@@ -38,7 +38,7 @@ class TestRulesNegation(RulesTestCase):
         a, b = root = tree('a * -b')
         self.assertEqual(negated_factor(root, (Scope(root), b)), -(a * +b))
 
-        (a, b), c = root = tree('a * (-b) * -c')
+        a, b, c = root = tree('a * (-b) * -c')
         self.assertEqual(negated_factor(root, (Scope(root), b)), -(a * +b * c))
         self.assertEqual(negated_factor(root, (Scope(root), c)), -(a * b * +c))
 
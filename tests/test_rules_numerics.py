@@ -29,7 +29,7 @@ class TestRulesNumerics(RulesTestCase):
         self.assertEqualPos(possibilities,
                 [P(root, add_numerics, (Scope(root), l1, l2))])
 
-        (l1, b), l2 = root = tree('1 + b + 2')
+        l1, b, l2 = root = tree('1 + b + 2')
         possibilities = match_add_numerics(root)
         self.assertEqualPos(possibilities,
                 [P(root, add_numerics, (Scope(root), l1, l2))])
@@ -38,7 +38,7 @@ class TestRulesNumerics(RulesTestCase):
         l1, l2 = root = tree('1 + 2')
         self.assertEqual(add_numerics(root, (Scope(root), l1, l2)), 3)
 
-        (l1, a), l2 = root = tree('1 + a + 2')
+        l1, a, l2 = root = tree('1 + a + 2')
         self.assertEqual(add_numerics(root, (Scope(root), l1, l2)), L(3) + a)
 
     def test_add_numerics_negations(self):
@@ -130,7 +130,7 @@ class TestRulesNumerics(RulesTestCase):
         self.assertEqual(match_multiply_numerics(root),
                 [P(root, multiply_one, (Scope(root), l1))])
 
-        (x, l1), x = root = tree('x * 1x')
+        x, l1, x = root = tree('x * 1x')
         self.assertEqual(match_multiply_numerics(root),
                 [P(root, multiply_one, (Scope(root), l1))])
 
@@ -146,7 +146,7 @@ class TestRulesNumerics(RulesTestCase):
         f3, f2 = root = tree('3.0 * 2.0')
         self.assertEqual(multiply_numerics(root, (Scope(root), f3, f2)), 6.0)
 
-        ((a, i3), i2), b = root = tree('a * 3 * 2 * b')
+        a, i3, i2, b = root = tree('a * 3 * 2 * b')
         self.assertEqualNodes(multiply_numerics(root,
                               (Scope(root), i3, i2)), a * 6 * b)
 
@@ -162,7 +162,7 @@ class TestRulesNumerics(RulesTestCase):
                                                       l2_neg, l3)), -l6)
 
         root, l30 = tree('-5 * x ^ 2 - -15x - 5 * 6,30')
-        rest, mul = root
+        x2, x, mul = root
         l5_neg, l6 = mul
         self.assertEqualNodes(multiply_numerics(mul, (Scope(mul),
                                                       l5_neg, l6)), -l30)
@@ -0,0 +1,82 @@
+# This file is part of TRS (http://math.kompiler.org)
+#
+# TRS is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# TRS is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with TRS.  If not, see <http://www.gnu.org/licenses/>.
+from src.rules.patterns import pattern_symbols, Rule, DiscriminationNet, \
+        WILDCARD
+from src.node import OP_ADD, OP_POW
+from src.possibilities import Possibility as P
+from tests.rulestestcase import RulesTestCase, tree
+
+
+def h0(root, args):  # pragma: nocover
+    pass
+
+
+def h1(root, args):  # pragma: nocover
+    pass
+
+
+class TestRulesPatterns(RulesTestCase):
+
+    def test_pattern_symbols(self):
+        ((a, b), c), d = root = tree('(a + b) ^ c + d')
+        self.assertEqual(pattern_symbols(root),
+                ([(OP_ADD, 2), (OP_POW, 2), (OP_ADD, 2), WILDCARD, WILDCARD,
+                  WILDCARD, WILDCARD], [a, b, c, d]))
+
+        self.assertRaises(ValueError, pattern_symbols, tree('a + -b'))
+
+    def test_rule_bind(self):
+        rule = Rule(lambda a, b: a + b * a, h0)
+        x, y = tree('x, y')
+        self.assertEqual(rule.bind([x, y, x]), {'a': x, 'b': y})
+        self.assertIsNone(rule.bind([x, y, y]))
+        self.assertIsNone(rule.bind([x, y, -x]))
+
+        rule = Rule(lambda a: a ** 2, h0)
+        self.assertEqual(rule.bind([x, tree('2')]), {'a': x})
+        self.assertIsNone(rule.bind([x, tree('3')]))
+
+    def test_discrimination_net(self):
+        net = DiscriminationNet(Rule(lambda a, b: a + b, h0),
+                                Rule(lambda a, b, c: a + b * c, h1,
+                                     args=lambda node, a, b, c: (b, c)))
+
+        root = tree('x + y')
+        self.assertEqualPos(net(root), [P(root, h0)])
+
+        y, z = tree('y, z')
+        root = tree('x + yz')
+        self.assertEqualPos(net(root), [P(root, h0), P(root, h1, (y, z))])
+
+        self.assertEqual(net(tree('xy')), [])
+        self.assertEqual(net.handlers, set([h0, h1]))
+
+    def test_discrimination_net_condition(self):
+        net = DiscriminationNet(
+                Rule(lambda a, b: a + b, h0,
+                     condition=lambda node, a, b: not b.negated))
+
+        root = tree('x + y')
+        self.assertEqualPos(net(root), [P(root, h0)])
+        self.assertEqual(net(tree('x - y')), [])
+
+    def test_discrimination_net_combine(self):
+        first = DiscriminationNet(Rule(lambda a, b: a * b + a, h1))
+        second = DiscriminationNet(Rule(lambda a, b: a + b, h0))
+        net = DiscriminationNet(first, second)
+        self.assertEqual(net.rules, first.rules + second.rules)
+
+        root = tree('xy + x')
+        self.assertEqualPos(net(root), [P(root, h1), P(root, h0)])
@@ -37,7 +37,7 @@ class TestRulesPowers(RulesTestCase):
 
     def test_match_add_exponents_ternary(self):
         a, p, q, r = tree('a,p,q,r')
-        (n0, n1), n2 = root = a ** p * a ** q * a ** r
+        n0, n1, n2 = root = a ** p * a ** q * a ** r
 
         possibilities = match_add_exponents(root)
         self.assertEqualPos(possibilities,
@@ -47,7 +47,7 @@ class TestRulesPowers(RulesTestCase):
 
     def test_match_add_exponents_multiple_identifiers(self):
         a, b, p, q = tree('a,b,p,q')
-        ((a0, b0), a1), b1 = root = a ** p * b ** p * a ** q * b ** q
+        a0, b0, a1, b1 = root = a ** p * b ** p * a ** q * b ** q
 
         possibilities = match_add_exponents(root)
         self.assertEqualPos(possibilities,
@@ -56,7 +56,7 @@ class TestRulesPowers(RulesTestCase):
 
     def test_match_add_exponents_nary_multiplication(self):
         a, p, q = tree('a,p,q')
-        (n0, l1), n1 = root = a ** p * 2 * a ** q
+        n0, l1, n1 = root = a ** p * 2 * a ** q
 
         possibilities = match_add_exponents(root)
         self.assertEqualPos(possibilities,
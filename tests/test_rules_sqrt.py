@@ -70,7 +70,7 @@ class TestRulesSqrt(RulesTestCase):
                 [P(root, extract_sqrt_multiplicant, (Scope(root[0]), l2)),
                  P(root, extract_sqrt_multiplicant, (Scope(root[0]), x))])
 
-        (((l2, x), y),) = root = tree('sqrt(2xy)')
+        ((l2, x, y),) = root = tree('sqrt(2xy)')
         self.assertEqualPos(match_reduce_sqrt(root),
                 [P(root, extract_sqrt_multiplicant, (Scope(root[0]), l2)),
                  P(root, extract_sqrt_multiplicant, (Scope(root[0]), x)),
@@ -103,7 +103,7 @@ class TestRulesSqrt(RulesTestCase):
                          expect)
 
         root, expect = tree('sqrt(2xy), sqrt(x)sqrt(2y)')
-        (l2, x), y = mul = root[0]
+        l2, x, y = mul = root[0]
         self.assertEqual(extract_sqrt_multiplicant(root, (Scope(mul), x,)),
                          expect)
 
@@ -16,7 +16,10 @@ from src.rules import utils
 from src.rules.utils import least_common_multiple, is_fraction, partition, \
         find_variables, first_sorted_variable, find_variable, substitute, \
         divides, dividers, is_prime, prime_dividers, evals_to_numeric, \
-        iter_pairs, range_except
+        iter_pairs, range_except, MatchContext, REQUIREMENTS, \
+        meets_requirements
+from src.node import ExpressionNode as N, Scope, FEATURE_NUMERIC, \
+        FEATURE_IDENTIFIER, FEATURE_NEGATED, OP_ADD, sin
 from tests.rulestestcase import tree, RulesTestCase
 
 
@@ -50,6 +53,7 @@ class TestRulesUtils(RulesTestCase):
         self.assertSetEqual(find_variables(add), set(['x']))
         self.assertSetEqual(find_variables(mul0), set(['x']))
         self.assertSetEqual(find_variables(mul1), set(['x', 'y']))
+        self.assertSetEqual(find_variables(N(OP_ADD, 'x', 2)), set(['x']))
 
     def test_first_sorted_variable(self):
         self.assertEqual(first_sorted_variable(set('ax')), 'x')
@@ -117,6 +121,8 @@ class TestRulesUtils(RulesTestCase):
         self.assertFalse(evals_to_numeric(tree('1 + a')))
         self.assertTrue(evals_to_numeric(tree('1 + 2 / 2 * 9')))
         self.assertFalse(evals_to_numeric(tree('int 1')))
+        self.assertTrue(evals_to_numeric(N(OP_ADD, 1, 2)))
+        self.assertFalse(evals_to_numeric(sin(2)))
         self.assertFalse(evals_to_numeric(tree('int a')))
         self.assertTrue(evals_to_numeric(tree('sqrt 1')))
 
@@ -130,3 +136,29 @@ class TestRulesUtils(RulesTestCase):
         self.assertEqual(range_except(0, 5, 2), [0, 1, 3, 4])
         self.assertEqual(range_except(0, 4, 0), [1, 2, 3])
         self.assertEqual(range_except(0, 3, 3), [0, 1, 2])
+
+    def test_match_context(self):
+        root = tree('1 + a / b + c ^ 2 + log(2) + 3 + d')
+        l1, ab, c2, log2, l3, d = root
+        context = MatchContext(root)
+
+        self.assertEqual(context.scope, Scope(root))
+        self.assertEqual(context.numerics, [l1, l3])
+        self.assertEqual(context.fractions, [ab])
+        self.assertEqual(context.powers, [c2])
+        self.assertEqual(context.logarithms, [log2])
+
+    def test_meets_requirements(self):
+        match = lambda node: []
+        self.assertTrue(meets_requirements(match, 0))
+
+        REQUIREMENTS[match] = [FEATURE_NUMERIC | FEATURE_IDENTIFIER,
+                               FEATURE_NEGATED]
+
+        try:
+            features = FEATURE_NUMERIC | FEATURE_NEGATED
+            self.assertTrue(meets_requirements(match, features))
+            self.assertFalse(meets_requirements(match, FEATURE_NUMERIC))
+            self.assertFalse(meets_requirements(match, FEATURE_NEGATED))
+        finally:
+            del REQUIREMENTS[match]
@@ -12,18 +12,230 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with TRS.  If not, see <http://www.gnu.org/licenses/>.
-from src.rules.factors import expand_double, expand_single
-from src.node import Scope
-from src.possibilities import Possibility as P
-from src.strategy import find_possibilities
+import glob
+import os.path
+import re
+
+from src.rules.factors import expand_double, expand_single, match_expand
+from src.rules.powers import subtract_exponents, match_subtract_exponents
+from src.rules.logarithmic import raised_base, factor_out_exponent
+from src.rules.derivatives import chain_rule
+from src.node import Scope, ExpressionLeaf as L, OP_ADD, nary_node
+from src.possibilities import Possibility as P, apply_suggestion
+from src.strategy import find_possibilities, find_hint, PossibilityCache, \
+        MATCH_HANDLERS, compile_precedences, find_cycle, PossibilityMemo, \
+        node_indices, preorder_nodes, has_overrides
 from tests.rulestestcase import RulesTestCase, tree
 
 
+def h0(root, args):  # pragma: nocover
+    pass
+
+
+def h1(root, args):  # pragma: nocover
+    pass
+
+
+def h2(root, args):  # pragma: nocover
+    pass
+
+
+def h3(root, args):  # pragma: nocover
+    pass
+
+
 class TestStrategy(RulesTestCase):
 
     def test_find_possibilities_sort(self):
-        (ab, cd), e = root = tree('(a + b)(c + d)e')
+        ab, cd, e = root = tree('(a + b)(c + d)e')
         self.assertEqualPos(find_possibilities(root),
                 [P(root, expand_single, (Scope(root), cd, e)),
                  P(root, expand_single, (Scope(root), ab, e)),
                  P(root, expand_double, (Scope(root), ab, cd))])
+
+    def test_find_possibilities_cache(self):
+        root = tree('(a + b)(c + d)e + 2 + 3')
+        cache = PossibilityCache()
+        possibilities = find_possibilities(root, cache=cache)
+        self.assertEqual(possibilities, find_possibilities(root))
+
+        # Unchanged subtrees reuse their cached possibilities
+        self.assertEqual(find_possibilities(root, cache=cache), possibilities)
+
+    def test_find_possibilities_cache_rewrite(self):
+        root = tree('(a + b)(c + d)e + 2 + 3')
+        cache = PossibilityCache()
+
+        for i in range(5):
+            possibilities = find_possibilities(root, cache=cache)
+            self.assertEqual(map(repr, possibilities),
+                             map(repr, find_possibilities(root)))
+
+            if not possibilities:
+                break
+
+            root = apply_suggestion(root, possibilities[0])
+            cache.invalidate(possibilities[0].root)
+
+    def test_node_indices(self):
+        root = tree('(2 + 3)(2 + 3)(2 - 3)')
+        l, r, n = root
+        indices = node_indices(root, set([id(r), id(n[1])]))
+        self.assertEqual(indices, {id(r): 4, id(n[1]): 9})
+        self.assertIs(preorder_nodes(root, 10)[indices[id(r)]], r)
+        self.assertEqual(len(preorder_nodes(root, 6)), 6)
+
+    def test_find_possibilities_memo(self):
+        root = tree('(2 + 3)(2 + 3)')
+        memo = PossibilityMemo()
+
+        # The second addition is bound to the template of the first one
+        self.assertEqual(find_possibilities(root, memo=memo),
+                         find_possibilities(root))
+        self.assertEqual((memo.hits, memo.misses), (1, 2))
+        self.assertEqual(len(memo), 2)
+
+        self.assertEqual(find_possibilities(root, memo=memo),
+                         find_possibilities(root))
+        self.assertEqual((memo.hits, memo.misses), (4, 2))
+
+    def test_find_possibilities_memo_modified(self):
+        root = tree('2 + 3')
+        memo = PossibilityMemo()
+        find_possibilities(root, memo=memo)
+
+        # The entry of the modified node has the hash of the original node
+        root[1] = tree('4')
+        root = tree('2 + 3')
+        self.assertEqual(find_possibilities(root, memo=memo),
+                         find_possibilities(root))
+        self.assertEqual((memo.hits, memo.misses), (0, 2))
+
+    def test_find_possibilities_memo_long_sum(self):
+        root = nary_node(OP_ADD, [L('x%d' % i) for i in xrange(1000)])
+        memo = PossibilityMemo()
+
+        for i in xrange(2):
+            self.assertEqual(find_possibilities(root, memo=memo),
+                             find_possibilities(root))
+
+        self.assertEqual((memo.hits, memo.misses), (1, 1))
+
+    def test_possibility_memo_evict(self):
+        memo = PossibilityMemo(size=2)
+        find_possibilities(tree('(2 + 3)(4 + 5)'), memo=memo)
+        self.assertEqual(len(memo), 2)
+        self.assertEqual((memo.hits, memo.misses), (0, 3))
+
+        memo.resize(1)
+        self.assertEqual(len(memo), 1)
+
+        memo.clear()
+        self.assertEqual(len(memo), 0)
+        self.assertEqual((memo.hits, memo.misses), (0, 0))
+
+    def test_match_handlers(self):
+        self.assertEqual(MATCH_HANDLERS[match_expand],
+                         set([expand_single, expand_double]))
+        self.assertEqual(MATCH_HANDLERS[match_subtract_exponents],
+                         set([subtract_exponents]))
+
+    def test_find_hint(self):
+        ab, cd, e = root = tree('(a + b)(c + d)e')
+        self.assertEqual(find_hint(root),
+                         P(root, expand_single, (Scope(root), cd, e)))
+
+    def test_find_hint_first_possibility(self):
+        for exp in ['(a + b)(c + d)e + 2 + 3', '2x + 3x + x ^ 2 / x',
+                    '1 / 2 + 3 / 4 + sin(x) ^ 2', '-(3a + 6b)']:
+            root = tree(exp)
+            self.assertEqual(find_hint(root), find_possibilities(root)[0])
+
+    def test_find_hint_rules(self):
+        # Compare the hint to the first possibility for all expressions that
+        # are parsed in the rule tests. Match functions must not modify the
+        # expression, since the hint search skips some of them.
+        pattern = os.path.join(os.path.dirname(__file__), 'test_rules_*.py')
+
+        for name in glob.glob(pattern):
+            for l in open(name):
+                if l.lstrip().startswith('#'):
+                    continue
+
+                for exp in re.findall(r"tree\('([^'\\]*)'\)", l):
+                    root = tree(exp)
+
+                    try:
+                        possibilities = find_possibilities(root)
+                    except ValueError:
+                        continue
+
+                    self.assertEqual(root, tree(exp))
+                    hint = find_hint(tree(exp))
+
+                    if possibilities:
+                        self.assertEqual((hint.handler, hint.path),
+                                         (possibilities[0].handler,
+                                          possibilities[0].path))
+                    else:
+                        self.assertIsNone(hint)
+
+    def test_find_cycle(self):
+        self.assertIsNone(find_cycle({1: [2, 3], 2: [3]}))
+        self.assertEqual(find_cycle({1: [2], 2: [3], 3: [1]}), [1, 2, 3, 1])
+
+    def test_compile_precedences(self):
+        ranks, default, overrides = compile_precedences([h0, h1], [h2], [])
+        self.assertEqual(ranks, {h0: 0, h1: 1, h2: 3})
+        self.assertEqual(default, 2)
+        self.assertEqual(overrides, {})
+
+    def test_compile_precedences_relative(self):
+        # Relative precedences do not change the ranks, they only override
+        # them for their own handlers
+        ranks, default, overrides = compile_precedences([h0, h1], [],
+                                                        [(h3, h1), (h1, h2)])
+        self.assertEqual(ranks, {h0: 0, h1: 1})
+        self.assertEqual(overrides, {(h3, h1): -1, (h1, h3): 1})
+
+        # All pairs in a relative precedence are ordered
+        ranks, default, overrides = compile_precedences([], [],
+                                                        [(h1, h2, h3)])
+        self.assertEqual(overrides[(h1, h3)], -1)
+        self.assertEqual(len(overrides), 6)
+
+    def test_compile_precedences_duplicate(self):
+        self.assertRaises(ValueError, compile_precedences, [h0], [h0], [])
+
+    def test_compile_precedences_cycle(self):
+        self.assertRaises(ValueError, compile_precedences, [], [],
+                          [(h0, h1), (h1, h2, h0)])
+
+    def test_has_overrides(self):
+        self.assertTrue(has_overrides(set([chain_rule, raised_base])))
+        self.assertFalse(has_overrides(set([raised_base,
+                                            factor_out_exponent])))
+        self.assertFalse(has_overrides(set([chain_rule])))
+
+    def test_relative_precedence(self):
+        # The override chain_rule > raised_base is not transitive, raised_base
+        # still precedes the factor_out_exponent possibilities which have no
+        # precedence with respect to chain_rule
+        root = tree('e ^ (ln(x ^ x))[ln(x ^ x)]\'')
+        self.assertEqual(find_possibilities(root)[0].handler, raised_base)
+        self.assertEqual(find_hint(root).handler, raised_base)
+
+    def test_find_possibilities_paths(self):
+        root = tree('(2 + 3)(2 + 3)')
+
+        possibilities = find_possibilities(root)
+        self.assertEqual(set(pos.path for pos in possibilities),
+                         set([(0,), (1,)]))
+
+        for pos in possibilities:
+            node = root
+
+            for i in pos.path:
+                node = node[i]
+
+            self.assertIs(node, pos.root)